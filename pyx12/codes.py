@@ -14,17 +14,128 @@ External Codes interface
 
 import os.path
 import logging
+import threading
 from pkg_resources import resource_stream
 import xml.etree.cElementTree as et
 
 # Intrapackage imports
 from pyx12.errors import EngineError
 
+_stores = {}
+_stores_lock = threading.Lock()
+
 
 class CodesError(Exception):
     """Class for code modules errors."""
 
 
+def get_codeset_store(base_path=None):
+    """
+    Get the code set store shared by all users of a codes.xml file
+
+    @param base_path: Override directory containing codes.xml.  If None,
+        uses package resource folder
+    @type base_path: string
+    @rtype: L{codes.CodeSetStore}
+    """
+    with _stores_lock:
+        try:
+            return _stores[base_path]
+        except KeyError:
+            return _stores.setdefault(base_path, CodeSetStore(base_path))
+
+
+def clear_codeset_stores():
+    """
+    Forget the shared code set stores.  ExternalCodes instances already
+    created keep their store.
+    """
+    with _stores_lock:
+        _stores.clear()
+
+
+class CodeSetStore(object):
+    """
+    The code sets of one codes.xml file.  Each code set is read from the
+    file the first time it is requested and kept as a frozenset.
+    """
+
+    def __init__(self, base_path=None):
+        """
+        @param base_path: Override directory containing codes.xml.  If None,
+            uses package resource folder
+        @type base_path: string
+
+        @note: self.codesets - map of the code set id to the code set, or to
+        None if the code set is not defined
+        {codeset_id: {'name': name, 'dataele': data_ele, 'codes': frozenset}}
+        """
+        self.base_path = base_path
+        self.lock = threading.Lock()
+        self.codesets = {}
+        self.all_loaded = False
+
+    def _open(self):
+        logger = logging.getLogger('pyx12')
+        codes_file = 'codes.xml'
+        if self.base_path is not None:
+            logger.debug("Looking for codes file '{}' in map_path '{}'".format(codes_file, self.base_path))
+            return open(os.path.join(self.base_path, codes_file), 'rb')
+        else:
+            logger.debug("Looking for codes file '{}' in pkg_resources".format(codes_file))
+            return resource_stream(__name__, os.path.join('map', codes_file))
+
+    def _read(self, codeset_id=None):
+        """
+        Read code sets from the file.  If codeset_id is given, stop once it
+        has been read.
+        """
+        code_fd = self._open()
+        try:
+            for (event, cElem) in et.iterparse(code_fd):
+                if cElem.tag != 'codeset':
+                    continue
+                cur_id = cElem.findtext('id')
+                if cur_id not in self.codesets:
+                    self.codesets[cur_id] = {
+                        'name': cElem.findtext('name'),
+                        'dataele': cElem.findtext('data_ele'),
+                        'codes': frozenset([code.text for code in cElem.iterfind('version/code')])}
+                cElem.clear()
+                if codeset_id is not None and cur_id == codeset_id:
+                    return
+            self.all_loaded = True
+        finally:
+            code_fd.close()
+
+    def get(self, codeset_id):
+        """
+        @param codeset_id: the external codeset identifier
+        @type codeset_id: string
+        @return: the code set, or None if not defined
+        @rtype: dict
+        """
+        try:
+            return self.codesets[codeset_id]
+        except KeyError:
+            pass
+        with self.lock:
+            if codeset_id not in self.codesets:
+                self._read(codeset_id)
+                self.codesets.setdefault(codeset_id, None)
+            return self.codesets[codeset_id]
+
+    def get_all(self):
+        """
+        @return: all defined code sets
+        @rtype: dict
+        """
+        with self.lock:
+            if not self.all_loaded:
+                self._read()
+        return dict([(k, v) for (k, v) in self.codesets.items() if v is not None])
+
+
 class ExternalCodes(object):
     """
     Validates an ID against an external list of codes
@@ -39,31 +150,27 @@ class ExternalCodes(object):
         @param exclude: comma separated string of external codes to ignore
         @type exclude: string
 
-        @note: self.codes - map of a tuple of two dates and a list of codes
-        {codeset_id: (eff_dte, exp_dte, [code_values])}
+        @note: The code sets are shared by every ExternalCodes using the same
+        codes.xml, and are loaded on first use
         """
-        logger = logging.getLogger('pyx12')
-        self.codes = {}
-        codes_file = 'codes.xml'
-        if base_path is not None:
-            logger.debug("Looking for codes file '{}' in map_path '{}'".format(codes_file, base_path))
-            code_fd = open(os.path.join(base_path, codes_file))
-        else:
-            logger.debug("Looking for codes file '{}' in pkg_resources".format(codes_file))
-            code_fd = resource_stream(__name__, os.path.join('map', codes_file))
-
+        self.base_path = base_path
+        self.exclude = exclude
         self.exclude_list = exclude.split(',') if exclude is not None else []
+        self.store = get_codeset_store(base_path)
+
+    def __getstate__(self):
+        return {'base_path': self.base_path, 'exclude': self.exclude}
+
+    def __setstate__(self, state):
+        self.__init__(state['base_path'], state['exclude'])
 
-        for cElem in et.parse(code_fd).iter('codeset'):
-            codeset_id = cElem.findtext('id')
-            name = cElem.findtext('name')
-            data_ele = cElem.findtext('data_ele')
-            codes = []
-            for code in cElem.iterfind('version/code'):
-                codes.append(code.text)
-            self.codes[codeset_id] = {'name': name, 'dataele':
-                                      data_ele, 'codes': codes}
-        code_fd.close()
+    @property
+    def codes(self):
+        """
+        map of the code set id to the code set
+        {codeset_id: {'name': name, 'dataele': data_ele, 'codes': frozenset}}
+        """
+        return self.store.get_all()
 
     def isValid(self, key, code, check_dte=None):
         """
@@ -84,9 +191,10 @@ class ExternalCodes(object):
         else:
             if key in self.exclude_list:
                 return True
-            if key not in self.codes:
+            codeset = self.store.get(key)
+            if codeset is None:
                 raise EngineError('External Code "%s" is not defined' % (key))
-            if code in self.codes[key]['codes']:
+            if code in codeset['codes']:
                 return True
         return False
 
@@ -94,5 +202,6 @@ class ExternalCodes(object):
         """
         Debug print first <count> codes
         """
-        for key in list(self.codes.keys()):
-            print((self.codes[key][:count]))
+        codes = self.codes
+        for key in list(codes.keys()):
+            print((key, sorted(codes[key]['codes'])[:count]))
@@ -14,17 +14,76 @@ Interface to normalized Data Elements
 
 import os.path
 import logging
+import threading
 import xml.etree.cElementTree as et
 from pkg_resources import resource_stream
 
 # Intrapackage imports
 from pyx12.errors import EngineError
 
+_dataele = {}
+_dataele_lock = threading.Lock()
+
 
 class DataElementsError(Exception):
     """Class for data elements module errors."""
 
 
+def get_data_elements(base_path=None):
+    """
+    Get the data element definitions shared by all users of a dataele.xml
+    file.  The file is read on first use.
+
+    @param base_path: Override directory containing dataele.xml.  If None,
+        uses package resource folder
+    @type base_path: string
+    @return: {ele_num: {data_type, min_len, max_len, name}}
+    @rtype: dict
+    """
+    try:
+        return _dataele[base_path]
+    except KeyError:
+        pass
+    with _dataele_lock:
+        if base_path not in _dataele:
+            _dataele[base_path] = _read_data_elements(base_path)
+        return _dataele[base_path]
+
+
+def clear_data_elements():
+    """
+    Forget the shared data element definitions.  They are read again on
+    next use.
+    """
+    with _dataele_lock:
+        _dataele.clear()
+
+
+def _read_data_elements(base_path=None):
+    """
+    @rtype: dict
+    """
+    logger = logging.getLogger('pyx12')
+    dataele = {}
+    dataele_file = 'dataele.xml'
+    if base_path is not None:
+        logger.debug("Looking for data element definition file '{}' in map_path '{}'".format(dataele_file, base_path))
+        fd = open(os.path.join(base_path, dataele_file), 'rb')
+    else:
+        logger.debug("Looking for data element definition file '{}' in pkg_resources".format(dataele_file))
+        fd = resource_stream(__name__, os.path.join('map', dataele_file))
+    for eElem in et.parse(fd).iter('data_ele'):
+        ele_num = eElem.get('ele_num')
+        data_type = eElem.get('data_type')
+        min_len = int(eElem.get('min_len'))
+        max_len = int(eElem.get('max_len'))
+        name = eElem.get('name')
+        dataele[ele_num] = {'data_type': data_type, 'min_len':
+                            min_len, 'max_len': max_len, 'name': name}
+    fd.close()
+    return dataele
+
+
 class DataElements(object):
     """
     Interface to normalized Data Elements
@@ -39,25 +98,19 @@ class DataElements(object):
 
         @note: self.dataele - map to the data element
         {ele_num: {data_type, min_len, max_len, name}}
+        The map is shared by every DataElements using the same dataele.xml
         """
-        logger = logging.getLogger('pyx12')
-        self.dataele = {}
-        dataele_file = 'dataele.xml'
-        if base_path is not None:
-            logger.debug("Looking for data element definition file '{}' in map_path '{}'".format(dataele_file, base_path))
-            fd = open(os.path.join(base_path, dataele_file))
-        else:
-            logger.debug("Looking for data element definition file '{}' in pkg_resources".format(dataele_file))
-            fd = resource_stream(__name__, os.path.join('map', dataele_file))
-        for eElem in et.parse(fd).iter('data_ele'):
-            ele_num = eElem.get('ele_num')
-            data_type = eElem.get('data_type')
-            min_len = int(eElem.get('min_len'))
-            max_len = int(eElem.get('max_len'))
-            name = eElem.get('name')
-            self.dataele[ele_num] = {'data_type': data_type, 'min_len':
-                                     min_len, 'max_len': max_len, 'name': name}
-        fd.close()
+        self.base_path = base_path
+
+    def __getstate__(self):
+        return {'base_path': self.base_path}
+
+    def __setstate__(self, state):
+        self.__init__(state['base_path'])
+
+    @property
+    def dataele(self):
+        return get_data_elements(self.base_path)
 
     def get_by_elem_num(self, ele_num):
         """
@@ -69,9 +122,10 @@ class DataElements(object):
         """
         if not ele_num:
             raise EngineError('Bad data element %s' % (ele_num))
-        if ele_num not in self.dataele:
+        try:
+            return self.dataele[ele_num]
+        except KeyError:
             raise EngineError('Data Element "%s" is not defined' % (ele_num))
-        return self.dataele[ele_num]
 
     def __repr__(self):
         for ele_num in list(self.dataele.keys()):
@@ -16,6 +16,8 @@ Visitor - Visits an error_handler composite
 #from types import *
 import time
 import logging
+import shutil
+import tempfile
 
 # Intrapackage imports
 from .errors import EngineError
@@ -54,6 +56,16 @@ class error_997_visitor(error_visitor.error_visitor):
         self.gs_seg = None
         self.st_control_num = 0
         self.st_loop_count = 0
+        self.spool = None
+
+    def defer_envelope(self):
+        """
+        Write the transaction sets to a spool file until L{visit_root_post},
+        and write the ISA and GS segments then, from the last ISA and GS
+        loops
+        """
+        self.spool = tempfile.SpooledTemporaryFile(
+            max_size=error_visitor.SPOOL_MAX_SIZE, mode='w+')
 
     def visit_root_pre(self, errh):
         """
@@ -61,10 +73,24 @@ class error_997_visitor(error_visitor.error_visitor):
         @type errh: L{error_handler.err_handler}
         """
         #now = time.localtime()
-        seg = errh.cur_isa_node.seg_data
         #ISA*00*          *00*          *ZZ*ENCOUNTER      *ZZ*00GR           *030425*1501*U*00401*000065350*0*T*:~
         self.isa_control_num = ('%s%s' % (time.strftime('%y%m%d'),
                                           time.strftime('%H%M')))[1:]
+        self.gs_loop_count = 0
+        if self.spool is None:
+            self._write_envelope(errh)
+        #self.gs_997_count = 0
+        self.st_loop_count = 0
+        self.gs_loop_count += 1
+
+    def _write_envelope(self, errh):
+        """
+        Write the ISA and GS segments, from the current ISA and GS loops
+
+        @param errh: Error handler
+        @type errh: L{error_handler.err_handler}
+        """
+        seg = errh.cur_isa_node.seg_data
         icvn = seg.get_value('ISA12')
         isa_seg = pyx12.segment.Segment('ISA*00*          *00*          ',
                                         self.seg_term, self.ele_term, self.subele_term)
@@ -82,7 +108,6 @@ class error_997_visitor(error_visitor.error_visitor):
         isa_seg.append(self.subele_term)
         self._write(isa_seg)
         self.isa_seg = isa_seg
-        self.gs_loop_count = 0
 
         # GS*FA*ENCOUNTER*00GR*20030425*150153*653500001*X*004010
         seg = errh.cur_gs_node.seg_data
@@ -98,9 +123,6 @@ class error_997_visitor(error_visitor.error_visitor):
         self._write(gs_seg)
         self.gs_seg = gs_seg
         self.gs_id = seg.get_value('GS06')
-        #self.gs_997_count = 0
-        self.st_loop_count = 0
-        self.gs_loop_count += 1
 
     def __get_isa_errors(self, err_isa):
         """
@@ -148,6 +170,13 @@ class error_997_visitor(error_visitor.error_visitor):
         @param errh: Error handler
         @type errh: L{error_handler.err_handler}
         """
+        if self.spool is not None:
+            spool = self.spool
+            self.spool = None
+            self._write_envelope(errh)
+            spool.seek(0)
+            shutil.copyfileobj(spool, self.fd)
+            spool.close()
         self._write(pyx12.segment.Segment('GE*%i*%s' % (self.st_loop_count,
                                                         self.gs_seg.get_value('GS06')), '~', '*', ':'))
         self.gs_loop_count = 1
@@ -402,5 +431,8 @@ class error_997_visitor(error_visitor.error_visitor):
         if seg_data.get_seg_id() == 'ISA':
             sout = sout[:-1] + self.ele_term + self.subele_term \
                 + self.seg_term
-        self.fd.write('%s\n' % (sout))
+        if self.spool is not None:
+            self.spool.write('%s\n' % (sout))
+        else:
+            self.fd.write('%s\n' % (sout))
         self.seg_count += 1
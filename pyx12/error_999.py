@@ -16,6 +16,8 @@ Visitor - Visits an error_handler composite
 import time
 import logging
 import random
+import shutil
+import tempfile
 
 # Intrapackage imports
 from pyx12.errors import EngineError
@@ -39,7 +41,7 @@ class error_999_visitor(pyx12.error_visitor.error_visitor):
         @type term: tuple(string, string, string, string)
         """
         self.fd = fd
-        self.wr = pyx12.x12file.X12Writer(fd, '~', '*', ':', '\n', '^')
+        self.wr = self._get_writer(fd)
         self.seg_term = '~'
         self.ele_term = '*'
         self.subele_term = ':'
@@ -49,7 +51,23 @@ class error_999_visitor(pyx12.error_visitor.error_visitor):
         self.gs_control_num = None
         self.st_control_num = 0
         self.vriic = '005010X231'
+        self.spool = None
 
+    def _get_writer(self, fd):
+        """
+        @rtype: L{x12file.X12Writer}
+        """
+        return pyx12.x12file.X12Writer(fd, '~', '*', ':', '\n', '^')
+
+    def defer_envelope(self):
+        """
+        Write the transaction sets to a spool file until L{visit_root_post},
+        and write the ISA and GS segments then, from the last ISA and GS
+        loops
+        """
+        self.spool = tempfile.SpooledTemporaryFile(
+            max_size=pyx12.error_visitor.SPOOL_MAX_SIZE, mode='w+')
+        self.wr = self._get_writer(self.spool)
 
     def visit_root_pre(self, errh):
         """
@@ -60,11 +78,21 @@ class error_999_visitor(pyx12.error_visitor.error_visitor):
         isa_node seg_data
         gs_node seg_data
         """
-        seg = errh.cur_isa_node.seg_data
         #ISA*00*          *00*          *ZZ*ENCOUNTER      *ZZ*00GR           *030425*1501*U*00501*000065350*0*T*:~
         self.isa_control_num = ('%s%s' % (time.strftime('%y%m%d'),
                                           time.strftime('%H%M')))[1:]
         self.gs_control_num = '%i' % (random.randint(10000000, 999999999))
+        if self.spool is None:
+            self._write_envelope(errh)
+
+    def _write_envelope(self, errh):
+        """
+        Write the ISA and GS segments, from the current ISA and GS loops
+
+        @param errh: Error handler
+        @type errh: L{error_handler.err_handler}
+        """
+        seg = errh.cur_isa_node.seg_data
         icvn = seg.get_value('ISA12')
         isa_seg = pyx12.segment.Segment('ISA*00*          *00*          ',
                                         self.seg_term, self.ele_term, self.subele_term)
@@ -121,6 +149,18 @@ class error_999_visitor(pyx12.error_visitor.error_visitor):
         @param errh: Error handler
         @type errh: L{error_handler.err_handler}
         """
+        if self.spool is not None:
+            spool = self.spool
+            self.spool = None
+            # The spool writer has only seen the transaction sets.  Its ST
+            # count is the count for the GE segment.
+            st_count = self.wr.st_count
+            self.wr = self._get_writer(self.fd)
+            self._write_envelope(errh)
+            spool.seek(0)
+            shutil.copyfileobj(spool, self.fd)
+            spool.close()
+            self.wr.st_count = st_count
         ge = pyx12.segment.Segment('GE', '~', '*', ':')
         ge.set('02', self.gs_control_num)
         self.wr.Write(ge)
@@ -89,10 +89,58 @@ class err_handler(object):
         self.cur_isa_node = None
         self.cur_gs_node = None
         self.cur_st_node = None
-        self.cur_seg_node = None
+        self._cur_seg_node = None
+        self._pending_seg = None
         self.seg_node_added = False
-        self.cur_ele_node = None
+        self._cur_ele_node = None
+        self._pending_ele = None
+        self.ele_node_added = False
         self.cur_line = 0
+        self.listeners = []
+        self.ack_visitor = None
+        self._ack_started = False
+        self._ack_isa_node = None
+        self._ack_gs_node = None
+        self._ack_st_node = None
+
+    def _get_cur_seg_node(self):
+        """
+        The current segment error node.  A segment added by L{add_seg} is
+        held as a location tuple until it is first needed.
+
+        @rtype: L{err_seg} or L{err_isa}, L{err_gs}, L{err_st}
+        """
+        if self._pending_seg is not None:
+            self._cur_seg_node = err_seg(*self._pending_seg)
+            self._pending_seg = None
+        return self._cur_seg_node
+
+    def _set_cur_seg_node(self, node):
+        self._pending_seg = None
+        self._cur_seg_node = node
+
+    cur_seg_node = property(_get_cur_seg_node, _set_cur_seg_node)
+
+    def _get_cur_ele_node(self):
+        """
+        The current element error node.  An element added by L{add_ele} is
+        held as its map node until it is first needed.
+
+        @rtype: L{err_ele}
+        """
+        if self._pending_ele is not None:
+            (map_node, parent) = self._pending_ele
+            self._pending_ele = None
+            if parent is None:
+                parent = self.cur_seg_node
+            self._cur_ele_node = err_ele(parent, map_node)
+        return self._cur_ele_node
+
+    def _set_cur_ele_node(self, node):
+        self._pending_ele = None
+        self._cur_ele_node = node
+
+    cur_ele_node = property(_get_cur_ele_node, _set_cur_ele_node)
 
     def accept(self, visitor):
         """
@@ -103,6 +151,97 @@ class err_handler(object):
             child.accept(visitor)
         visitor.visit_root_post(self)
 
+    def add_listener(self, listener):
+        """
+        Register a callable to be passed each error node as it is added to
+        the error tree.  The ISA, GS and ST loop nodes are passed again as
+        their loops are closed, as errors of the trailer segments are held by
+        the loop nodes.
+
+        @param listener: Called with the error node
+        @type listener: callable
+        """
+        self.listeners.append(listener)
+
+    def _notify(self, node):
+        """
+        Pass an error node to the listeners
+        """
+        for listener in self.listeners:
+            listener(node)
+
+    def set_ack_visitor(self, visitor):
+        """
+        Generate the acknowledgment incrementally, instead of visiting the
+        whole error tree with L{accept} at the end of the source.
+
+        The visitor is fed the loops as the source is read.  A closed ST loop
+        is visited once the next ST loop starts or its GS loop closes, as
+        errors in the SE segment are found after L{close_st_loop}.  The
+        segment error nodes of the ST loop are then released.  Call
+        L{finish_ack} at the end of the source.
+
+        As with L{accept}, the envelope of the acknowledgment is built from
+        the last ISA and GS loops.  The visitor spools the transaction sets
+        and writes the envelope and the spool at L{finish_ack}.
+
+        @param visitor: Acknowledgment visitor
+        @type visitor: L{error_visitor.error_visitor}
+        """
+        self.ack_visitor = visitor
+        visitor.defer_envelope()
+
+    def finish_ack(self):
+        """
+        Visit any outstanding loops and finish the acknowledgment
+        """
+        if self.ack_visitor is not None and self._ack_started:
+            self._ack_isa()
+            self._ack_call(self.ack_visitor.visit_root_post, self)
+        self.ack_visitor = None
+
+    def _ack_call(self, method, node):
+        """
+        Call a visitor method.  On failure, stop generating the acknowledgment
+        """
+        if self.ack_visitor is None:
+            return
+        try:
+            method(node)
+        except Exception:
+            logger.exception('Failed to create acknowledgment')
+            self.ack_visitor = None
+
+    def _ack_st(self):
+        """
+        Visit and release the last ST loop
+        """
+        st_node = self._ack_st_node
+        if st_node is not None:
+            self._ack_st_node = None
+            self._ack_call(st_node.accept, self.ack_visitor)
+            st_node.release()
+
+    def _ack_gs(self):
+        """
+        Finish the last GS loop
+        """
+        self._ack_st()
+        gs_node = self._ack_gs_node
+        if gs_node is not None:
+            self._ack_gs_node = None
+            self._ack_call(self.ack_visitor.visit_gs_post, gs_node)
+
+    def _ack_isa(self):
+        """
+        Finish the last ISA loop
+        """
+        self._ack_gs()
+        isa_node = self._ack_isa_node
+        if isa_node is not None:
+            self._ack_isa_node = None
+            self._ack_call(self.ack_visitor.visit_isa_post, isa_node)
+
     def handle_errors(self, err_list):
         """
         @param err_list: list of errors to apply
@@ -135,10 +274,20 @@ class err_handler(object):
         @type seg_data: L{segment<segment.Segment>}
         """
         #logger.debug('add_isa loop')
-        self.children.append(err_isa(self, seg_data, src))
-        self.cur_isa_node = self.children[-1]
+        isa_node = err_isa(self, seg_data, src)
+        isa_node.container = self
+        isa_node.child_index = len(self.children)
+        self.children.append(isa_node)
+        self.cur_isa_node = isa_node
         self.cur_seg_node = self.cur_isa_node
         self.seg_node_added = True
+        self._notify(self.cur_isa_node)
+        if self.ack_visitor is not None:
+            # The acknowledgment header needs the GS segment
+            if self._ack_started:
+                self._ack_isa()
+                self._ack_call(self.ack_visitor.visit_isa_pre, self.cur_isa_node)
+            self._ack_isa_node = self.cur_isa_node
 
     def add_gs_loop(self, seg_data, src):
         """
@@ -147,10 +296,19 @@ class err_handler(object):
         """
         #logger.debug('add_gs loop')
         parent = self.cur_isa_node
-        parent.children.append(err_gs(parent, seg_data, src))
+        parent.add_child(err_gs(parent, seg_data, src))
         self.cur_gs_node = parent.children[-1]
         self.cur_seg_node = self.cur_gs_node
         self.seg_node_added = True
+        self._notify(self.cur_gs_node)
+        if self.ack_visitor is not None:
+            self._ack_gs()
+            if not self._ack_started:
+                self._ack_started = True
+                self._ack_call(self.ack_visitor.visit_root_pre, self)
+                self._ack_call(self.ack_visitor.visit_isa_pre, self.cur_isa_node)
+            self._ack_call(self.ack_visitor.visit_gs_pre, self.cur_gs_node)
+            self._ack_gs_node = self.cur_gs_node
 
     def add_st_loop(self, seg_data, src):
         """
@@ -158,11 +316,16 @@ class err_handler(object):
         @type seg_data: L{segment<segment.Segment>}
         """
         #logger.debug('add_st loop')
+        if self.ack_visitor is not None:
+            self._ack_st()
         parent = self.cur_gs_node
-        parent.children.append(err_st(parent, seg_data, src))
+        parent.add_child(err_st(parent, seg_data, src))
         self.cur_st_node = parent.children[-1]
         self.cur_seg_node = self.cur_st_node
         self.seg_node_added = True
+        self._notify(self.cur_st_node)
+        if self.ack_visitor is not None:
+            self._ack_st_node = self.cur_st_node
 
     def add_seg(self, map_node, seg_data, seg_count, cur_line, ls_id):
         """
@@ -177,9 +340,10 @@ class err_handler(object):
         @param ls_id: The current LS loop identifier
         @type ls_id: string
         """
-        parent = self.cur_st_node
-        self.cur_seg_node = err_seg(
-            parent, map_node, seg_data, seg_count, cur_line, ls_id)
+        # The err_seg is only built if an error is found in the segment
+        self._pending_seg = (self.cur_st_node, map_node, seg_data, seg_count,
+                             cur_line, ls_id)
+        self._cur_seg_node = None
         self.seg_node_added = False
         #logger.debug('add_seg: %s' % map_node.name)
         #if len(parent.children) > 0:
@@ -193,20 +357,30 @@ class err_handler(object):
         """
         #pdb.set_trace()
         if not self.seg_node_added:
-            self.cur_st_node.children.append(self.cur_seg_node)
+            self.cur_st_node.add_child(self.cur_seg_node)
             self.seg_node_added = True
+            self._notify(self.cur_seg_node)
 
     def add_ele(self, map_node):
         """
+        The err_ele is only built if an error is found in the element
+
+        @param map_node: current element node
+        @type map_node: L{node<map_if.element_if>}
         """
-        if self.cur_seg_node.id == 'ISA':
-            self.cur_ele_node = err_ele(self.cur_isa_node, map_node)
-        elif self.cur_seg_node.id == 'GS':
-            self.cur_ele_node = err_ele(self.cur_gs_node, map_node)
-        elif self.cur_seg_node.id == 'ST':
-            self.cur_ele_node = err_ele(self.cur_st_node, map_node)
+        if self._pending_seg is not None:
+            # Parent is the pending segment, resolved when promoted
+            parent = None
+        elif self._cur_seg_node.id == 'ISA':
+            parent = self.cur_isa_node
+        elif self._cur_seg_node.id == 'GS':
+            parent = self.cur_gs_node
+        elif self._cur_seg_node.id == 'ST':
+            parent = self.cur_st_node
         else:
-            self.cur_ele_node = err_ele(self.cur_seg_node, map_node)
+            parent = self._cur_seg_node
+        self._pending_ele = (map_node, parent)
+        self._cur_ele_node = None
         self.ele_node_added = False
 
     def _add_cur_ele(self):
@@ -214,7 +388,7 @@ class err_handler(object):
         """
         self._add_cur_seg()
         if not self.ele_node_added and self.cur_seg_node is not None:
-            self.cur_seg_node.elements.append(self.cur_ele_node)
+            self.cur_seg_node.add_element(self.cur_ele_node)
             self.ele_node_added = True
         #logger.debug('----  add_ele: %s' % self.cur_seg_node.elements[-1].name)
 
@@ -301,16 +475,22 @@ class err_handler(object):
     def close_isa_loop(self, node, seg, src):
         """
         """
+        if self.ack_visitor is not None:
+            self._ack_gs()
         self.cur_isa_node.close(node, seg, src)
         self.cur_seg_node = self.cur_isa_node
         self.seg_node_added = True
+        self._notify(self.cur_isa_node)
 
     def close_gs_loop(self, node, seg, src):
         """
         """
+        if self.ack_visitor is not None:
+            self._ack_st()
         self.cur_gs_node.close(node, seg, src)
         self.cur_seg_node = self.cur_gs_node
         self.seg_node_added = True
+        self._notify(self.cur_gs_node)
 
     def close_st_loop(self, node, seg, src):
         """
@@ -318,6 +498,29 @@ class err_handler(object):
         self.cur_st_node.close(node, seg, src)
         self.cur_seg_node = self.cur_st_node
         self.seg_node_added = True
+        self._notify(self.cur_st_node)
+
+    def merge_st_loop(self, st_node):
+        """
+        Add a closed ST loop error node built by another err_handler to the
+        current GS loop, leaving the handler as L{close_st_loop} would.  The
+        listeners are not passed the nodes.
+
+        @param st_node: ST loop error node
+        @type st_node: L{err_st}
+        """
+        if self.ack_visitor is not None:
+            self._ack_st()
+        parent = self.cur_gs_node
+        st_node.parent = parent
+        parent.add_child(st_node)
+        self.cur_st_node = st_node
+        self.cur_seg_node = st_node
+        self.seg_node_added = True
+        self.cur_ele_node = None
+        self.ele_node_added = False
+        if self.ack_visitor is not None:
+            self._ack_st_node = st_node
 
     def find_node(self, type):
         """
@@ -354,6 +557,12 @@ class err_handler(object):
             count += child.get_error_count()
         return count
 
+    def _child_changed(self, child, old_ct, new_ct):
+        """
+        The ISA loop counts are summed when needed
+        """
+        pass
+
     def get_first_child(self):
         """
         """
@@ -388,6 +597,16 @@ class err_handler(object):
 
 
 class err_node(object):
+    # The node holding this one in its children or elements, and the position
+    container = None
+    child_index = None
+    # Error counts, kept as errors and nodes are added
+    err_ct = 0
+    err_nodes = 0  # children with errors
+    error_sum = 0  # errors of the children
+    ele_err_nodes = 0  # elements with errors
+    ele_error_sum = 0  # errors of the elements
+
     def __init__(self, parent):
         """
         """
@@ -430,10 +649,66 @@ class err_node(object):
         else:
             return None
 
+    def add_child(self, node):
+        """
+        @param node: Error node to append to the children
+        @type node: L{err_node}
+        """
+        node.container = self
+        node.child_index = len(self.children)
+        self.children.append(node)
+        if node.err_ct:
+            self._child_changed(node, 0, node.err_ct)
+
+    def add_element(self, ele):
+        """
+        @param ele: Element error node to append to the elements
+        @type ele: L{err_ele}
+        """
+        ele.container = self
+        self.elements.append(ele)
+        if ele.err_ct:
+            self._child_changed(ele, 0, ele.err_ct)
+
+    def _child_changed(self, child, old_ct, new_ct):
+        """
+        Update the counts for a change in the error count of a child or
+        element
+        """
+        if child.id == 'ELE':
+            self.ele_error_sum += new_ct - old_ct
+            self.ele_err_nodes += (new_ct > 0) - (old_ct > 0)
+        else:
+            self.error_sum += new_ct - old_ct
+            self.err_nodes += (new_ct > 0) - (old_ct > 0)
+        self._recount()
+
+    def _recount(self):
+        """
+        Update the error count, and pass any change to the container
+        """
+        old_ct = self.err_ct
+        self.err_ct = self._count_errors()
+        if self.err_ct != old_ct and self.container is not None:
+            self.container._child_changed(self, old_ct, self.err_ct)
+
+    def _count_errors(self):
+        """
+        @return: The error count, from the kept counts
+        @rtype: int
+        """
+        return self.error_sum
+
     def get_next_sibling(self):
         """
         """
         #if self.id == 'ROOT': raise EngineError
+        siblings = self.parent.children
+        idx = self.child_index
+        if idx is not None and idx < len(siblings) and siblings[idx] is self:
+            if idx + 1 < len(siblings):
+                return siblings[idx + 1]
+            return None
         bFound = False
         for sibling in self.parent.children:
             if bFound:
@@ -454,10 +729,7 @@ class err_node(object):
     def get_error_count(self):
         """
         """
-        count = 0
-        for child in self.children:
-            count += child.get_error_count()
-        return count
+        return self.err_ct
 
     def get_error_list(self, seg_id, pre=False):
         """
@@ -525,6 +797,7 @@ class err_isa(err_node):
         @type err_str: string
         """
         self.errors.append((err_cde, err_str))
+        self._recount()
 
     def close(self, node, seg, src):
         self.cur_line_iea = src.get_cur_line()
@@ -542,12 +815,10 @@ class err_isa(err_node):
     def get_error_count(self):
         """
         """
-        count = 0
-        for ele in self.elements:
-            count += ele.get_error_count()
-        for child in self.children:
-            count += child.get_error_count()
-        return count + len(self.errors)
+        return self.err_ct
+
+    def _count_errors(self):
+        return self.ele_error_sum + self.error_sum + len(self.errors)
 
     def get_error_list(self, seg_id, pre=False):
         """
@@ -628,6 +899,7 @@ class err_gs(err_node):
         @type err_str: string
         """
         self.errors.append((err_cde, err_str))
+        self._recount()
 
     def close(self, node, seg_data, src):
         """
@@ -645,9 +917,8 @@ class err_gs(err_node):
         #self.st_count_accept = self.st_count_recv - len(self.children) # AK904
 
     def _get_ack_code(self):
-        for child in self.children:
-            if child.get_error_count() > 0:
-                return 'R'
+        if self.err_nodes > 0:
+            return 'R'
         #err_codes = map(lambda x:x[0], self.errors)
         #if '1' in err_codes: return 'R'
         #elif '2' in err_codes: return 'R'
@@ -679,12 +950,10 @@ class err_gs(err_node):
     def get_error_count(self):
         """
         """
-        count = 0
-        for ele in self.elements:
-            count += ele.get_error_count()
-        for child in self.children:
-            count += child.get_error_count()
-        return count + len(self.errors)
+        return self.err_ct
+
+    def _count_errors(self):
+        return self.ele_error_sum + self.error_sum + len(self.errors)
 
     def get_error_list(self, seg_id, pre=False):
         """
@@ -767,6 +1036,7 @@ class err_st(err_node):
         @type err_str: string
         """
         self.errors.append((err_cde, err_str))
+        self._recount()
 
     def close(self, node, seg_data, src):
         """
@@ -791,8 +1061,11 @@ class err_st(err_node):
         @return: Count of ST/SE loop errors
         @rtype: int
         """
+        return self.err_ct
+
+    def _count_errors(self):
         seg_err_ct = 0
-        if self.child_err_count() > 0:
+        if self.err_nodes > 0:
             seg_err_ct = 1
         return len(self.errors) + seg_err_ct
 
@@ -810,11 +1083,15 @@ class err_st(err_node):
             return []
 
     def child_err_count(self):
-        ct = 0
-        for child in self.children:
-            if child.err_count() > 0:
-                ct += 1
-        return ct
+        return self.err_nodes
+
+    def release(self):
+        """
+        Drop the segment error nodes and the ST segment, once the loop has
+        been acknowledged.  The count of segments in error is kept.
+        """
+        self.children = []
+        self.seg_data = None
 
     def get_cur_line(self):
         """
@@ -893,13 +1170,17 @@ class err_seg(err_node):
         @type err_str: string
         """
         self.errors.append((err_cde, err_str, err_value))
+        self._recount()
 
     def err_count(self):
         """
         Returns:    count of errors
         """
+        return self.err_ct
+
+    def _count_errors(self):
         ele_err_ct = 0
-        if self.child_err_count() > 0:
+        if self.ele_err_nodes > 0:
             ele_err_ct = 1
         return len(self.errors) + ele_err_ct
 
@@ -907,11 +1188,7 @@ class err_seg(err_node):
         return self.err_count()
 
     def child_err_count(self):
-        ct = 0
-        for ele in self.elements:
-            if ele.err_count() > 0:
-                ct += 1
-        return ct
+        return self.ele_err_nodes
 
     def __next__(self):
         """
@@ -974,11 +1251,15 @@ class err_ele(err_node):
         """
         #logger.debug('err_ele.add_error: %s %s %s' % (err_cde, err_str, bad_value))
         self.errors.append((err_cde, err_str, bad_value))
+        self._recount()
 
     def err_count(self):
-        return len(self.errors)
+        return self.err_ct
 
     def get_error_count(self):
+        return self.err_ct
+
+    def _count_errors(self):
         return len(self.errors)
 
 
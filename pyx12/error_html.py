@@ -12,10 +12,12 @@
 Generates HTML error output
 """
 
+import os.path
 import time
 import logging
 
 # Intrapackage imports
+from pyx12.error_handler import err_isa, err_gs, err_st
 
 logger = logging.getLogger('pyx12.error_html')
 logger.setLevel(logging.DEBUG)
@@ -25,14 +27,15 @@ logger.setLevel(logging.DEBUG)
 class error_html(object):
     """
     """
+    # Can the HTML of segments rendered elsewhere be appended to fd
+    batch_output = True
+
     def __init__(self, errh, fd, term=('~', '*', '~', '\n')):
         """
         @param fd: target file
         @type fd: file descriptor
         @param term: tuple of x12 terminators used
         @type term: tuple(string, string, string, string)
-
-        @bug: GS errors are re-printing at the GE level
         """
         self.errh = errh
         self.fd = fd
@@ -42,10 +45,44 @@ class error_html(object):
         self.eol = ''
         self.last_line = 0
         self.loop_info = None
+        self.err_nodes = []
+        if errh is not None:
+            errh.add_listener(self.add_err_node)
+
+    def add_err_node(self, err_node):
+        """
+        Error handler listener.  Hold the error node for the next segment.
+
+        An ISA, GS or ST loop node passed again as its loop is closed is held
+        for the trailer segment, without the element errors of the header
+        segment, which were written with the header.
+        """
+        if isinstance(err_node, (err_isa, err_gs, err_st)) and err_node.is_closed():
+            err_node = _loop_trailer(err_node)
+        self.err_nodes.append(err_node)
+
+    def _get_err_nodes(self, err_node_list):
+        """
+        @return: The error nodes of the segment, and clear the held nodes
+        @rtype: list
+        """
+        if err_node_list is None:
+            err_node_list = self.err_nodes
+        self.err_nodes = []
+        return err_node_list
 
     def header(self):
+        self._head('X12N Error Analysis')
+        self.fd.write('<h1>X12N Error Analysis</h1>\n<h3>Analysis Date: %s</h3><p>\n' %
+                      (time.strftime('%m/%d/%Y %H:%M:%S')))
+        self.fd.write('<div class="segs" style="">\n')
+
+    def _head(self, title):
+        """
+        Write the start of a page, up to the body
+        """
         self.fd.write('<html>\n<head>\n')
-        self.fd.write('<title>X12N Error Analysis</title>\n')
+        self.fd.write('<title>%s</title>\n' % (title))
         self.fd.write('<style type="text/css">\n<!--\n')
         self.fd.write('  span.seg { color: black; font-style: normal; }\n')
         self.fd.write('  span.error { background-color: #CCCCFF; color: red; font-style: normal; }\n')
@@ -54,32 +91,49 @@ class error_html(object):
         self.fd.write('  -->\n</style>\n')
         self.fd.write('  <link rel="stylesheet" href="errors.css" type="text/css" />\n')
         self.fd.write('</head>\n<body>\n')
-        self.fd.write('<h1>X12N Error Analysis</h1>\n<h3>Analysis Date: %s</h3><p>\n' %
-                      (time.strftime('%m/%d/%Y %H:%M:%S')))
-        self.fd.write('<div class="segs" style="">\n')
 
     def footer(self):
+        self._trailer_errors()
+        self.fd.write('</div>\n')
+        self._tail()
+
+    def _tail(self):
+        """
+        Write the end of a page
+        """
+        self.fd.write('<p>\n<a href="http://sourceforge.net/projects/pyx12/">pyx12 Validator</a>\n</p>\n')
+        self.fd.write('</body>\n</html>\n')
+
+    def _trailer_errors(self):
+        """
+        Write the errors of loops left open at the end of the source
+
+        @return: Count of errors written
+        @rtype: int
+        """
+        ct = 0
         err_st = self.errh.cur_st_node
         if not err_st.is_closed():
             for (err_cde, err_str) in err_st.errors:
                 if err_cde == '2':
                     self.fd.write('<span class="error">&nbsp;%s (Segment Error Code: %s)</span><br />\n' %
                                   (err_str, err_cde))
+                    ct += 1
         err_gs = self.errh.cur_gs_node
         if not err_gs.is_closed():
             for (err_cde, err_str) in err_gs.errors:
                 if err_cde == '3':
                     self.fd.write('<span class="error">&nbsp;%s (Segment Error Code: %s)</span><br />\n' %
                                   (err_str, err_cde))
+                    ct += 1
         err_isa = self.errh.cur_isa_node
         if not err_isa.is_closed():
             for (err_cde, err_str) in err_isa.errors:
                 if err_cde == '023':
                     self.fd.write('<span class="error">&nbsp;%s (Segment Error Code: %s)</span><br />\n' %
                                   (err_str, err_cde))
-        self.fd.write('</div>\n')
-        self.fd.write('<p>\n<a href="http://sourceforge.net/projects/pyx12/">pyx12 Validator</a>\n</p>\n')
-        self.fd.write('</body>\n</html>\n')
+                    ct += 1
+        return ct
 
     def loop(self, loop_node):
         if loop_node.type != 'wrapper':
@@ -92,13 +146,17 @@ class error_html(object):
         self.fd.write('<span class="info">&nbsp;&nbsp;%s</span><br />\n' %
                       (info_str))
 
-    def gen_seg(self, seg_data, src, err_node_list):
+    def gen_seg(self, seg_data, src, err_node_list=None):
         """
         Find error seg for this segment.
         Find any skipped error values.
         ID pos of bad value.
         @param seg_data: data segment instance
+        @param err_node_list: error nodes of the segment.  By default, the
+            nodes added to the error handler since the last segment
+        @type err_node_list: list
         """
+        err_node_list = self._get_err_nodes(err_node_list)
         cur_line = src.cur_line
 
         #while errh
@@ -170,6 +228,190 @@ class error_html(object):
         return '<span class="ele_err">%s</span>' % (str1)
 
 
+class _loop_trailer(object):
+    """
+    The errors of a closed ISA, GS or ST loop found from its trailer segment
+    """
+
+    def __init__(self, err_node):
+        """
+        @param err_node: closed loop error node
+        @type err_node: L{error_handler.err_isa}, L{error_handler.err_gs} or
+            L{error_handler.err_st}
+        """
+        self.err_node = err_node
+        self.ele_start = len(err_node.elements)
+
+    @property
+    def elements(self):
+        return self.err_node.elements[self.ele_start:]
+
+    def get_error_list(self, seg_id, pre=False):
+        return self.err_node.get_error_list(seg_id, pre)
+
+
+class error_html_pages(error_html):
+    """
+    Writes the HTML error output as a series of page files, with an index
+    page linking the pages and giving their error counts.
+
+    The pages are named after the index file: out.html is followed by
+    out.1.html, out.2.html, ...
+    """
+    batch_output = False
+
+    def __init__(self, errh, filename, term=('~', '*', '~', '\n'),
+                 page_size=None, per_st_loop=False, errors_only=False):
+        """
+        @param filename: index page file name
+        @type filename: string
+        @param term: tuple of x12 terminators used
+        @type term: tuple(string, string, string, string)
+        @param page_size: Start a new page after this many segments
+        @type page_size: int
+        @param per_st_loop: Start a new page at each ST loop
+        @type per_st_loop: boolean
+        @param errors_only: Only write segments with errors
+        @type errors_only: boolean
+        """
+        error_html.__init__(self, errh, None, term)
+        self.filename = filename
+        (self.page_root, self.page_ext) = os.path.splitext(filename)
+        if not self.page_ext:
+            self.page_ext = '.html'
+        self.page_size = page_size
+        self.per_st_loop = per_st_loop
+        self.errors_only = errors_only
+        self.analysis_date = None
+        self.pages = []
+        self.new_st_loop = False
+
+    def header(self):
+        """
+        The pages are opened as segments are written
+        """
+        self.analysis_date = time.strftime('%m/%d/%Y %H:%M:%S')
+
+    def footer(self):
+        """
+        Finish the last page, and write the index page
+        """
+        if self.fd is None:
+            self._new_page()
+        self.pages[-1]['errors'] += self._trailer_errors()
+        self._close_page(False)
+        self.fd = open(self.filename, 'w')
+        self._head('X12N Error Analysis')
+        self.fd.write('<h1>X12N Error Analysis</h1>\n<h3>Analysis Date: %s</h3><p>\n' %
+                      (self.analysis_date))
+        self.fd.write('<table>\n')
+        self.fd.write('<tr><th>Page</th><th>Lines</th><th>Segments</th>'
+                      '<th>Segments with Errors</th></tr>\n')
+        for (i, page) in enumerate(self.pages):
+            if page['first_line'] is None:
+                lines = ''
+            else:
+                lines = '%i-%i' % (page['first_line'], page['last_line'])
+            self.fd.write('<tr><td><a href="%s">Page %i</a></td><td>%s</td><td>%i</td>'
+                          '<td>%i</td></tr>\n' % (os.path.basename(page['filename']),
+                          i + 1, lines, page['segments'], page['errors']))
+        self.fd.write('</table>\n')
+        self.fd.write('<p>Total segments with errors: %i</p>\n' %
+                      (sum([page['errors'] for page in self.pages])))
+        self._tail()
+        self.fd.close()
+        self.fd = None
+
+    def gen_seg(self, seg_data, src, err_node_list=None):
+        """
+        Write the segment to the current page, starting a new page if needed
+        @param seg_data: data segment instance
+        @param err_node_list: error nodes of the segment
+        @type err_node_list: list
+        """
+        err_node_list = self._get_err_nodes(err_node_list)
+        seg_id = seg_data.get_seg_id()
+        if seg_id == 'ST':
+            self.new_st_loop = True
+        has_errors = self._has_errors(seg_id, err_node_list)
+        if self.errors_only and not has_errors:
+            return
+        if self.fd is None \
+                or (self.per_st_loop and self.new_st_loop and self.pages[-1]['segments'] > 0) \
+                or (self.page_size and self.pages[-1]['segments'] >= self.page_size):
+            self._new_page()
+        self.new_st_loop = False
+        error_html.gen_seg(self, seg_data, src, err_node_list)
+        page = self.pages[-1]
+        if page['first_line'] is None:
+            page['first_line'] = src.cur_line
+        page['last_line'] = src.cur_line
+        page['segments'] += 1
+        if has_errors:
+            page['errors'] += 1
+
+    def _has_errors(self, seg_id, err_node_list):
+        """
+        @return: Are errors written for the segment
+        @rtype: boolean
+        """
+        for err_node in err_node_list:
+            if err_node.get_error_list(seg_id, False):
+                return True
+            for ele in err_node.elements:
+                for (err_cde, err_str, err_val) in ele.get_error_list(seg_id, False):
+                    if not (seg_id == 'GE' and 'GS' in err_str):
+                        return True
+        return False
+
+    def _page_filename(self, page_num):
+        """
+        @rtype: string
+        """
+        return '%s.%i%s' % (self.page_root, page_num, self.page_ext)
+
+    def _new_page(self):
+        """
+        Close the current page, and start the next
+        """
+        if self.fd is not None:
+            self._close_page(True)
+        page_num = len(self.pages) + 1
+        filename = self._page_filename(page_num)
+        self.pages.append({'filename': filename, 'first_line': None,
+                           'last_line': None, 'segments': 0, 'errors': 0})
+        self.fd = open(filename, 'w')
+        self._head('X12N Error Analysis - Page %i' % (page_num))
+        self.fd.write('<h1>X12N Error Analysis - Page %i</h1>\n<h3>Analysis Date: %s</h3><p>\n' %
+                      (page_num, self.analysis_date))
+        self._nav(page_num, False)
+        self.fd.write('<div class="segs" style="">\n')
+
+    def _close_page(self, has_next):
+        """
+        @param has_next: Does another page follow
+        @type has_next: boolean
+        """
+        self.fd.write('</div>\n')
+        self._nav(len(self.pages), has_next)
+        self._tail()
+        self.fd.close()
+        self.fd = None
+
+    def _nav(self, page_num, has_next):
+        """
+        Write the links to the index, and the previous and next pages
+        """
+        links = ['<a href="%s">Index</a>' % (os.path.basename(self.filename))]
+        if page_num > 1:
+            links.append('<a href="%s">Previous</a>' %
+                         (os.path.basename(self._page_filename(page_num - 1))))
+        if has_next:
+            links.append('<a href="%s">Next</a>' %
+                         (os.path.basename(self._page_filename(page_num + 1))))
+        self.fd.write('<p class="nav">%s</p>\n' % (' | '.join(links)))
+
+
 def seg_str(seg, seg_term, ele_term, subele_term, eol=''):
     """
     Join a list of elements
@@ -12,6 +12,10 @@
 Visitor - Visits an error_handler composite
 """
 
+# Size of a deferred acknowledgement body kept in memory before it is
+# spooled to a temporary file
+SPOOL_MAX_SIZE = 1024 * 1024
+
 
 class error_visitor(object):
     """
@@ -23,6 +27,14 @@ class error_visitor(object):
         """
         pass
 
+    def defer_envelope(self):
+        """
+        Called when the visitor is fed the loops as the source is read.
+        L{visit_root_pre} is then called at the first GS loop, before the
+        last ISA and GS loops are known.
+        """
+        pass
+
     def visit_root_pre(self, errh):
         """
         @param errh: Error handler
@@ -10,22 +10,88 @@
 """
 Interface to a X12N IG Map
 """
+import hashlib
 import logging
+import os
 import os.path
+import pickle
 import sys
 import re
+import tempfile
 import xml.etree.cElementTree as et
+from io import BytesIO
 from pkg_resources import resource_stream
 
 # Intrapackage imports
 from .errors import EngineError
 from . import codes
 from . import dataele
+from . import nodeCounter
 from . import path
 from . import validation
-from .syntax import is_syntax_valid
+from .syntax import is_syntax_valid, SyntaxRule
+from .version import __version__
 
 MAXINT = 2147483647
+# Bump when the layout of a compiled map changes
+MAP_CACHE_FORMAT = 8
+
+# os.rename does not overwrite an existing file on Windows.  Python 2 has no
+# os.replace.
+_replace_file = getattr(os, 'replace', os.rename)
+
+
+def _freeze_children(node):
+    """
+    Fix the children of a loop or map root, in position order, once the
+    node is loaded.  Within a position, loops come before segments.
+
+    @param node: Loop or map root node
+    @type node: L{node<map_if.x12_node>}
+    """
+    node.child_nodes = tuple(child for ord1 in sorted(node.pos_map)
+                             for child in node.pos_map[ord1])
+    node.child_count = len(node.child_nodes)
+    node.first_node = node.child_nodes[0] if node.child_nodes else None
+    if node.first_node is not None and node.first_node.is_segment():
+        node.first_seg = node.first_node
+    else:
+        node.first_seg = None
+
+
+def _build_walk_index(node):
+    """
+    Index the children of a loop or map root by segment ID for the walker.
+
+    For each segment ID, keep the children, in position order, that the
+    walker must visit: the segments and loops the segment could start, and
+    the required children that may be reported missing.  Any other child
+    can neither match nor raise an error.
+
+    @param node: Loop or map root node
+    @type node: L{node<map_if.x12_node>}
+    """
+    children = node.child_nodes
+    candidates = {}
+    always = set()
+    for (i, child) in enumerate(children):
+        if child.is_segment():
+            candidates.setdefault(child.id, set()).add(i)
+            if child.usage == 'R':
+                always.add(i)
+        elif child.is_loop():
+            for seg_id in child.first_seg_ids:
+                candidates.setdefault(seg_id, set()).add(i)
+            if child.may_be_missing:
+                always.add(i)
+
+    def _entries(idx_set):
+        idx_list = sorted(idx_set)
+        return (tuple(children[i].pos for i in idx_list),
+                tuple(children[i] for i in idx_list))
+    node.walk_index = dict((seg_id, _entries(idx_set | always))
+                           for (seg_id, idx_set) in candidates.items())
+    node.walk_default = _entries(always)
 
 
 class x12_node(object):
@@ -40,6 +106,13 @@ class x12_node(object):
         self.path = ''
         self._x12path = None
         self._fullpath = None
+        self._counter_id = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Path IDs are only valid within the process that interned them
+        state['_counter_id'] = None
+        return state
 
     def __eq__(self, other):
         if isinstance(other, x12_node):
@@ -137,6 +210,17 @@ class x12_node(object):
 
     x12path = property(_get_x12_path, None, None)
 
+    def _get_counter_id(self):
+        """
+        @return: Process-wide path ID used by the node counter
+        @rtype: int
+        """
+        if self._counter_id is None:
+            self._counter_id = nodeCounter.get_path_id(self.get_path())
+        return self._counter_id
+
+    counter_id = property(_get_counter_id, None, None)
+
     def is_first_seg_in_loop(self):
         """
         @rtype: boolean
@@ -181,10 +265,15 @@ class map_if(x12_node):
     """
     Map file interface
     """
-    def __init__(self, eroot, param, base_path=None):
+    def __init__(self, eroot, param, base_path=None, ext_codes=None, data_elements=None):
         """
         @param eroot: ElementTree root
         @param param: map of parameters
+        @param ext_codes: Shared external codes.  If None, codes.xml is loaded
+        @type ext_codes: L{codes.ExternalCodes}
+        @param data_elements: Shared data elements.  If None, dataele.xml is
+            loaded
+        @type data_elements: L{dataele.DataElements}
         """
         x12_node.__init__(self)
         self.children = None
@@ -194,9 +283,13 @@ class map_if(x12_node):
         #self.cur_iter_node = self
         self.param = param
         #global codes
-        self.ext_codes = codes.ExternalCodes(base_path,
-                                             param.get('exclude_external_codes'))
-        self.data_elements = dataele.DataElements(base_path)
+        if ext_codes is None:
+            ext_codes = codes.ExternalCodes(base_path,
+                                            param.get('exclude_external_codes'))
+        self.ext_codes = ext_codes
+        if data_elements is None:
+            data_elements = dataele.DataElements(base_path)
+        self.data_elements = data_elements
 
         self.id = eroot.get('xid')
 
@@ -224,8 +317,17 @@ class map_if(x12_node):
                 self.pos_map[seg_node.pos].append(seg_node)
             except KeyError:
                 self.pos_map[seg_node.pos] = [seg_node]
+        _freeze_children(self)
+        _build_walk_index(self)
+        self._build_path_index()
         self.icvn = self._get_icvn()
 
+    def __getstate__(self):
+        state = x12_node.__getstate__(self)
+        # Run-time parameters are bound again when a compiled map is loaded
+        state['param'] = None
+        return state
+
     def _get_icvn(self):
         """
         Get the Interchange version of this map
@@ -242,9 +344,8 @@ class map_if(x12_node):
 
     def debug_print(self):
         sys.stdout.write(self.__repr__())
-        for ord1 in sorted(self.pos_map):
-            for node in self.pos_map[ord1]:
-                node.debug_print()
+        for node in self.child_nodes:
+            node.debug_print()
 
     def __eq__(self, other):
         return self.id == other.id
@@ -253,27 +354,16 @@ class map_if(x12_node):
         return (self.id).__hash__()
 
     def __len__(self):
-        i = 0
-        for ord1 in sorted(self.pos_map):
-            i += len(self.pos_map[ord1])
-        return i
+        return self.child_count
 
     def get_child_count(self):
         return self.__len__()
 
     def get_first_node(self):
-        pos_keys = sorted(self.pos_map)
-        if len(pos_keys) > 0:
-            return self.pos_map[pos_keys[0]][0]
-        else:
-            return None
+        return self.first_node
 
     def get_first_seg(self):
-        first = self.get_first_node()
-        if first.is_segment():
-            return first
-        else:
-            return None
+        return self.first_seg
 
     def __repr__(self):
         """
@@ -299,40 +389,99 @@ class map_if(x12_node):
         """
         raise EngineError('map_if.get_child_node_by_idx is not a valid call')
 
+    def _build_path_index(self):
+        """
+        Index the loop and segment nodes by normalized path.  Loop IDs are
+        upper cased, segment IDs are kept, and a qualified segment is also
+        keyed by each value of its unique key element, e.g. REF[EV].  As
+        with a scan of the children, the first sibling matching an ID wins.
+        """
+        self.path_index = {}
+        self._index_child_paths(self, '')
+
+    def _index_child_paths(self, node, prefix):
+        is_root = node is self
+        seen = set()
+        for child in node.child_nodes:
+            if child.is_loop():
+                key = prefix + '/' + child.id.upper()
+                self.path_index.setdefault(key, child)
+                if key not in seen:
+                    seen.add(key)
+                    self._index_child_paths(child, key)
+            elif child.is_segment():
+                if is_root:
+                    key = prefix + '/' + child.id.upper()
+                    self.path_index.setdefault(key, child)
+                    seen.add(key)
+                    continue
+                self.path_index.setdefault(prefix + '/' + child.id, child)
+                for id_val in child.get_unique_key_codes():
+                    self.path_index.setdefault('%s/%s[%s]' % (prefix, child.id, id_val), child)
+
+    def get_node_by_path_index(self, spath):
+        """
+        Look up a loop or segment node in the path index
+
+        @param spath: Absolute path string; /ISA_LOOP/GS_LOOP/GS
+        @type spath: string
+        @return: matching node, or None if not indexed
+        @rtype: L{node<map_if.x12_node>}
+        """
+        pathl = spath.split('/')
+        if len(pathl) < 2 or pathl[0] != '':
+            return None
+        if len(pathl) == 2:
+            return self.path_index.get('/' + pathl[1].upper())
+        prefix = '/' + '/'.join([p.upper() for p in pathl[1:-1]])
+        node = self.path_index.get(prefix + '/' + pathl[-1])
+        if node is not None:
+            return node
+        node = self.path_index.get(prefix + '/' + pathl[-1].upper())
+        if node is not None and node.is_loop():
+            return node
+        return None
+
     def getnodebypath(self, spath):
         """
         @param spath: Path string; /1000/2000/2000A/NM102-3
         @type spath: string
         """
+        node = self.get_node_by_path_index(spath)
+        if node is not None:
+            return node
         pathl = spath.split('/')[1:]
         if len(pathl) == 0:
             return None
         #logger.debug('%s %s %s' % (self.base_name, self.id, pathl[1]))
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.id.lower() == pathl[0].lower():
-                    if len(pathl) == 1:
-                        return child
-                    else:
-                        return child.getnodebypath(str.join('/', pathl[1:]))
+        for child in self.child_nodes:
+            if child.id.lower() == pathl[0].lower():
+                if len(pathl) == 1:
+                    return child
+                else:
+                    return child.getnodebypath(str.join('/', pathl[1:]))
         raise EngineError('getnodebypath failed. Path "%s" not found' % spath)
 
     def getnodebypath2(self, path_str):
         """
         @param path: Path string; /1000/2000/2000A/NM102-3
-        @type path: string
+        @type path: string or L{path<path.X12Path>}
         """
+        if isinstance(path_str, path.X12Path):
+            path_str = path_str.format()
         x12path = path.X12Path(path_str)
         if x12path.empty():
             return None
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.id.upper() == x12path.loop_list[0]:
-                    if len(x12path.loop_list) == 1:
-                        return child
-                    else:
-                        del x12path.loop_list[0]
-                        return child.getnodebypath2(x12path.format())
+        node = self._get_node_by_x12path_index(x12path)
+        if node is not None:
+            return node
+        for child in self.child_nodes:
+            if child.id.upper() == x12path.loop_list[0]:
+                if len(x12path.loop_list) == 1:
+                    return child
+                else:
+                    del x12path.loop_list[0]
+                    return child.getnodebypath2(x12path.format())
         raise EngineError(
             'getnodebypath2 failed. Path "%s" not found' % path_str)
 
@@ -342,14 +491,51 @@ class map_if(x12_node):
         """
         return True
 
+    def _get_node_by_x12path_index(self, x12path):
+        """
+        @type x12path: L{path<path.X12Path>}
+        @return: matching node, or None if not indexed
+        """
+        loop_list = x12path.loop_list
+        if len(loop_list) == 0:
+            return None
+        if len(loop_list) == 1:
+            return self.path_index.get('/' + loop_list[0])
+        key = '/' + loop_list[0] + ''.join(['/' + p.upper() for p in loop_list[1:]])
+        node = self.path_index.get(key)
+        if node is None or not node.is_loop():
+            return None
+        if x12path.seg_id is None:
+            return node
+        if x12path.id_val is None:
+            key += '/' + x12path.seg_id
+        else:
+            key += '/%s[%s]' % (x12path.seg_id, x12path.id_val)
+        node = self.path_index.get(key)
+        if node is None or not node.is_segment():
+            return None
+        if x12path.ele_idx is None:
+            return node
+        ele = node.get_child_node_by_ordinal(x12path.ele_idx)
+        if x12path.subele_idx is None:
+            return ele
+        return ele.get_child_node_by_ordinal(x12path.subele_idx)
+
+    def get_walk_candidates(self, seg_id):
+        """
+        @return: positions and child nodes the walker must visit for a
+            segment ID, in position order
+        @rtype: (tuple(int), tuple(L{node<map_if.x12_node>}))
+        """
+        return self.walk_index.get(seg_id, self.walk_default)
+
     def reset_child_count(self):
         """
         Set cur_count of child nodes to zero
         """
         raise DeprecationWarning('Moved to nodeCounter')
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                child.reset_cur_count()
+        for child in self.child_nodes:
+            child.reset_cur_count()
 
     def reset_cur_count(self):
         """
@@ -363,11 +549,10 @@ class map_if(x12_node):
 
     def loop_segment_iterator(self):
         yield self
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_loop() or child.is_segment():
-                    for c in child.loop_segment_iterator():
-                        yield c
+        for child in self.child_nodes:
+            if child.is_loop() or child.is_segment():
+                for c in child.loop_segment_iterator():
+                    yield c
 
 
 ############################################################
@@ -429,6 +614,8 @@ class loop_if(x12_node):
             except KeyError:
                 self.pos_map[seg_node.pos] = [seg_node]
 
+        _freeze_children(self)
+
         # For the segments with duplicate ordinals, adjust the path to be unique
         for ord1 in sorted(self.pos_map):
             if len(self.pos_map[ord1]) > 1:
@@ -437,17 +624,29 @@ class loop_if(x12_node):
                     if id_elem is not None:
                         seg_node.path = seg_node.path + '[' + id_elem.valid_codes[0] + ']'
 
+        # Segment IDs that can start this loop, and whether the walker may
+        # report it, or a loop it starts with, as missing
+        first = self.get_first_node()
+        if first is None:
+            self.first_seg_ids = frozenset()
+            self.may_be_missing = False
+        elif first.is_segment():
+            self.first_seg_ids = frozenset([first.id])
+            self.may_be_missing = self.usage == 'R'
+        else:
+            child_loops = [child for child in self.childIterator() if child.is_loop()]
+            self.first_seg_ids = frozenset().union(
+                *[child.first_seg_ids for child in child_loops])
+            self.may_be_missing = any(child.may_be_missing for child in child_loops)
+        _build_walk_index(self)
+
     def debug_print(self):
         sys.stdout.write(self.__repr__())
-        for ord1 in sorted(self.pos_map):
-            for node in self.pos_map[ord1]:
-                node.debug_print()
+        for node in self.child_nodes:
+            node.debug_print()
 
     def __len__(self):
-        i = 0
-        for ord1 in sorted(self.pos_map):
-            i += len(self.pos_map[ord1])
-        return i
+        return self.child_count
 
     def __repr__(self):
         """
@@ -478,23 +677,21 @@ class loop_if(x12_node):
         return self.parent
 
     def get_first_node(self):
-        pos_keys = sorted(self.pos_map)
-        if len(pos_keys) > 0:
-            return self.pos_map[pos_keys[0]][0]
-        else:
-            return None
+        return self.first_node
 
     def get_first_seg(self):
-        first = self.get_first_node()
-        if first.is_segment():
-            return first
-        else:
-            return None
+        return self.first_seg
 
     def childIterator(self):
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                yield child
+        return iter(self.child_nodes)
+
+    def get_walk_candidates(self, seg_id):
+        """
+        @return: positions and child nodes the walker must visit for a
+            segment ID, in position order
+        @rtype: (tuple(int), tuple(L{node<map_if.x12_node>}))
+        """
+        return self.walk_index.get(seg_id, self.walk_default)
 
     def getnodebypath(self, spath):
         """
@@ -505,26 +702,25 @@ class loop_if(x12_node):
         pathl = spath.split('/')
         if len(pathl) == 0:
             return None
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_loop():
-                    if child.id.upper() == pathl[0].upper():
-                        if len(pathl) == 1:
-                            return child
-                        else:
-                            return child.getnodebypath(str.join('/', pathl[1:]))
-                elif child.is_segment() and len(pathl) == 1:
-                    if pathl[0].find('[') == -1:  # No id to match
-                        if pathl[0] == child.id:
-                            return child
+        for child in self.child_nodes:
+            if child.is_loop():
+                if child.id.upper() == pathl[0].upper():
+                    if len(pathl) == 1:
+                        return child
                     else:
-                        seg_id = pathl[0][0:pathl[0].find('[')]
-                        id_val = pathl[0][pathl[0].find('[')
-                                          + 1:pathl[0].find(']')]
-                        if seg_id == child.id:
-                            possible = child.get_unique_key_id_element(id_val)
-                            if possible is not None:
-                                return child
+                        return child.getnodebypath(str.join('/', pathl[1:]))
+            elif child.is_segment() and len(pathl) == 1:
+                if pathl[0].find('[') == -1:  # No id to match
+                    if pathl[0] == child.id:
+                        return child
+                else:
+                    seg_id = pathl[0][0:pathl[0].find('[')]
+                    id_val = pathl[0][pathl[0].find('[')
+                                      + 1:pathl[0].find(']')]
+                    if seg_id == child.id:
+                        possible = child.get_unique_key_id_element(id_val)
+                        if possible is not None:
+                            return child
         raise EngineError('getnodebypath failed. Path "%s" not found' % spath)
 
     def getnodebypath2(self, path_str):
@@ -538,26 +734,25 @@ class loop_if(x12_node):
         x12path = path.X12Path(path_str)
         if x12path.empty():
             return None
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_loop() and len(x12path.loop_list) > 0:
-                    if child.id.upper() == x12path.loop_list[0].upper():
-                        if len(x12path.loop_list) == 1 and x12path.seg_id is None:
-                            return child
-                        else:
-                            del x12path.loop_list[0]
-                            return child.getnodebypath2(x12path.format())
-                elif child.is_segment() and len(x12path.loop_list) == 0 and x12path.seg_id is not None:
-                    if x12path.id_val is None:
-                        if x12path.seg_id == child.id:
-                            return child.getnodebypath2(x12path.format())
+        for child in self.child_nodes:
+            if child.is_loop() and len(x12path.loop_list) > 0:
+                if child.id.upper() == x12path.loop_list[0].upper():
+                    if len(x12path.loop_list) == 1 and x12path.seg_id is None:
+                        return child
                     else:
-                        seg_id = x12path.seg_id
-                        id_val = x12path.id_val
-                        if seg_id == child.id:
-                            possible = child.get_unique_key_id_element(id_val)
-                            if possible is not None:
-                                return child.getnodebypath2(x12path.format())
+                        del x12path.loop_list[0]
+                        return child.getnodebypath2(x12path.format())
+            elif child.is_segment() and len(x12path.loop_list) == 0 and x12path.seg_id is not None:
+                if x12path.id_val is None:
+                    if x12path.seg_id == child.id:
+                        return child.getnodebypath2(x12path.format())
+                else:
+                    seg_id = x12path.seg_id
+                    id_val = x12path.id_val
+                    if seg_id == child.id:
+                        possible = child.get_unique_key_id_element(id_val)
+                        if possible is not None:
+                            return child.getnodebypath2(x12path.format())
         raise EngineError(
             'getnodebypath2 failed. Path "%s" not found' % path_str)
 
@@ -576,10 +771,9 @@ class loop_if(x12_node):
         @rtype: integer
         """
         i = 0
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_segment():
-                    i += 1
+        for child in self.child_nodes:
+            if child.is_segment():
+                i += 1
         return i
 
     def is_loop(self):
@@ -594,8 +788,7 @@ class loop_if(x12_node):
         @return: Is the segment a match to this loop?
         @rtype: boolean
         """
-        pos_keys = sorted(self.pos_map)
-        child = self.pos_map[pos_keys[0]][0]
+        child = self.first_node
         if child.is_loop():
             return child.is_match(seg_data)
         elif child.is_segment():
@@ -641,9 +834,8 @@ class loop_if(x12_node):
         Set cur_count of child nodes to zero
         """
         raise DeprecationWarning('Moved to nodeCounter')
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                child.reset_cur_count()
+        for child in self.child_nodes:
+            child.reset_cur_count()
 
     def reset_cur_count(self):
         """
@@ -673,11 +865,10 @@ class loop_if(x12_node):
 
     def loop_segment_iterator(self):
         yield self
-        for ord1 in sorted(self.pos_map):
-            for child in self.pos_map[ord1]:
-                if child.is_loop() or child.is_segment():
-                    for c in child.loop_segment_iterator():
-                        yield c
+        for child in self.child_nodes:
+            if child.is_loop() or child.is_segment():
+                for c in child.loop_segment_iterator():
+                    yield c
 
 
 class segment_if(x12_node):
@@ -720,6 +911,7 @@ class segment_if(x12_node):
             syn_list = self._split_syntax(s.text)
             if syn_list is not None:
                 self.syntax.append(syn_list)
+        self.syntax_rules = tuple([SyntaxRule(syn) for syn in self.syntax])
 
         children_map = {}
         for e in elem.findall('element'):
@@ -739,6 +931,7 @@ class segment_if(x12_node):
             elif children_map[seq].tag == 'composite':
                 self.children.append(composite_if(
                     self.root, self, children_map[seq]))
+        self._compile_validation_plan()
 
     def debug_print(self):
         sys.stdout.write(self.__repr__())
@@ -832,7 +1025,7 @@ class segment_if(x12_node):
                     and self.children[0].get_data_type() == 'ID' \
                     and self.children[0].usage == 'R' \
                     and len(self.children[0].valid_codes) > 0 \
-                    and seg.get_value('01') not in self.children[0].valid_codes:
+                    and seg.get_value_at(0) not in self.children[0].valid_codes_set:
                 #logger.debug('is_match: %s %s' % (seg.get_seg_id(), seg[1]), self.children[0].valid_codes)
                 return False
             # Special Case for 820
@@ -840,7 +1033,7 @@ class segment_if(x12_node):
                     and self.children[1].is_element() \
                     and self.children[1].get_data_type() == 'ID' \
                     and len(self.children[1].valid_codes) > 0 \
-                    and seg.get_value('02') not in self.children[1].valid_codes:
+                    and seg.get_value_at(1) not in self.children[1].valid_codes_set:
                 #logger.debug('is_match: %s %s' % (seg.get_seg_id(), seg[1]), self.children[0].valid_codes)
                 return False
             # Special Case for 999 CTX
@@ -849,16 +1042,16 @@ class segment_if(x12_node):
                     and self.children[0].is_composite() \
                     and self.children[0].children[0].get_data_type() == 'AN' \
                     and len(self.children[0].children[0].valid_codes) > 0 \
-                    and seg.get_value('01-1') not in self.children[0].children[0].valid_codes:
+                    and seg.get_value_at(0, 0) not in self.children[0].children[0].valid_codes_set:
                 return False
             elif self.children[0].is_composite() \
                     and self.children[0].children[0].get_data_type() == 'ID' \
                     and len(self.children[0].children[0].valid_codes) > 0 \
-                    and seg.get_value('01-1') not in self.children[0].children[0].valid_codes:
+                    and seg.get_value_at(0, 0) not in self.children[0].children[0].valid_codes_set:
                 return False
             elif seg.get_seg_id() == 'HL' and self.children[2].is_element() \
                     and len(self.children[2].valid_codes) > 0 \
-                    and seg.get_value('03') not in self.children[2].valid_codes:
+                    and seg.get_value_at(2) not in self.children[2].valid_codes_set:
                 return False
             else:
                 return True
@@ -882,7 +1075,7 @@ class segment_if(x12_node):
                     and self.children[0].get_data_type() == 'ID' \
                     and self.children[0].usage == 'R' \
                     and len(self.children[0].valid_codes) > 0:
-                if qual_code in self.children[0].valid_codes and seg_data.get_value('01') == qual_code:
+                if qual_code in self.children[0].valid_codes_set and seg_data.get_value_at(0) == qual_code:
                     return (True, qual_code, 1, None)
                 else:
                     return (False, None, None, None)
@@ -891,20 +1084,20 @@ class segment_if(x12_node):
                     and self.children[1].is_element() \
                     and self.children[1].get_data_type() == 'ID' \
                     and len(self.children[1].valid_codes) > 0:
-                if qual_code in self.children[1].valid_codes and seg_data.get_value('02') == qual_code:
+                if qual_code in self.children[1].valid_codes_set and seg_data.get_value_at(1) == qual_code:
                     return (True, qual_code, 2, None)
                 else:
                     return (False, None, None, None)
             elif self.children[0].is_composite() \
                     and self.children[0].children[0].get_data_type() == 'ID' \
                     and len(self.children[0].children[0].valid_codes) > 0:
-                if qual_code in self.children[0].children[0].valid_codes and seg_data.get_value('01-1') == qual_code:
+                if qual_code in self.children[0].children[0].valid_codes_set and seg_data.get_value_at(0, 0) == qual_code:
                     return (True, qual_code, 1, 1)
                 else:
                     return (False, None, None, None)
             elif seg_id == 'HL' and self.children[2].is_element() \
                     and len(self.children[2].valid_codes) > 0:
-                if qual_code in self.children[2].valid_codes and seg_data.get_value('03') == qual_code:
+                if qual_code in self.children[2].valid_codes_set and seg_data.get_value_at(2) == qual_code:
                     return (True, qual_code, 3, None)
                 else:
                     return (False, None, None, None)
@@ -929,6 +1122,29 @@ class segment_if(x12_node):
             return self.children[2]
         return None
 
+    def get_unique_key_codes(self):
+        """
+        @return: Values of id_val for which get_unique_key_id_element finds
+            an element
+        @rtype: list[string]
+        """
+        candidates = []
+        for (i, j) in ((0, None), (1, None), (0, 0), (2, None)):
+            try:
+                node = self.children[i] if j is None else self.children[i].children[j]
+            except (IndexError, AttributeError):
+                continue
+            if node.is_element():
+                candidates.extend(node.valid_codes)
+        codes = []
+        for id_val in candidates:
+            try:
+                if id_val not in codes and self.get_unique_key_id_element(id_val) is not None:
+                    codes.append(id_val)
+            except IndexError:
+                pass
+        return codes
+
     def get_unique_key_id_element(self, id_val):
         """
         Some segments, like REF, DTP, and DTP are duplicated.  They are matched using the value of an ID element.
@@ -936,16 +1152,16 @@ class segment_if(x12_node):
         """
 
         if self.children[0].is_element() and self.children[0].get_data_type() == 'ID' \
-                and len(self.children[0].valid_codes) > 0 and id_val in self.children[0].valid_codes:
+                and len(self.children[0].valid_codes) > 0 and id_val in self.children[0].valid_codes_set:
             return self.children[0]
         # Special Case for 820
         elif self.id == 'ENT' and self.children[1].is_element() and self.children[1].get_data_type() == 'ID' \
-                and len(self.children[1].valid_codes) > 0 and id_val in self.children[1].valid_codes:
+                and len(self.children[1].valid_codes) > 0 and id_val in self.children[1].valid_codes_set:
             return self.children[1]
         elif self.children[0].is_composite() and self.children[0].children[0].get_data_type() == 'ID' \
-                and len(self.children[0].children[0].valid_codes) > 0 and id_val in self.children[0].children[0].valid_codes:
+                and len(self.children[0].children[0].valid_codes) > 0 and id_val in self.children[0].children[0].valid_codes_set:
             return self.children[0].children[0]
-        elif self.id == 'HL' and self.children[2].is_element() and len(self.children[2].valid_codes) > 0 and id_val in self.children[2].valid_codes:
+        elif self.id == 'HL' and self.children[2].is_element() and len(self.children[2].valid_codes) > 0 and id_val in self.children[2].valid_codes_set:
             return self.children[2]
         return None
 
@@ -955,6 +1171,33 @@ class segment_if(x12_node):
         """
         return True
 
+    def _compile_validation_plan(self):
+        """
+        Resolve once the per-position checks made by is_valid.  Each step is
+        (ele_idx, ref_des, child_node, dtp_qualifier, type_codes, type_check):
+            - dtp_qualifier marks DTP02, whose value selects the type of DTP03
+            - type_codes are the date/time format codes of a 1250 element
+            - type_check is 'DTP' for DTP03, '1251' for a 1251 element checked
+              against the collected format codes, else None
+        """
+        plan = []
+        for i in range(len(self.children)):
+            m = [c for c in self.children if c.seq == i + 1]
+            child_node = m[0] if len(m) == 1 else None
+            type_codes = None
+            type_check = None
+            if child_node is not None and child_node.is_element():
+                if child_node.data_ele == '1250':
+                    type_codes = tuple(child_node.valid_codes)
+                if i == 2 and self.id == 'DTP':
+                    type_check = 'DTP'
+                elif child_node.data_ele == '1251':
+                    type_check = '1251'
+            plan.append((i, '%02i' % (i + 1), child_node,
+                         i == 1 and self.id == 'DTP', type_codes, type_check))
+        self._validation_plan = tuple(plan)
+        self._too_many_ref_des = '%02i' % (len(self.children) + 1)
+
     def is_valid(self, seg_data, errh):
         """
         @param seg_data: data segment instance
@@ -963,29 +1206,29 @@ class segment_if(x12_node):
         @rtype: boolean
         """
         valid = True
-        child_count = self.get_child_count()
-        if len(seg_data) > child_count:
+        plan = self._validation_plan
+        child_count = len(plan)
+        seg_len = len(seg_data)
+        if seg_len > child_count:
             #child_node = self.get_child_node_by_idx(child_count+1)
             err_str = 'Too many elements in segment "%s" (%s). Has %i, should have %i' % \
-                (self.name, seg_data.get_seg_id(), len(seg_data), child_count)
+                (self.name, seg_data.get_seg_id(), seg_len, child_count)
             #self.logger.error(err_str)
-            ref_des = '%02i' % (child_count + 1)
+            ref_des = self._too_many_ref_des
             err_value = seg_data.get_value(ref_des)
             errh.ele_error('3', err_str, err_value, ref_des)
             valid = False
 
         dtype = []
         type_list = []
-        for i in range(min(len(seg_data), child_count)):
-            #self.logger.debug('i=%i, len(seg_data)=%i / child_count=%i' % \
-            #   (i, len(seg_data), self.get_child_count()))
-            child_node = self.get_child_node_by_idx(i)
+        for (i, ref_des, child_node, dtp_qualifier, type_codes, type_check) in plan[:seg_len]:
+            if child_node is None:
+                child_node = self.get_child_node_by_idx(i)
             if child_node.is_composite():
                 # Validate composite
-                ref_des = '%02i' % (i + 1)
-                comp_data = seg_data.get(ref_des)
+                comp_data = seg_data.get_at(i)
                 subele_count = child_node.get_child_count()
-                if seg_data.ele_len(ref_des) > subele_count and child_node.usage != 'N':
+                if len(comp_data) > subele_count and child_node.usage != 'N':
                     subele_node = child_node.get_child_node_by_idx(
                         subele_count + 1)
                     err_str = 'Too many sub-elements in composite "%s" (%s)' % \
@@ -995,32 +1238,30 @@ class segment_if(x12_node):
                 valid &= child_node.is_valid(comp_data, errh)
             elif child_node.is_element():
                 # Validate Element
-                if i == 1 and seg_data.get_seg_id() == 'DTP' \
-                        and seg_data.get_value('02') in ('RD8', 'D8', 'D6', 'DT', 'TM'):
-                    dtype = [seg_data.get_value('02')]
-                if child_node.data_ele == '1250':
-                    type_list.extend(child_node.valid_codes)
-                ele_data = seg_data.get('%02i' % (i + 1))
-                if i == 2 and seg_data.get_seg_id() == 'DTP':
+                if dtp_qualifier:
+                    qual = seg_data.get_value_at(1)
+                    if qual in ('RD8', 'D8', 'D6', 'DT', 'TM'):
+                        dtype = [qual]
+                if type_codes is not None:
+                    type_list.extend(type_codes)
+                ele_data = seg_data.get_at(i)
+                if type_check == 'DTP':
                     valid &= child_node.is_valid(ele_data, errh, dtype)
-                elif child_node.data_ele == '1251' and len(type_list) > 0:
+                elif type_check == '1251' and len(type_list) > 0:
                     valid &= child_node.is_valid(ele_data, errh, type_list)
                 else:
                     valid &= child_node.is_valid(ele_data, errh)
 
-        for i in range(min(len(seg_data), child_count), child_count):
+        for (i, ref_des, child_node, dtp_qualifier, type_codes, type_check) in plan[seg_len:]:
             #missing required elements?
-            child_node = self.get_child_node_by_idx(i)
+            if child_node is None:
+                child_node = self.get_child_node_by_idx(i)
             valid &= child_node.is_valid(None, errh)
 
-        for syn in self.syntax:
-            (bResult, err_str) = is_syntax_valid(seg_data, syn)
-            if not bResult:
-                syn_type = syn[0]
-                if syn_type == 'E':
-                    errh.ele_error('10', err_str, None, syn[1])
-                else:
-                    errh.ele_error('2', err_str, None, syn[1])
+        for rule in self.syntax_rules:
+            if not rule.is_valid(seg_data):
+                errh.ele_error(rule.get_err_cde(), rule.get_err_str(seg_data),
+                               None, rule.get_ref_des())
                 valid &= False
 
         return valid
@@ -1125,6 +1366,23 @@ class element_if(x12_node):
             self.external_codes = v.get('external')
             for c in v.findall('code'):
                 self.valid_codes.append(c.text)
+        # For membership tests.  valid_codes keeps the map order
+        self.valid_codes_set = frozenset(self.valid_codes)
+
+        # Resolve the data element characteristics once.  An undefined
+        # data element fails the map load, unless the element is Not Used
+        # and so never checked against them
+        try:
+            data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
+        except EngineError:
+            if self.usage != 'N':
+                raise EngineError('Element %s: Data Element "%s" is not defined' % (
+                    self.refdes, self.data_ele))
+            data_ele = {'data_type': None, 'min_len': None, 'max_len': None, 'name': None}
+        self.data_type = data_ele['data_type']
+        self.min_len = data_ele['min_len']
+        self.max_len = data_ele['max_len']
+        self.data_element_name = data_ele['name']
 
     def debug_print(self):
         sys.stdout.write(self.__repr__())
@@ -1135,7 +1393,6 @@ class element_if(x12_node):
         """
         @rtype: string
         """
-        data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
         out = '%s "%s"' % (self.refdes, self.name)
         if self.data_ele:
             out += '  data_ele: %s' % (self.data_ele)
@@ -1143,8 +1400,8 @@ class element_if(x12_node):
             out += '  usage: %s' % (self.usage)
         if self.seq:
             out += '  seq: %i' % (self.seq)
-        out += '  %s(%i, %i)' % (data_ele['data_type'], data_ele[
-            'min_len'], data_ele['max_len'])
+        if self.data_type is not None:
+            out += '  %s(%i, %i)' % (self.data_type, self.min_len, self.max_len)
         if self.external_codes:
             out += '   external codes: %s' % (self.external_codes)
         out += '\n'
@@ -1168,7 +1425,7 @@ class element_if(x12_node):
         """
         #if not self.valid_codes:
         #    return True
-        if code in self.valid_codes:
+        if code in self.valid_codes_set:
             return True
         return False
 
@@ -1225,10 +1482,9 @@ class element_if(x12_node):
             return False
 
         elem_val = elem.get_value()
-        data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
-        data_type = data_ele['data_type']
-        min_len = data_ele['min_len']
-        max_len = data_ele['max_len']
+        data_type = self.data_type
+        min_len = self.min_len
+        max_len = self.max_len
         valid = True
 # Validate based on data_elem_num
 # Then, validate on more specific criteria
@@ -1322,7 +1578,7 @@ class element_if(x12_node):
         bValidCode = False
         if len(self.valid_codes) == 0 and self.external_codes is None:
             bValidCode = True
-        if elem_val in self.valid_codes:
+        if elem_val in self.valid_codes_set:
             bValidCode = True
         if self.external_codes is not None and \
                 self.root.ext_codes.isValid(self.external_codes, elem_val):
@@ -1337,28 +1593,7 @@ class element_if(x12_node):
     def get_data_type(self):
         """
         """
-        data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
-        return data_ele['data_type']
-
-    @property
-    def data_type(self):
-        data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
-        return data_ele['data_type']
-
-    @property
-    def min_len(self):
-        data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
-        return data_ele['min_len']
-
-    @property
-    def max_len(self):
-        data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
-        return data_ele['max_len']
-
-    @property
-    def data_element_name(self):
-        data_ele = self.root.data_elements.get_by_elem_num(self.data_ele)
-        return data_ele['name']
+        return self.data_type
 
     def get_seg_count(self):
         """
@@ -1515,15 +1750,24 @@ class composite_if(x12_node):
         return True
 
 
-def load_map_file(map_file, param, map_path=None):
+def load_map_file(map_file, param, map_path=None, ext_codes=None, data_elements=None):
     """
     Create the map object from a file
+
+    If the parameter map_cache_path is set, the built map is pickled to that
+    directory, keyed by a hash of the map, codes and data element files, and
+    later calls load the pickle instead of parsing the XML.
+
     @param map_file: absolute path for file
     @type map_file: string
     @rtype: pyx12.map_if
     @param map_path: Override directory containing map xml files.  If None,
         uses package resource folder
     @type map_path: string
+    @param ext_codes: Shared external codes
+    @type ext_codes: L{codes.ExternalCodes}
+    @param data_elements: Shared data elements
+    @type data_elements: L{dataele.DataElements}
     """
     logger = logging.getLogger('pyx12')
     if map_path is not None:
@@ -1532,15 +1776,29 @@ def load_map_file(map_file, param, map_path=None):
             raise OSError(2, "Map path does not exist", map_path)
         if not os.path.isdir(map_path):
             raise OSError(2, "Pyx12 map file '{}' does not exist in map path".format(map_file), map_path)
-        map_fd = open(os.path.join(map_path, map_file))
+        map_fd = open(os.path.join(map_path, map_file), 'rb')
     else:
         logger.debug("Looking for map file '{}' in pkg_resources".format(map_file))
         map_fd = resource_stream(__name__, os.path.join('map', map_file))
+    cache_path = param.get('map_cache_path')
+    cache_file = None
+    if cache_path is not None:
+        map_data = map_fd.read()
+        map_fd.close()
+        map_fd = BytesIO(map_data)
+        cache_file = _get_map_cache_file(cache_path, map_file, map_data, param, map_path)
+        imap = _read_map_cache(cache_file, param)
+        if imap is not None:
+            if ext_codes is not None:
+                imap.ext_codes = ext_codes
+            if data_elements is not None:
+                imap.data_elements = data_elements
+            return imap
     imap = None
     try:
         logger.debug('Create map from %s' % (map_file))
         etree = et.parse(map_fd)
-        imap = map_if(etree.getroot(), param, map_path)
+        imap = map_if(etree.getroot(), param, map_path, ext_codes, data_elements)
     except AssertionError:
         logger.error('Load of map file failed: %s' % (map_file))
         raise
@@ -1548,4 +1806,74 @@ def load_map_file(map_file, param, map_path=None):
         raise
         #raise EngineError('Load of map file failed: %s' % (map_file))
     map_fd.close()
+    if cache_file is not None:
+        _write_map_cache(cache_file, imap)
+    return imap
+
+
+def _get_map_cache_file(cache_path, map_file, map_data, param, map_path=None):
+    """
+    Get the compiled map file name.  The hash covers everything the built
+    map depends on.
+
+    @rtype: string
+    """
+    digest = hashlib.sha1(map_data)
+    for res_file in ('codes.xml', 'dataele.xml'):
+        if map_path is not None:
+            with open(os.path.join(map_path, res_file), 'rb') as fd:
+                digest.update(fd.read())
+        else:
+            fd = resource_stream(__name__, os.path.join('map', res_file))
+            digest.update(fd.read())
+            fd.close()
+    digest.update(repr((__version__, MAP_CACHE_FORMAT, sys.version_info[:2],
+        param.get('exclude_external_codes'))).encode('ascii'))
+    return os.path.join(cache_path, '%s.%s.pickle' % (map_file, digest.hexdigest()))
+
+
+def _read_map_cache(cache_file, param):
+    """
+    @return: the compiled map, or None if not cached or unreadable
+    @rtype: pyx12.map_if
+    """
+    logger = logging.getLogger('pyx12')
+    if not os.path.isfile(cache_file):
+        return None
+    try:
+        with open(cache_file, 'rb') as fd:
+            imap = pickle.load(fd)
+    except Exception:
+        logger.warning('Could not read compiled map %s' % (cache_file))
+        return None
+    if not isinstance(imap, map_if):
+        return None
+    logger.debug('Loaded compiled map %s' % (cache_file))
+    imap.param = param
     return imap
+
+
+def _write_map_cache(cache_file, imap):
+    """
+    Write the compiled map.  The file is renamed into place so concurrent
+    readers never see a partial file.
+    """
+    logger = logging.getLogger('pyx12')
+    cache_path = os.path.dirname(cache_file)
+    try:
+        if not os.path.isdir(cache_path):
+            os.makedirs(cache_path)
+        (fd, tmp_file) = tempfile.mkstemp(dir=cache_path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fd_out:
+                pickle.dump(imap, fd_out, pickle.HIGHEST_PROTOCOL)
+            _replace_file(tmp_file, cache_file)
+        except Exception:
+            os.remove(tmp_file)
+            if os.path.isfile(cache_file):
+                # Another writer got there first
+                logger.debug('Compiled map %s was already written' % (cache_file))
+                return
+            raise
+    except Exception:
+        logger.warning('Could not write compiled map %s' % (cache_file))
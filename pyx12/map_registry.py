@@ -0,0 +1,191 @@
+######################################################################
+# Copyright
+#   John Holland <john@zoner.org>
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE.txt, which
+# you should have received as part of this distribution.
+#
+######################################################################
+
+"""
+Process wide registry of loaded maps.
+
+Maps, map indexes, external codes and data elements are loaded once and
+shared.  The map_if instances handed out are shared between callers and
+threads and must be treated as read-only.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+# Intrapackage imports
+from . import codes
+from . import dataele
+from . import map_if
+from . import map_index
+
+DEFAULT_MAX_MAPS = 16
+
+# Parameters that change how a map is built or validates
+MAP_PARAMS = ('exclude_external_codes', 'charset')
+
+
+class MapRegistry(object):
+    """
+    Thread-safe cache of loaded maps, with least recently used eviction
+    """
+
+    def __init__(self, max_maps=DEFAULT_MAX_MAPS):
+        """
+        @param max_maps: Maximum number of maps to keep loaded
+        @type max_maps: int
+        """
+        self.max_maps = max_maps
+        self.lock = threading.RLock()
+        self.maps = OrderedDict()
+        self.loading = {}
+        self.map_indexes = {}
+        self.ext_codes = {}
+        self.data_elements = {}
+
+    def load_map_file(self, map_file, param, map_path=None):
+        """
+        Get a loaded map, loading it if needed
+
+        @param map_file: map file name
+        @type map_file: string
+        @param map_path: Override directory containing map xml files.  If
+            None, uses package resource folder
+        @type map_path: string
+        @rtype: L{map_if.map_if}
+        """
+        key = (map_file, map_path) + tuple([param.get(p) for p in MAP_PARAMS])
+        with self.lock:
+            imap = self._get_map(key)
+            if imap is not None:
+                return imap
+            key_lock = self.loading.setdefault(key, threading.Lock())
+        # Parse outside the registry lock, so other maps can be served.  The
+        # key lock makes callers wanting the same map wait for one load.
+        with key_lock:
+            with self.lock:
+                imap = self._get_map(key)
+            if imap is None:
+                logger = logging.getLogger('pyx12')
+                logger.debug('Map registry miss for %s' % (map_file))
+                imap = map_if.load_map_file(map_file, param, map_path,
+                    self.get_ext_codes(map_path, param.get('exclude_external_codes')),
+                    self.get_data_elements(map_path))
+                with self.lock:
+                    self._put_map(key, imap)
+                    self.loading.pop(key, None)
+            return imap
+
+    def _get_map(self, key):
+        """
+        Get a loaded map and mark it most recently used.  Call with the
+        lock held.
+        @return: the map, or None if not loaded
+        """
+        try:
+            imap = self.maps.pop(key)
+        except KeyError:
+            return None
+        self.maps[key] = imap
+        return imap
+
+    def _put_map(self, key, imap):
+        """
+        Add a loaded map, evicting the least recently used.  Call with the
+        lock held.
+        """
+        if self.max_maps > 0:
+            while len(self.maps) >= self.max_maps:
+                self.maps.popitem(last=False)
+            self.maps[key] = imap
+
+    def get_map_index(self, map_path=None):
+        """
+        @rtype: L{map_index.map_index}
+        """
+        with self.lock:
+            try:
+                return self.map_indexes[map_path]
+            except KeyError:
+                return self.map_indexes.setdefault(map_path,
+                    map_index.map_index(map_path))
+
+    def get_ext_codes(self, map_path=None, exclude=None):
+        """
+        @rtype: L{codes.ExternalCodes}
+        """
+        with self.lock:
+            try:
+                return self.ext_codes[(map_path, exclude)]
+            except KeyError:
+                return self.ext_codes.setdefault((map_path, exclude),
+                    codes.ExternalCodes(map_path, exclude))
+
+    def get_data_elements(self, map_path=None):
+        """
+        @rtype: L{dataele.DataElements}
+        """
+        with self.lock:
+            try:
+                return self.data_elements[map_path]
+            except KeyError:
+                return self.data_elements.setdefault(map_path,
+                    dataele.DataElements(map_path))
+
+    def clear(self):
+        """
+        Drop all loaded maps, indexes, codes and data elements.  The code
+        sets and data element definitions shared through L{codes} and
+        L{dataele} are dropped too, so they are read again on next use.
+        """
+        with self.lock:
+            self.maps.clear()
+            self.map_indexes.clear()
+            self.ext_codes.clear()
+            self.data_elements.clear()
+        codes.clear_codeset_stores()
+        dataele.clear_data_elements()
+
+
+_registry = MapRegistry()
+
+
+def load_map_file(map_file, param, map_path=None):
+    """
+    Get a shared map from the process registry
+    @rtype: L{map_if.map_if}
+    """
+    return _registry.load_map_file(map_file, param, map_path)
+
+
+def get_map_index(map_path=None):
+    """
+    Get a shared map index from the process registry
+    @rtype: L{map_index.map_index}
+    """
+    return _registry.get_map_index(map_path)
+
+
+def set_max_maps(max_maps):
+    """
+    Set the number of maps kept by the process registry
+    @type max_maps: int
+    """
+    with _registry.lock:
+        _registry.max_maps = max_maps
+        while len(_registry.maps) > max_maps:
+            _registry.maps.popitem(last=False)
+
+
+def clear():
+    """
+    Empty the process registry
+    """
+    _registry.clear()
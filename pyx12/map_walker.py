@@ -16,6 +16,7 @@ If seg indicates a segment has been entered, returns the segment node.
 """
 
 import logging
+from bisect import bisect_left
 
 # Intrapackage imports
 from .errors import EngineError
@@ -132,49 +133,50 @@ class walk_tree(object):
         if not (node.is_loop() or node.is_map_root()):
             node = pop_to_parent_loop(node)  # Get enclosing loop
             #node_list.append(node)
+        seg_id = seg_data.get_seg_id()
         while True:
-            # Iterate through nodes with position >= current position
-            for ord1 in [a for a in sorted(node.pos_map) if a >= node_pos]:
-                for child in node.pos_map[ord1]:
-                    if child.is_segment():
-                        if child.is_match(seg_data):
-                            # Is the matched segment the beginning of a loop?
-                            if node.is_loop() \
-                                    and self._is_loop_match(node, seg_data, errh, seg_count, cur_line, ls_id):
-                                (
-                                    node1, push_node_list) = self._goto_seg_match(node, seg_data,
-                                                                                  errh, seg_count, cur_line, ls_id)
-                                if orig_node.is_loop() or orig_node.is_map_root():
-                                    orig_loop = orig_node
-                                else:
-                                    orig_loop = pop_to_parent_loop(orig_node)  # Get enclosing loop
-                                if node == orig_loop:
-                                    pop_node_list = [node]
-                                    push_node_list = [node]
-                                return (node1, pop_node_list, push_node_list)  # segment node
-                            #child.incr_cur_count()
-                            self.counter.increment(child.x12path)
-                            #assert child.get_cur_count() == self.counter.get_count(child.x12path), \
-                            #    'child counts not equal: old is %s=%i : new is %s=%i' % (
-                            #    child.get_path(), child.get_cur_count(),
-                            #    child.x12path.format(), self.counter.get_count(child.x12path))
-                            self._check_seg_usage(child, seg_data, seg_count, cur_line, ls_id, errh)
-                            # Remove any previously missing errors for this segment
-                            self.mandatory_segs_missing = [x for x in self.mandatory_segs_missing if x[0] != child]
-                            self._flush_mandatory_segs(errh, child.pos)
-                            return (child, pop_node_list, push_node_list)  # segment node
-                        elif child.usage == 'R' and self.counter.get_count(child.x12path) < 1:
-                            fake_seg = pyx12.segment.Segment('%s' % (child.id), '~', '*', ':')
-                            err_str = 'Mandatory segment "%s" (%s) missing' % (child.name, child.id)
-                            self.mandatory_segs_missing.append((child, fake_seg, '3', err_str, seg_count, cur_line, ls_id))
-                        #else:
-                            #logger.debug('Segment %s is not a match for (%s*%s)' % \
-                            #   (child.id, seg_data.get_seg_id(), seg_data[0].get_value()))
-                    elif child.is_loop():
-                        if self._is_loop_match(child, seg_data, errh, seg_count, cur_line, ls_id):
-                            (node_seg, push_node_list) = self._goto_seg_match(child, seg_data, errh, seg_count, cur_line, ls_id)
-                            return (node_seg, pop_node_list, push_node_list)  # segment node
-            # End for ord1 in pos_keys
+            # Iterate through the candidate nodes with position >= current position
+            (positions, children) = node.get_walk_candidates(seg_id)
+            for child in children[bisect_left(positions, node_pos):]:
+                if child.is_segment():
+                    if child.is_match(seg_data):
+                        # Is the matched segment the beginning of a loop?
+                        if node.is_loop() \
+                                and self._is_loop_match(node, seg_data, errh, seg_count, cur_line, ls_id):
+                            (
+                                node1, push_node_list) = self._goto_seg_match(node, seg_data,
+                                                                              errh, seg_count, cur_line, ls_id)
+                            if orig_node.is_loop() or orig_node.is_map_root():
+                                orig_loop = orig_node
+                            else:
+                                orig_loop = pop_to_parent_loop(orig_node)  # Get enclosing loop
+                            if node == orig_loop:
+                                pop_node_list = [node]
+                                push_node_list = [node]
+                            return (node1, pop_node_list, push_node_list)  # segment node
+                        #child.incr_cur_count()
+                        self.counter.increment(child.counter_id)
+                        #assert child.get_cur_count() == self.counter.get_count(child.x12path), \
+                        #    'child counts not equal: old is %s=%i : new is %s=%i' % (
+                        #    child.get_path(), child.get_cur_count(),
+                        #    child.x12path.format(), self.counter.get_count(child.x12path))
+                        self._check_seg_usage(child, seg_data, seg_count, cur_line, ls_id, errh)
+                        # Remove any previously missing errors for this segment
+                        self.mandatory_segs_missing = [x for x in self.mandatory_segs_missing if x[0] != child]
+                        self._flush_mandatory_segs(errh, child.pos)
+                        return (child, pop_node_list, push_node_list)  # segment node
+                    elif child.usage == 'R' and self.counter.get_count(child.counter_id) < 1:
+                        fake_seg = pyx12.segment.Segment('%s' % (child.id), '~', '*', ':')
+                        err_str = 'Mandatory segment "%s" (%s) missing' % (child.name, child.id)
+                        self.mandatory_segs_missing.append((child, fake_seg, '3', err_str, seg_count, cur_line, ls_id))
+                    #else:
+                        #logger.debug('Segment %s is not a match for (%s*%s)' % \
+                        #   (child.id, seg_data.get_seg_id(), seg_data[0].get_value()))
+                elif child.is_loop():
+                    if self._is_loop_match(child, seg_data, errh, seg_count, cur_line, ls_id):
+                        (node_seg, push_node_list) = self._goto_seg_match(child, seg_data, errh, seg_count, cur_line, ls_id)
+                        return (node_seg, pop_node_list, push_node_list)  # segment node
+            # End for child in candidates
             if node.is_map_root():  # If at root and we haven't found the segment yet.
                 walk_tree._seg_not_found_error(orig_node, seg_data,
                                                errh, seg_count, cur_line, ls_id)
@@ -222,9 +224,9 @@ class walk_tree(object):
             errh.seg_error('2', err_str, None)
         elif seg_node.usage == 'R' or seg_node.usage == 'S':
             #assert seg_node.get_cur_count() == self.counter.get_count(seg_node.x12path), 'seg_node counts not equal'
-            if self.counter.get_count(seg_node.x12path) > seg_node.get_max_repeat():  # handle seg repeat count
+            if self.counter.get_count(seg_node.counter_id) > seg_node.get_max_repeat():  # handle seg repeat count
                 err_str = "Segment %s exceeded max count.  Found %i, should have %i" \
-                    % (seg_data.get_seg_id(), self.counter.get_count(seg_node.x12path), seg_node.get_max_repeat())
+                    % (seg_data.get_seg_id(), self.counter.get_count(seg_node.counter_id), seg_node.get_max_repeat())
                 errh.add_seg(seg_node, seg_data, seg_count, cur_line, ls_id)
                 errh.seg_error('5', err_str, None)
 
@@ -291,13 +293,13 @@ class walk_tree(object):
         assert first_child_node is not None, 'get_first_node failed from loop %s' % (loop_node.id)
         if first_child_node.is_loop():
             #If any loop node matches
-            for child_node in loop_node.childIterator():
+            for child_node in loop_node.get_walk_candidates(seg_data.get_seg_id())[1]:
                 if child_node.is_loop() and self._is_loop_match(child_node,
                                                                 seg_data, errh, seg_count, cur_line, ls_id):
                     return True
         elif is_first_seg_match2(first_child_node, seg_data):
             return True
-        elif loop_node.usage == 'R' and self.counter.get_count(loop_node.x12path) < 1:
+        elif loop_node.usage == 'R' and self.counter.get_count(loop_node.counter_id) < 1:
             fake_seg = pyx12.segment.Segment('%s' % (first_child_node.id), '~', '*', ':')
             err_str = 'Mandatory loop "%s" (%s) missing' % \
                 (loop_node.name, loop_node.id)
@@ -332,7 +334,7 @@ class walk_tree(object):
             self._check_loop_usage(loop_node, seg_data,
                                    seg_count, cur_line, ls_id, errh)
             #first_child_node.incr_cur_count()
-            self.counter.increment(first_child_node.x12path)
+            self.counter.increment(first_child_node.counter_id)
             #assert first_child_node.get_cur_count() == self.counter.get_count(first_child_node.x12path), 'first_child_node counts not equal'
             self._flush_mandatory_segs(errh)
             return (first_child_node, [loop_node])
@@ -376,18 +378,18 @@ class walk_tree(object):
             #if loop_node.id == '2110':
             #    import ipdb; ipdb.set_trace()
             #loop_node.reset_child_count()
-            self.counter.reset_to_node(loop_node.x12path)
+            self.counter.reset_to_node(loop_node.counter_id)
             #loop_node.incr_cur_count()
-            self.counter.increment(loop_node.x12path)
+            self.counter.increment(loop_node.counter_id)
             #assert loop_node.get_cur_count() == self.counter.get_count(loop_node.x12path), \
             #    'loop_node counts not equal: old is %s=%i : new is %s=%i' % (
             #    loop_node.get_path(), loop_node.get_cur_count(),
             #    loop_node.x12path.format(), self.counter.get_count(loop_node.x12path))
             #logger.debug('incr loop_node %s %i' % (loop_node.id, loop_node.cur_count))
             #logger.debug('incr first_child_node %s %i' % (first_child_node.id, first_child_node.cur_count))
-            if self.counter.get_count(loop_node.x12path) > loop_node.get_max_repeat():
+            if self.counter.get_count(loop_node.counter_id) > loop_node.get_max_repeat():
                 err_str = "Loop %s exceeded max count.  Found %i, should have %i" \
-                    % (loop_node.id, self.counter.get_count(loop_node.x12path), loop_node.get_max_repeat())
+                    % (loop_node.id, self.counter.get_count(loop_node.counter_id), loop_node.get_max_repeat())
                 errh.add_seg(loop_node, seg_data, seg_count, cur_line, ls_id)
                 errh.seg_error('4', err_str, None)
             #logger.debug('MATCH Loop %s / Segment %s (%s*%s)' \
@@ -10,11 +10,93 @@
 
 """
 Loop and segment counter
+
+Counts are keyed by integer path IDs.  A path ID is interned once per
+process for each distinct node path, so maps sharing the control loops
+(/ISA_LOOP, /ISA_LOOP/GS_LOOP) share their counts.
 """
 from collections import OrderedDict
+import threading
+
 import pyx12.path
 from .decorators import dump_args
 
+_path_lock = threading.Lock()
+_path_ids = {}          # path string -> path ID
+_path_strs = []         # path ID -> canonical path string
+_path_children = []     # path ID -> list of child path IDs
+_path_ancestors = []    # path ID -> frozenset of ancestor path IDs
+_path_descendants = {}  # path ID -> tuple of descendant path IDs, cached
+
+
+def get_path_id(xpath):
+    """
+    Get the process-wide ID of a node path, interning it if needed
+
+    @param xpath: Node path or path ID
+    @type xpath: string, L{path<path.X12Path>} or int
+    @rtype: int
+    """
+    if isinstance(xpath, int):
+        return xpath
+    path_str = xpath.format() if isinstance(xpath, pyx12.path.X12Path) else xpath
+    try:
+        return _path_ids[path_str]
+    except KeyError:
+        pass
+    with _path_lock:
+        return _intern_path(path_str)
+
+
+def _intern_path(path_str):
+    """
+    Must be called holding _path_lock
+    """
+    if path_str in _path_ids:
+        return _path_ids[path_str]
+    canonical = pyx12.path.X12Path(path_str).format()
+    if canonical in _path_ids:
+        path_id = _path_ids[canonical]
+    else:
+        parent_str = canonical.rsplit('/', 1)[0]
+        if parent_str in ('', canonical):
+            ancestors = frozenset()
+            parent_id = None
+        else:
+            parent_id = _intern_path(parent_str)
+            ancestors = _path_ancestors[parent_id] | frozenset([parent_id])
+        path_id = len(_path_strs)
+        _path_strs.append(canonical)
+        _path_children.append([])
+        _path_ancestors.append(ancestors)
+        if parent_id is not None:
+            _path_children[parent_id].append(path_id)
+        _path_ids[canonical] = path_id
+        _path_descendants.clear()
+    _path_ids[path_str] = path_id
+    return path_id
+
+
+def get_path_descendants(path_id):
+    """
+    @return: IDs of all interned paths below the path
+    @rtype: tuple(int)
+    """
+    try:
+        return _path_descendants[path_id]
+    except KeyError:
+        pass
+    with _path_lock:
+        ids = []
+        stack = list(_path_children[path_id])
+        while stack:
+            child_id = stack.pop()
+            ids.append(child_id)
+            stack.extend(_path_children[child_id])
+        descendants = tuple(ids)
+        _path_descendants[path_id] = descendants
+    return descendants
+
 
 class NodeCounter(object):
     """
@@ -23,10 +105,10 @@ class NodeCounter(object):
     def __init__(self, initialCounts=None):
         if initialCounts is None:
             initialCounts = {}
-        self._dict = OrderedDict()
+        self._dict = {}
         # copy constructor
         for k, v in initialCounts.items():
-            self._dict[NodeCounter.makeX12Path(k)] = v
+            self._dict[get_path_id(k)] = v
 
     #@dump_args
     def reset_to_node(self, xpath):
@@ -34,41 +116,44 @@ class NodeCounter(object):
         Pop to node, deleting all child counts
         Keep count of xpath node
         """
-        parent = NodeCounter.makeX12Path(xpath)
-        child_keys = list([x for x in self._dict.keys() if parent.is_child_path(x.format())])
-        for k in child_keys:
-            del self._dict[k]
+        parent_id = get_path_id(xpath)
+        counts = self._dict
+        descendants = get_path_descendants(parent_id)
+        if len(descendants) <= len(counts):
+            for k in descendants:
+                counts.pop(k, None)
+        else:
+            for k in [k for k in counts if parent_id in _path_ancestors[k]]:
+                del counts[k]
 
     #@dump_args
     def increment(self, xpath):
         """
         Increment path count
         """
-        k = NodeCounter.makeX12Path(xpath)
-        if k in self._dict:
-            self._dict[k] += 1
-        else:
-            self._dict[k] = 1
+        k = get_path_id(xpath)
+        self._dict[k] = self._dict.get(k, 0) + 1
 
     #@dump_args
     def setCount(self, xpath, ct):
         """
         Set path count
         """
-        k = NodeCounter.makeX12Path(xpath)
-        self._dict[k] = ct
+        self._dict[get_path_id(xpath)] = ct
 
     def get_count(self, xpath):
         """
         Get path count
         """
-        k = NodeCounter.makeX12Path(xpath)
-        if k not in self._dict:
-            return 0
-        return self._dict[k]
+        return self._dict.get(get_path_id(xpath), 0)
 
     def getState(self):
-        return self._dict
+        """
+        @return: Counts by node path
+        @rtype: OrderedDict
+        """
+        return OrderedDict((NodeCounter.makeX12Path(_path_strs[k]), v)
+                           for (k, v) in self._dict.items())
 
     @staticmethod
     def makeX12Path(xpath):
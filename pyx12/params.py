@@ -42,6 +42,17 @@ class ParamsBase(object):
         self.params['charset'] = 'E'
         self.params['simple_dtd'] = ''
         self.params['xmlout'] = 'simple'
+        self.params['map_cache_path'] = None
+
+    def __getstate__(self):
+        # Loggers are only picklable by name from Python 3.7
+        state = self.__dict__.copy()
+        del state['logger']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger('pyx12.params')
 
     def get(self, option):
         """
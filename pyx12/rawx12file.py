@@ -13,29 +13,69 @@ Iterates over segment line strings.
 Used by X12Reader.
 """
 
+import mmap
+
 # Intrapackage imports
 import pyx12.errors
 import pyx12.segment
 
 DEFAULT_BUFSIZE = 8 * 1024
 ISA_LEN = 106
+# Byte to character mapping used for binary sources.  Latin-1 maps every
+# byte, so invalid characters are left for the validation layer to report.
+BINARY_ENCODING = 'latin-1'
+
+
+def _decode(data):
+    """
+    Convert a byte slice to the native string type
+
+    @param data: segment bytes
+    @type data: bytes or bytearray
+    @rtype: string
+    """
+    if bytes is str:
+        return str(data)
+    return data.decode(BINARY_ENCODING)
 
 
 class RawX12File(object):
     """
     Interface to an X12 data file
+
+    If the file object returns bytes (opened in binary mode), the segments
+    are scanned from a reusable bytearray and decoded one segment at a time.
     """
 
     def __init__(self, fin):
         """
         Initialize the file X12 file reader
 
-        @param fin: an open, readable file object
+        @param fin: an open, readable file object, text or binary
         @type fin: open file object
         """
         self.fd = fin
         self.buffer = None
         line = self.fd.read(ISA_LEN)
+        # A Python 2 str is already the native string type
+        self.binary = isinstance(line, (bytes, bytearray)) \
+            and not isinstance(line, str)
+        if self.binary:
+            self._parse_isa(_decode(line))
+            self.buffer = bytearray(line)
+            self.buffer.extend(self.fd.read(DEFAULT_BUFSIZE))
+        else:
+            self._parse_isa(line)
+            self.buffer = line
+            self.buffer += self.fd.read(DEFAULT_BUFSIZE)
+
+    def _parse_isa(self, line):
+        """
+        Check the fixed length ISA segment and get the terminators from it
+
+        @param line: the first ISA_LEN characters of the source
+        @type line: string
+        """
         if line[:3] != 'ISA':
             err_str = "First line does not begin with 'ISA': %s" % line[:3]
             raise pyx12.errors.X12Error(err_str)
@@ -50,8 +90,6 @@ class RawX12File(object):
         self.ele_term = line[3]
         self.subele_term = line[-2]
         self.repetition_term = line[82] if self.icvn == '00501' else None
-        self.buffer = line
-        self.buffer += self.fd.read(DEFAULT_BUFSIZE)
 
     def __iter__(self):
         """
@@ -59,19 +97,64 @@ class RawX12File(object):
         Often, X12 files have a CR-LF after the segment delimiter.
         Split the input stream on the delimiter and remove any leading CR-LF
         """
+        if self.binary:
+            return self._iter_bytes()
+        return self._iter_text()
+
+    def _iter_text(self):
+        """
+        Scan a text buffer for segment terminators.  The scan offset advances
+        through the buffer; the unread tail is only copied when more data is
+        read.
+        """
+        seg_term = self.seg_term
+        buf = self.buffer
+        pos = 0
         while True:
-            if self.buffer.find(self.seg_term) == -1:
+            idx = buf.find(seg_term, pos)
+            if idx == -1:
                 # Need more data
-                self.buffer += self.fd.read(DEFAULT_BUFSIZE)
-            if self.buffer.find(self.seg_term) == -1:
-                # Still have no segment terminator
-                break
-            # Get first segment in buffer
-            (line, self.buffer) = self.buffer.split(self.seg_term, 1)
-            line = line.lstrip('\n\r')
+                data = self.fd.read(DEFAULT_BUFSIZE)
+                if not data:
+                    # Still have no segment terminator
+                    break
+                buf = buf[pos:] + data
+                pos = 0
+                continue
+            line = buf[pos:idx].lstrip('\n\r')
+            pos = idx + 1
             if line == '':
                 break
-            yield(line)
+            yield line
+        self.buffer = buf[pos:]
+
+    def _iter_bytes(self):
+        """
+        Scan a bytearray for segment terminators.  Each segment is decoded
+        from a slice of the buffer.  Consumed bytes are dropped from the front
+        of the buffer only when more data is read.
+        """
+        seg_term = self.seg_term.encode(BINARY_ENCODING)
+        buf = self.buffer
+        pos = 0
+        while True:
+            idx = buf.find(seg_term, pos)
+            if idx == -1:
+                # Need more data
+                del buf[:pos]
+                pos = 0
+                data = self.fd.read(DEFAULT_BUFSIZE)
+                if not data:
+                    # Still have no segment terminator
+                    break
+                buf.extend(data)
+                continue
+            line = buf[pos:idx].lstrip(b'\n\r')
+            pos = idx + 1
+            if not line:
+                break
+            yield _decode(line)
+        del buf[:pos]
 
     def get_term(self):
         """
@@ -80,3 +163,54 @@ class RawX12File(object):
         @rtype: tuple(string, string, string, string)
         """
         return (self.seg_term, self.ele_term, self.subele_term, '\n', self.repetition_term)
+
+
+class RawX12MmapFile(RawX12File):
+    """
+    Interface to an X12 data file mapped into memory
+
+    Segments are found by scanning the mapped region directly, so there are
+    no read calls and no buffer to grow.  Only usable for regular files.
+    """
+
+    def __init__(self, fin):
+        """
+        Initialize the memory mapped X12 file reader
+
+        @param fin: a regular file, opened for reading in binary mode
+        @type fin: open file object
+        """
+        self.fd = fin
+        self.binary = True
+        self.buffer = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse_isa(_decode(self.buffer[:ISA_LEN]))
+        except pyx12.errors.X12Error:
+            self.close()
+            raise
+
+    def __iter__(self):
+        """
+        Iterate over input lines
+        Remove any leading CR-LF
+        """
+        seg_term = self.seg_term.encode(BINARY_ENCODING)
+        buf = self.buffer
+        pos = 0
+        while True:
+            idx = buf.find(seg_term, pos)
+            if idx == -1:
+                break
+            line = buf[pos:idx].lstrip(b'\n\r')
+            pos = idx + 1
+            if not line:
+                break
+            yield _decode(line)
+
+    def close(self):
+        """
+        Release the mapping
+        """
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
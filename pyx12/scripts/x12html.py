@@ -28,6 +28,7 @@ libpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
 if os.path.isdir(libpath):
     sys.path.insert(0, libpath)
 import pyx12
+import pyx12.error_html
 import pyx12.x12n_document
 import pyx12.params
 
@@ -47,6 +48,17 @@ def check_map_path_arg(map_path):
     return map_path
 
 
+def get_html_pages_writer(target_html, page_size, per_st_loop, errors_only):
+    """
+    @return: Creates the paginated HTML writer for x12n_document
+    @rtype: callable
+    """
+    def html_writer(errh, term):
+        return pyx12.error_html.error_html_pages(errh, target_html, term,
+            page_size=page_size, per_st_loop=per_st_loop, errors_only=errors_only)
+    return html_writer
+
+
 def main():
     """
     Set up environment for processing
@@ -58,10 +70,16 @@ def main():
     parser.add_argument(
         '--log-file', '-l', action='store', dest="logfile", default=None)
     parser.add_argument('--map-path', '-m', action='store', dest="map_path", default=None, type=check_map_path_arg)
-    parser.add_argument('--verbose', '-v', action='count')
+    parser.add_argument('--verbose', '-v', action='count', default=0)
     parser.add_argument('--debug', '-d', action='store_true')
     parser.add_argument('--quiet', '-q', action='store_true')
     parser.add_argument('--html', '-H', action='store_true')
+    parser.add_argument('--page-size', '-p', action='store', dest='page_size', type=int,
+                        default=None, help='With -H, split the output into pages of this many segments')
+    parser.add_argument('--per-st-loop', action='store_true', dest='per_st_loop',
+                        help='With -H, start a new page at each ST loop')
+    parser.add_argument('--errors-only', '-e', action='store_true', dest='errors_only',
+                        help='With -H, only write segments with errors')
     parser.add_argument('--exclude-external-codes', '-x', action='append', dest="exclude_external",
                         default=[], help='External Code Names to ignore')
     parser.add_argument('--charset', '-s', choices=(
@@ -108,17 +126,23 @@ def main():
                 logger.error('Could not open file "%s"' % (src_filename))
                 continue
             fd_html = None
+            html_writer = None
             if args.html:
                 if os.path.splitext(src_filename)[1] == '.txt':
                     target_html = os.path.splitext(src_filename)[0] + '.html'
                 else:
                     target_html = src_filename + '.html'
-                fd_html = open(target_html, 'w')
+                if args.page_size or args.per_st_loop or args.errors_only:
+                    html_writer = get_html_pages_writer(target_html, args.page_size,
+                                                        args.per_st_loop, args.errors_only)
+                else:
+                    fd_html = open(target_html, 'w')
             else:
                 fd_html = sys.stdout
 
             pyx12.x12n_document.x12n_document(param=param, src_file=src_filename,
-                fd_997=None, fd_html=fd_html, fd_xmldoc=None, map_path=args.map_path)
+                fd_997=None, fd_html=fd_html, fd_xmldoc=None, map_path=args.map_path,
+                html_writer=html_writer)
 
         except IOError:
             logger.error('Could not open files')
@@ -49,6 +49,129 @@ def check_map_path_arg(map_path):
     return map_path
 
 
+def get_target_filename(src_filename, ext):
+    """
+    @return: Name of an output file beside the source file
+    @rtype: string
+    """
+    if os.path.splitext(src_filename)[1] == '.txt':
+        return os.path.splitext(src_filename)[0] + ext
+    else:
+        return src_filename + ext
+
+
+def validate_file(param, src_filename, map_path=None, html=False, flag_997=True, jobs=1):
+    """
+    Validate a source file, writing the 997/999 and the HTML error report
+    beside it
+
+    @param param: pyx12.param instance
+    @param src_filename: Source file name
+    @type src_filename: string
+    @param map_path: Override directory containing map xml files
+    @type map_path: string
+    @param jobs: Number of processes used to validate the ST loops
+    @type jobs: int
+    @return: True if the file is valid
+    @rtype: boolean
+    """
+    logger = logging.getLogger('pyx12')
+    fd_997 = None
+    fd_html = None
+    try:
+        if flag_997:
+            fd_997 = tempfile.TemporaryFile(mode='w+')
+        if html:
+            fd_html = open(get_target_filename(src_filename, '.html'), 'w')
+        logger.debug('Before x12n_document for {}'.format(src_filename))
+        result = pyx12.x12n_document.x12n_document(param=param, src_file=src_filename,
+                fd_997=fd_997, fd_html=fd_html, fd_xmldoc=None, map_path=map_path,
+                jobs=jobs)
+        logger.debug('after x12n_document for {}'.format(src_filename))
+        if flag_997 and fd_997.tell() != 0:
+            fd_997.seek(0)
+            with codecs.open(get_target_filename(src_filename, '.997'), mode='w',
+                             encoding='ascii') as fd_target:
+                fd_target.write(fd_997.read())
+    finally:
+        if fd_997:
+            fd_997.close()
+        if fd_html:
+            fd_html.close()
+    return result
+
+
+def _validate_file_job(job_args):
+    """
+    Validate one file of a batch.  In a worker process, the maps loaded stay
+    loaded for the following files.
+
+    @return: True if valid, False if not, None if the file could not be
+        validated
+    """
+    (param, src_filename, map_path, html, jobs) = job_args
+    try:
+        return validate_file(param, src_filename, map_path, html, jobs=jobs)
+    except Exception:
+        logging.getLogger('pyx12').exception('Could not validate %s' % (src_filename))
+        return None
+
+
+def _report_result(src_filename, result):
+    """
+    @return: True if the file is valid
+    @rtype: boolean
+    """
+    if result:
+        sys.stderr.write('%s: OK\n' % (src_filename))
+    elif result is None:
+        sys.stderr.write('%s: Error\n' % (src_filename))
+    else:
+        sys.stderr.write('%s: Failure\n' % (src_filename))
+    return bool(result)
+
+
+def validate_files(param, src_filenames, map_path=None, html=False, jobs=1):
+    """
+    Validate a batch of files in a pool of worker processes.  The results are
+    reported in the order of the files.
+
+    @param src_filenames: Source file names
+    @type src_filenames: list[string]
+    @param jobs: Number of worker processes
+    @type jobs: int
+    @return: True if all files are valid
+    @rtype: boolean
+    """
+    executor = None
+    futures = []
+    job_args = [(param, src_filename, map_path, html, 1) for src_filename in src_filenames]
+    if len(src_filenames) == 1:
+        # Use the workers for the ST loops of the file instead
+        results = [_validate_file_job((param, src_filenames[0], map_path, html, jobs))]
+    else:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+        except ImportError:
+            # Python 2 without the futures backport
+            logging.getLogger('pyx12').warning('concurrent.futures is not available, validating serially')
+            results = (_validate_file_job(args) for args in job_args)
+        else:
+            executor = ProcessPoolExecutor(max_workers=jobs)
+            futures = [executor.submit(_validate_file_job, args) for args in job_args]
+            results = (future.result() for future in futures)
+    all_ok = True
+    try:
+        for (src_filename, result) in zip(src_filenames, results):
+            all_ok &= _report_result(src_filename, result)
+    finally:
+        if executor is not None:
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
+    return all_ok
+
+
 def main():
     """
     Set up environment for processing
@@ -59,7 +182,9 @@ def main():
     parser.add_argument(
         '--log-file', '-l', action='store', dest="logfile", default=None)
     parser.add_argument('--map-path', '-m', action='store', dest="map_path", default=None, type=check_map_path_arg)
-    parser.add_argument('--verbose', '-v', action='count')
+    parser.add_argument('--map-cache', action='store', dest="map_cache_path", default=None,
+                        help='Directory for compiled maps')
+    parser.add_argument('--verbose', '-v', action='count', default=0)
     parser.add_argument('--debug', '-d', action='store_true')
     parser.add_argument('--quiet', '-q', action='store_true')
     parser.add_argument('--html', '-H', action='store_true')
@@ -70,6 +195,8 @@ def main():
     #parser.add_argument('--background', '-b', action='store_true')
     #parser.add_argument('--test', '-t', action='store_true')
     parser.add_argument('--profile', action='store_true', help='Profile the code with plop')
+    parser.add_argument('--jobs', '-j', action='store', dest='jobs', type=int, default=None,
+                        help='Validate the files in N worker processes')
     parser.add_argument('--version', action='version',
                         version='{prog} {version}'.format(prog=parser.prog, version=__version__))
     parser.add_argument('input_files', nargs='*')
@@ -91,12 +218,11 @@ def main():
         logger.setLevel(logging.DEBUG)
     if args.quiet:
         logger.setLevel(logging.ERROR)
-    fd_997 = None
-    fd_html = None
-    flag_997 = True
     param.set('exclude_external_codes', ','.join(args.exclude_external))
     if args.map_path:
         param.set('map_path', args.map_path)
+    if args.map_cache_path:
+        param.set('map_cache_path', args.map_cache_path)
 
     if args.logfile:
         try:
@@ -106,37 +232,38 @@ def main():
         except IOError:
             logger.exception('Could not open log file: %s' % (args.logfile))
 
+    if args.jobs is not None:
+        src_filenames = []
+        all_found = True
+        for fn in args.input_files:
+            for src_filename in glob.iglob(fn):
+                if not os.path.isfile(src_filename):
+                    logger.error('Could not open file "%s"' % (src_filename))
+                    all_found = False
+                    continue
+                src_filenames.append(src_filename)
+        try:
+            return validate_files(param, src_filenames, args.map_path, args.html,
+                                  max(args.jobs, 1)) and all_found
+        except KeyboardInterrupt:
+            print("\n[interrupt]")
+            return False
+
+    all_ok = True
     for fn in args.input_files:
         for src_filename in glob.iglob(fn):
             try:
                 if not os.path.isfile(src_filename):
                     logger.error('Could not open file "%s"' % (src_filename))
+                    all_ok = False
                     continue
-                #fd_src = open(src_filename, 'U')
-                if flag_997:
-                    fd_997 = tempfile.TemporaryFile()
-                if args.html:
-                    if os.path.splitext(src_filename)[1] == '.txt':
-                        target_html = os.path.splitext(src_filename)[0] + '.html'
-                    else:
-                        target_html = src_filename + '.html'
-                    fd_html = open(target_html, 'w')
-
                 if args.profile:
                     from plop.collector import Collector
                     p = Collector()
                     p.start()
-                    if pyx12.x12n_document.x12n_document(param=param, src_file=src_filename,
-                            fd_997=fd_997, fd_html=fd_html, fd_xmldoc=None, map_path=args.map_path):
-                        sys.stderr.write('%s: OK\n' % (src_filename))
-                    else:
-                        sys.stderr.write('%s: Failure\n' % (src_filename))
-                    #import profile
-                    #prof_str = 'pyx12.x12n_document.x12n_document(param, src_filename, ' \
-                    #        + 'fd_997, fd_html, None, None)'
-                    #print prof_str
-                    #print param
-                    #profile.run(prof_str, 'pyx12.prof')
+                result = _validate_file_job((param, src_filename, args.map_path, args.html, 1))
+                all_ok &= _report_result(src_filename, result)
+                if args.profile:
                     p.stop()
                     try:
                         pfile = os.path.splitext(os.path.basename(
@@ -149,34 +276,11 @@ def main():
                     except Exception:
                         logger.exception('Failed to write profile data')
                         sys.stderr.write('%s: bad profile save\n' % (src_filename))
-                else:
-                    logger.debug('Before x12n_document for {}'.format(src_filename))
-                    if pyx12.x12n_document.x12n_document(param=param, src_file=src_filename,
-                            fd_997=fd_997, fd_html=fd_html, fd_xmldoc=None, map_path=args.map_path):
-                        sys.stderr.write('%s: OK\n' % (src_filename))
-                    else:
-                        sys.stderr.write('%s: Failure\n' % (src_filename))
-                    logger.debug('after x12n_document for {}'.format(src_filename))
-                if flag_997 and fd_997.tell() != 0:
-                    fd_997.seek(0)
-                    if os.path.splitext(src_filename)[1] == '.txt':
-                        target_997 = os.path.splitext(src_filename)[0] + '.997'
-                    else:
-                        target_997 = src_filename + '.997'
-                    codecs.open(target_997, mode='w',
-                                encoding='ascii').write(fd_997.read())
-
-                if fd_997:
-                    fd_997.close()
-                if fd_html:
-                    fd_html.close()
-            except IOError:
-                logger.exception('Could not open files')
-                return False
             except KeyboardInterrupt:
                 print("\n[interrupt]")
+                return False
 
-    return True
+    return all_ok
 
 if __name__ == '__main__':
     sys.exit(not main())
@@ -17,6 +17,7 @@ treated as a composite element with one sub-element.
 
 All indexing is zero based.
 """
+import collections
 import re
 
 import pyx12.path
@@ -24,10 +25,55 @@ from pyx12.errors import EngineError
 
 rec_seg_id = re.compile('^[A-Z][A-Z0-9]{1,2}$', re.S)
 
+Delimiters = collections.namedtuple('Delimiters',
+    'seg_term ele_term subele_term repetition_term')
+
+_delimiters = {}
+_refdes_cache = {}
+MAX_REFDES_CACHE = 4096
+
+
+def parse_refdes(ref_des):
+    """
+    Parse a Reference Designator into a segment ID and zero based indexes.
+    Results are cached by the ref_des string.
+
+    @param ref_des: X12 Reference Designator
+    @type ref_des: string
+    @rtype: tuple(seg_id, ele_idx, subele_idx)
+    """
+    try:
+        return _refdes_cache[ref_des]
+    except KeyError:
+        pass
+    xp = pyx12.path.X12Path(ref_des)
+    ele_idx = xp.ele_idx - 1 if xp.ele_idx is not None else None
+    comp_idx = xp.subele_idx - 1 if xp.subele_idx is not None else None
+    if len(_refdes_cache) >= MAX_REFDES_CACHE:
+        _refdes_cache.clear()
+    _refdes_cache[ref_des] = (xp.seg_id, ele_idx, comp_idx)
+    return (xp.seg_id, ele_idx, comp_idx)
+
+
+def get_delimiters(seg_term, ele_term, subele_term, repetition_term='^'):
+    """
+    Get the shared delimiter object for a set of terminators.  All segments
+    of an interchange refer to the same object.
+
+    @rtype: L{segment.Delimiters}
+    """
+    key = (seg_term, ele_term, subele_term, repetition_term)
+    try:
+        return _delimiters[key]
+    except KeyError:
+        return _delimiters.setdefault(key, Delimiters(*key))
+
+
 class Element(object):
     """
     Holds a simple element, which is just a simple string.
     """
+    __slots__ = ('value',)
 
     def __init__(self, ele_str):
         """
@@ -117,7 +163,7 @@ class Composite(object):
     Can be a simple element or a composite.
     A simple element is treated as a composite element with one sub-element.
     """
-    # Attributes:
+    __slots__ = ('elements', 'subele_term', 'subele_term_orig')
 
     # Operations
     def __init__(self, ele_str, subele_term=None):
@@ -256,47 +302,130 @@ class Composite(object):
 class Segment(object):
     """
     Encapsulates a X12 segment.  Contains composites.
+
+    The raw element strings are kept until an element is accessed through
+    L{get}, L{set} or L{elements}; only then is the L{Composite} built.
+
+    The terminators are held in a shared L{Delimiters} object.
     """
-    # Attributes:
+    __slots__ = ('seg_id', '_elems', 'delimiters', 'delimiters_orig')
 
     # Operations
     def __init__(self, seg_str, seg_term, ele_term, subele_term, repetition_term='^'):
         """
         """
-        self.seg_term = seg_term
-        self.seg_term_orig = seg_term
-        self.ele_term = ele_term
-        self.ele_term_orig = ele_term
-        self.subele_term = subele_term
-        self.subele_term_orig = subele_term
-        self.repetition_term = repetition_term
+        self.delimiters = get_delimiters(seg_term, ele_term, subele_term, repetition_term)
+        self.delimiters_orig = self.delimiters
         self.seg_id = None
-        self.elements = []
+        self._elems = []
         if seg_str is None or seg_str == '':
             return
         if seg_str[-1] == seg_term:
-            elems = seg_str[:-1].split(self.ele_term)
+            elems = seg_str[:-1].split(ele_term)
         else:
-            elems = seg_str.split(self.ele_term)
+            elems = seg_str.split(ele_term)
         if elems:
             self.seg_id = elems[0]
-        for ele in elems[1:]:
-            if self.seg_id == 'ISA':
-                #Special handling for ISA segment
-                #guarantee subele_term will not be matched
-                self.elements.append(Composite(ele, ele_term))
-            else:
-                self.elements.append(Composite(ele, subele_term))
+        if len(elems) > 1:
+            # Raw element strings, parsed on first access
+            self._elems = elems[1:]
+            term = self._raw_term()
+            if term is None or len(term) != 1:
+                raise EngineError('The sub-element terminator must be a single character, is %s' % (term))
+
+    def __getstate__(self):
+        return (self.seg_id, self._elems, tuple(self.delimiters),
+                tuple(self.delimiters_orig))
+
+    def __setstate__(self, state):
+        (self.seg_id, self._elems, delimiters, delimiters_orig) = state
+        self.delimiters = get_delimiters(*delimiters)
+        self.delimiters_orig = get_delimiters(*delimiters_orig)
+
+    def _set_delimiter(self, name, value):
+        self.delimiters = get_delimiters(*self.delimiters._replace(**{name: value}))
+
+    seg_term = property(lambda self: self.delimiters.seg_term,
+        lambda self, value: self._set_delimiter('seg_term', value))
+    ele_term = property(lambda self: self.delimiters.ele_term,
+        lambda self, value: self._set_delimiter('ele_term', value))
+    subele_term = property(lambda self: self.delimiters.subele_term,
+        lambda self, value: self._set_delimiter('subele_term', value))
+    repetition_term = property(lambda self: self.delimiters.repetition_term,
+        lambda self, value: self._set_delimiter('repetition_term', value))
+    seg_term_orig = property(lambda self: self.delimiters_orig.seg_term)
+    ele_term_orig = property(lambda self: self.delimiters_orig.ele_term)
+    subele_term_orig = property(lambda self: self.delimiters_orig.subele_term)
+
+    def _raw_term(self):
+        """
+        Get the terminator separating the sub-elements of the raw element
+        strings.  The ISA segment is never split.
+
+        @rtype: string
+        """
+        if self.seg_id == 'ISA':
+            #Special handling for ISA segment
+            #guarantee subele_term will not be matched
+            return self.ele_term_orig
+        return self.subele_term_orig
+
+    def _get_composite(self, ele_idx):
+        """
+        Get the composite at an index, parsing the raw element string if
+        needed
+
+        @rtype: L{segment.Composite}
+        """
+        comp = self._elems[ele_idx]
+        if not isinstance(comp, Composite):
+            comp = Composite(comp, self._raw_term())
+            self._elems[ele_idx] = comp
+        return comp
+
+    def _get_elements(self):
+        """
+        @return: All elements, parsed
+        @rtype: list[L{segment.Composite}]
+        """
+        for i in range(len(self._elems)):
+            self._get_composite(i)
+        return self._elems
+
+    elements = property(_get_elements)
+
+    def _is_ele_empty(self, ele_idx):
+        """
+        @rtype: boolean
+        """
+        comp = self._elems[ele_idx]
+        if isinstance(comp, Composite):
+            return comp.is_empty()
+        return comp.rstrip(self._raw_term()) == ''
+
+    def _format_ele(self, ele_idx, subele_term):
+        """
+        Format an element without parsing the raw element string
+
+        @rtype: string
+        """
+        comp = self._elems[ele_idx]
+        if isinstance(comp, Composite):
+            return comp.format(subele_term)
+        term = self._raw_term()
+        value = comp.rstrip(term)
+        if subele_term != term and self.seg_id != 'ISA':
+            value = value.replace(term, subele_term)
+        return value
 
     def __eq__(self, other):
         if isinstance(other, Segment):
             if self.seg_id != other.seg_id:
                 return False
-            if len(self.elements) != len(other.elements):
+            if len(self) != len(other):
+                return False
+            if self.elements != other.elements:
                 return False
-            for i in range(len(self.elements)):
-                if self.elements[i] != other.elements[i]:
-                    return False
             return True
         return NotImplemented
 
@@ -328,13 +457,13 @@ class Segment(object):
         @param val: String value of composite
         @type val: string
         """
-        self.elements.append(Composite(val, self.subele_term))
+        self._elems.append(Composite(val, self.subele_term))
 
     def __len__(self):
         """
         @rtype: int
         """
-        return len(self.elements)
+        return len(self._elems)
 
     def get_seg_id(self):
         """
@@ -356,13 +485,11 @@ class Segment(object):
         @raise EngineError: If the given ref_des does not match the segment ID
             or if the indexes are not valid integers
         """
-        xp = pyx12.path.X12Path(ref_des)
-        if xp.seg_id is not None and xp.seg_id != self.seg_id:
+        (seg_id, ele_idx, comp_idx) = parse_refdes(ref_des)
+        if seg_id is not None and seg_id != self.seg_id:
             err_str = 'Invalid Reference Designator: %s, seg_id: %s' \
                 % (ref_des, self.seg_id)
             raise EngineError(err_str)
-        ele_idx = xp.ele_idx - 1 if xp.ele_idx is not None else None
-        comp_idx = xp.subele_idx - 1 if xp.subele_idx is not None else None
         return (ele_idx, comp_idx)
 
     def get(self, ref_des):
@@ -379,22 +506,77 @@ class Segment(object):
         if ele_idx >= self.__len__():
             return None
         if comp_idx is None:
-            return self.elements[ele_idx]
+            return self._get_composite(ele_idx)
         else:
-            if comp_idx >= self.elements[ele_idx].__len__():
+            comp = self._get_composite(ele_idx)
+            if comp_idx >= comp.__len__():
                 return None
-            return self.elements[ele_idx][comp_idx]
+            return comp[comp_idx]
+
+    def get_at(self, ele_idx):
+        """
+        Get an element or composite by zero based index.
+        get_at(2) is get('03')
+
+        @param ele_idx: Element index
+        @type ele_idx: int
+        @return: Element or Composite
+        @rtype: L{segment.Composite}
+        """
+        if ele_idx >= self.__len__():
+            return None
+        return self._get_composite(ele_idx)
 
     def get_value(self, ref_des):
         """
         @param ref_des: X12 Reference Designator
         @type ref_des: string
         """
-        comp1 = self.get(ref_des)
-        if comp1 is None:
+        (ele_idx, comp_idx) = self._parse_refdes(ref_des)
+        if ele_idx is None:
+            raise IndexError('{} is not a valid element index'.format(ref_des))
+        return self.get_value_at(ele_idx, comp_idx)
+
+    def get_value_at(self, ele_idx, comp_idx=None):
+        """
+        Get the value of an element or sub-element by zero based index.
+        get_value_at(2, 1) is get_value('03-2')
+
+        @param ele_idx: Element index
+        @type ele_idx: int
+        @param comp_idx: Sub-element index
+        @type comp_idx: int
+        """
+        if ele_idx >= self.__len__():
             return None
-        else:
-            return comp1.format()
+        comp = self._elems[ele_idx]
+        if isinstance(comp, Composite):
+            if comp_idx is None:
+                return comp.format()
+            if comp_idx >= comp.__len__():
+                return None
+            return comp[comp_idx].format()
+        # Raw element string
+        term = self._raw_term()
+        if comp_idx is None:
+            return comp.rstrip(term)
+        subeles = comp.split(term)
+        if comp_idx >= len(subeles):
+            return None
+        return subeles[comp_idx]
+
+    def has_value_at(self, ele_idx):
+        """
+        Is the element at a zero based index present and not empty.
+        has_value_at(2) is get_value('03') not in (None, '')
+
+        @param ele_idx: Element index
+        @type ele_idx: int
+        @rtype: boolean
+        """
+        if ele_idx >= self.__len__():
+            return False
+        return not self._is_ele_empty(ele_idx)
 
     def get_value_by_ref_des(self, ref_des):
         """
@@ -415,21 +597,22 @@ class Segment(object):
         @type val: string
         """
         (ele_idx, comp_idx) = self._parse_refdes(ref_des)
-        while len(self.elements) <= ele_idx:
+        while len(self._elems) <= ele_idx:
             # insert blank values before our value if needed
-            self.elements.append(Composite('', self.subele_term))
+            self._elems.append(Composite('', self.subele_term))
         if self.seg_id == 'ISA' and ele_idx == 15:
             #Special handling for ISA segment
             #guarantee subele_term will not be matched
-            self.elements[ele_idx] = Composite(val, self.ele_term)
+            self._elems[ele_idx] = Composite(val, self.ele_term)
             return
         if comp_idx is None:
-            self.elements[ele_idx] = Composite(val, self.subele_term)
+            self._elems[ele_idx] = Composite(val, self.subele_term)
         else:
-            while len(self.elements[ele_idx]) <= comp_idx:
+            comp = self._get_composite(ele_idx)
+            while len(comp) <= comp_idx:
                 # insert blank values before our value if needed
-                self.elements[ele_idx].elements.append(Element(''))
-            self.elements[ele_idx][comp_idx] = Element(val)
+                comp.elements.append(Element(''))
+            comp[comp_idx] = Element(val)
 
     def is_element(self, ref_des):
         """
@@ -437,7 +620,7 @@ class Segment(object):
         @type ref_des: string
         """
         ele_idx = self._parse_refdes(ref_des)[0]
-        return self.elements[ele_idx].is_element()
+        return self._get_composite(ele_idx).is_element()
 
     def is_composite(self, ref_des):
         """
@@ -445,7 +628,7 @@ class Segment(object):
         @type ref_des: string
         """
         ele_idx = self._parse_refdes(ref_des)[0]
-        return self.elements[ele_idx].is_composite()
+        return self._get_composite(ele_idx).is_composite()
 
     def ele_len(self, ref_des):
         """
@@ -455,7 +638,7 @@ class Segment(object):
         @rtype: int
         """
         ele_idx = self._parse_refdes(ref_des)[0]
-        return len(self.elements[ele_idx])
+        return len(self._get_composite(ele_idx))
 
     def set_seg_term(self, seg_term):
         """
@@ -496,13 +679,7 @@ class Segment(object):
         if subele_term is None:
             raise EngineError('subele_term is None')
         str_elems = []
-        # get index of last non-empty element
-        i = 0
-        for i in range(len(self.elements) - 1, -1, -1):
-            if not self.elements[i].is_empty():
-                break
-        for ele in self.elements[:i + 1]:
-            str_elems.append(ele.format(subele_term))
+        self.format_ele_list(str_elems, subele_term)
         return '%s%s%s%s' % (self.seg_id, ele_term, ele_term.join(str_elems), seg_term)
 
     def format_ele_list(self, str_elems, subele_term=None):
@@ -513,20 +690,19 @@ class Segment(object):
         if subele_term is None:
             subele_term = self.subele_term
         # Find last non-empty composite
-        for i in range(len(self.elements) - 1, -1, -1):
-            if not self.elements[i].is_empty():
+        i = 0
+        for i in range(len(self._elems) - 1, -1, -1):
+            if not self._is_ele_empty(i):
                 break
-        for ele in self.elements[:i + 1]:
-            str_elems.append(ele.format(subele_term))
+        for j in range(i + 1 if self._elems else 0):
+            str_elems.append(self._format_ele(j, subele_term))
 
     def is_empty(self):
         """
         @rtype: boolean
         """
-        if len(self.elements) == 0:
-            return True
-        for ele in self.elements:
-            if not ele.is_empty():
+        for i in range(len(self._elems)):
+            if not self._is_ele_empty(i):
                 return False
         return True
 
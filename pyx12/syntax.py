@@ -15,6 +15,125 @@ X12 syntax validation functions
 """
 
 
+def _check_p(seg_data, idx):
+    # If any is present, then all are required
+    count = 0
+    for i in idx:
+        if seg_data.has_value_at(i):
+            count += 1
+    return count == 0 or count == len(idx)
+
+
+def _check_r(seg_data, idx):
+    # At least one is required
+    for i in idx:
+        if seg_data.has_value_at(i):
+            return True
+    return False
+
+
+def _check_e(seg_data, idx):
+    # At most one may be present
+    count = 0
+    for i in idx:
+        if seg_data.has_value_at(i):
+            count += 1
+            if count > 1:
+                return False
+    return True
+
+
+def _check_c(seg_data, idx):
+    # If the first is present, then all others are required
+    if not seg_data.has_value_at(idx[0]):
+        return True
+    for i in idx[1:]:
+        if not seg_data.has_value_at(i):
+            return False
+    return True
+
+
+def _check_l(seg_data, idx):
+    # If the first is present, then at least one of the others is required
+    if not seg_data.has_value_at(idx[0]):
+        return True
+    for i in idx[1:]:
+        if seg_data.has_value_at(i):
+            return True
+    return False
+
+
+def _check_invalid(seg_data, idx):
+    return False
+
+
+_syntax_checks = {
+    'P': _check_p,
+    'R': _check_r,
+    'E': _check_e,
+    'C': _check_c,
+    'L': _check_l,
+}
+
+
+class SyntaxRule(object):
+    """
+    A syntax list compiled for repeated use.  Holds the zero based element
+    indices and the presence check for the syntax type.  The error string is
+    only built when a segment fails the rule.
+    """
+    __slots__ = ('syn', 'syn_code', 'indices', '_check')
+
+    def __init__(self, syn):
+        """
+        @param syn: list containing the syntax type, and the indices of elements
+        @type syn: list[string]
+        """
+        self.syn = list(syn)
+        self.syn_code = syn[0]
+        self.indices = tuple([int(s) - 1 for s in syn[1:]])
+        if len(syn) < 3:
+            self._check = _check_invalid
+        else:
+            self._check = _syntax_checks.get(self.syn_code, _check_invalid)
+
+    def __repr__(self):
+        """
+        @rtype: string
+        """
+        return syntax_str(self.syn)
+
+    def get_err_cde(self):
+        """
+        @return: the 997/999 element error code for a failure of this rule
+        @rtype: string
+        """
+        return '10' if self.syn_code == 'E' else '2'
+
+    def get_ref_des(self):
+        """
+        @return: the first element position named by the rule
+        """
+        return self.syn[1]
+
+    def is_valid(self, seg_data):
+        """
+        @param seg_data: data segment instance
+        @type seg_data: L{segment<segment.Segment>}
+        @rtype: boolean
+        """
+        return self._check(seg_data, self.indices)
+
+    def get_err_str(self, seg_data):
+        """
+        @param seg_data: data segment instance
+        @type seg_data: L{segment<segment.Segment>}
+        @return: the error string for a segment failing this rule
+        @rtype: string
+        """
+        return is_syntax_valid(seg_data, self.syn)[1]
+
+
 def is_syntax_valid(seg_data, syn):
     """
     Verifies the segment against the syntax
@@ -36,7 +155,7 @@ def is_syntax_valid(seg_data, syn):
     if syn_code == 'P':
         count = 0
         for s in syn_idx:
-            if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
+            if len(seg_data) >= s and seg_data.get_value_at(s - 1) != '':
                 count += 1
         if count != 0 and count != len(syn_idx):
             err_str = 'Syntax Error (%s): If any of %s is present, then all are required'\
@@ -47,7 +166,7 @@ def is_syntax_valid(seg_data, syn):
     elif syn_code == 'R':
         count = 0
         for s in syn_idx:
-            if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
+            if len(seg_data) >= s and seg_data.get_value_at(s - 1) != '':
                 count += 1
         if count == 0:
             err_str = 'Syntax Error (%s): At least one element is required' % \
@@ -58,7 +177,7 @@ def is_syntax_valid(seg_data, syn):
     elif syn_code == 'E':
         count = 0
         for s in syn_idx:
-            if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
+            if len(seg_data) >= s and seg_data.get_value_at(s - 1) != '':
                 count += 1
         if count > 1:
             err_str = 'Syntax Error (%s): At most one of %s may be present'\
@@ -68,10 +187,10 @@ def is_syntax_valid(seg_data, syn):
             return (True, None)
     elif syn_code == 'C':
         # If the first is present, then all others are required
-        if len(seg_data) >= syn_idx[0] and seg_data.get_value('%02i' % (syn_idx[0])) != '':
+        if len(seg_data) >= syn_idx[0] and seg_data.get_value_at(syn_idx[0] - 1) != '':
             count = 0
             for s in syn_idx[1:]:
-                if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
+                if len(seg_data) >= s and seg_data.get_value_at(s - 1) != '':
                     count += 1
             if count != len(syn_idx) - 1:
                 if len(syn_idx[1:]) > 1: verb = 'are'
@@ -86,10 +205,10 @@ def is_syntax_valid(seg_data, syn):
         else:
             return (True, None)
     elif syn_code == 'L':
-        if len(seg_data) > syn_idx[0] - 1 and seg_data.get_value('%02i' % (syn_idx[0])) != '':
+        if len(seg_data) > syn_idx[0] - 1 and seg_data.get_value_at(syn_idx[0] - 1) != '':
             count = 0
             for s in syn_idx[1:]:
-                if len(seg_data) >= s and seg_data.get_value('%02i' % (s)) != '':
+                if len(seg_data) >= s and seg_data.get_value_at(s - 1) != '':
                     count += 1
             if count == 0:
                 err_str = 'Syntax Error (%s): If %s%02i is present, then at least one of '\
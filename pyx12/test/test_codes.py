@@ -4,6 +4,7 @@ import pyx12.codes
 import pyx12.error_handler
 import pyx12.map_if
 import pyx12.params
+from pyx12.errors import EngineError
 
 
 class TestExternal(unittest.TestCase):
@@ -60,3 +61,30 @@ class TestExternalMapPath(unittest.TestCase):
     def test_noexclude_state_code(self):
         ext_codes = pyx12.codes.ExternalCodes(None, self.param.get('exclude_external_codes'))
         self.assertFalse(ext_codes.isValid('states', 'ZZ'))
+
+
+class SharedCodeSets(unittest.TestCase):
+
+    def test_shared_store(self):
+        ext_codes1 = pyx12.codes.ExternalCodes(None, None)
+        ext_codes2 = pyx12.codes.ExternalCodes(None, 'states')
+        self.assertTrue(ext_codes1.store is ext_codes2.store)
+
+    def test_codeset_is_frozenset(self):
+        store = pyx12.codes.CodeSetStore()
+        self.assertEqual(store.codesets, {})
+        codeset = store.get('states')
+        self.assertTrue(isinstance(codeset['codes'], frozenset))
+        self.assertTrue('MI' in codeset['codes'])
+        self.assertEqual(codeset['dataele'], '156')
+        self.assertFalse(store.all_loaded)
+
+    def test_undefined(self):
+        ext_codes = pyx12.codes.ExternalCodes(None, None)
+        self.assertRaises(EngineError, ext_codes.isValid, 'not_a_codeset', 'MI')
+        self.assertRaises(EngineError, ext_codes.isValid, 'not_a_codeset', 'MI')
+
+    def test_all(self):
+        ext_codes = pyx12.codes.ExternalCodes(None, None)
+        self.assertTrue('pos' in ext_codes.codes)
+        self.assertTrue('states' in ext_codes.codes)
@@ -67,3 +67,11 @@ class LookupDataElemMapPath(unittest.TestCase):
     def testOK_TM(self):
         self.assertEqual(self.de.get_by_elem_num('337'), {'max_len':
                                                           8, 'name': 'Time', 'data_type': 'TM', 'min_len': 4})
+
+
+class SharedDataElem(unittest.TestCase):
+
+    def test_shared(self):
+        de1 = pyx12.dataele.DataElements()
+        de2 = pyx12.dataele.DataElements()
+        self.assertTrue(de1.dataele is de2.dataele)
@@ -0,0 +1,175 @@
+import unittest
+try:
+    from StringIO import StringIO
+except:
+    from io import StringIO
+
+import pyx12.error_handler
+import pyx12.map_if
+import pyx12.params
+import pyx12.segment
+import pyx12.x12file
+import pyx12.x12n_document
+from pyx12.test.x12testdata import datafiles
+
+
+class _Source(object):
+    """
+    The parts of X12Reader used by the loop error nodes
+    """
+    st_count = 1
+
+    def get_isa_id(self):
+        return '000000001'
+
+    def get_gs_id(self):
+        return '1'
+
+    def get_st_id(self):
+        return '0001'
+
+    def get_cur_line(self):
+        return 1
+
+
+class LazyErrorNodes(unittest.TestCase):
+
+    def setUp(self):
+        param = pyx12.params.params()
+        self.map = pyx12.map_if.load_map_file('837Q3.I.5010.X223.A1.xml', param)
+        self.node = self.map.getnodebypath(
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300').getnodebypath('DTP[435]')
+        self.errh = pyx12.error_handler.err_handler()
+        src = _Source()
+        self.errh.add_isa_loop(pyx12.segment.Segment(
+            'ISA*00*          *00*          *ZZ*ZZ000          *ZZ*ZZ001          *030828*1128*^*00501*000010121*0*T*:~',
+            '~', '*', ':'), src)
+        self.errh.add_gs_loop(pyx12.segment.Segment(
+            'GS*HC*ZZ000*ZZ001*20030828*1128*17*X*005010X223A1~', '~', '*', ':'), src)
+        self.errh.add_st_loop(pyx12.segment.Segment(
+            'ST*837*11280001*005010X223A1~', '~', '*', ':'), src)
+
+    def test_clean_segment(self):
+        seg_data = pyx12.segment.Segment('DTP*435*D8*20040110~', '~', '*', ':')
+        self.errh.add_seg(self.node, seg_data, 5, 10, None)
+        self.assertTrue(self.node.is_valid(seg_data, self.errh))
+        self.assertEqual(self.errh.cur_st_node.children, [])
+        self.assertEqual(self.errh._cur_seg_node, None)
+        self.assertEqual(self.errh._cur_ele_node, None)
+        self.assertEqual(self.errh.get_error_count(), 0)
+
+    def test_ele_error_promotes(self):
+        seg_data = pyx12.segment.Segment('DTP*435*D8*20041340~', '~', '*', ':')
+        self.errh.add_seg(self.node, seg_data, 5, 10, None)
+        self.assertFalse(self.node.is_valid(seg_data, self.errh))
+        self.assertEqual(len(self.errh.cur_st_node.children), 1)
+        seg_node = self.errh.cur_st_node.children[0]
+        self.assertEqual(seg_node.seg_id, 'DTP')
+        self.assertEqual(seg_node.seg_count, 5)
+        self.assertEqual(seg_node.get_cur_line(), 10)
+        self.assertEqual(len(seg_node.elements), 1)
+        self.assertTrue(seg_node.elements[0].parent is seg_node)
+        self.assertEqual(seg_node.elements[0].ele_pos, 3)
+        self.assertEqual(seg_node.elements[0].errors[0][0], '8')
+
+    def test_seg_error_promotes(self):
+        seg_data = pyx12.segment.Segment('DTP*435*D8*20040110~', '~', '*', ':')
+        self.errh.add_seg(self.node, seg_data, 5, 10, None)
+        self.errh.seg_error('2', 'Mandatory segment missing')
+        self.assertEqual(len(self.errh.cur_st_node.children), 1)
+        self.assertEqual(self.errh.cur_st_node.children[0].errors[0][0], '2')
+        self.assertTrue(self.errh.cur_seg_node is self.errh.cur_st_node.children[0])
+
+
+class Listeners(unittest.TestCase):
+
+    def setUp(self):
+        param = pyx12.params.params()
+        self.map = pyx12.map_if.load_map_file('837Q3.I.5010.X223.A1.xml', param)
+        self.node = self.map.getnodebypath(
+            '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300').getnodebypath('DTP[435]')
+        self.errh = pyx12.error_handler.err_handler()
+        self.nodes = []
+        self.errh.add_listener(self.nodes.append)
+        self.src = _Source()
+        self.errh.add_isa_loop(pyx12.segment.Segment(
+            'ISA*00*          *00*          *ZZ*ZZ000          *ZZ*ZZ001          *030828*1128*^*00501*000010121*0*T*:~',
+            '~', '*', ':'), self.src)
+        self.errh.add_gs_loop(pyx12.segment.Segment(
+            'GS*HC*ZZ000*ZZ001*20030828*1128*17*X*005010X223A1~', '~', '*', ':'), self.src)
+        self.errh.add_st_loop(pyx12.segment.Segment(
+            'ST*837*11280001*005010X223A1~', '~', '*', ':'), self.src)
+
+    def test_loops(self):
+        self.assertEqual([node.id for node in self.nodes], ['ISA', 'GS', 'ST'])
+
+    def test_seg_nodes(self):
+        seg_data = pyx12.segment.Segment('DTP*435*D8*20040110~', '~', '*', ':')
+        self.errh.add_seg(self.node, seg_data, 5, 10, None)
+        self.assertTrue(self.node.is_valid(seg_data, self.errh))
+        self.assertEqual(len(self.nodes), 3)
+        seg_data = pyx12.segment.Segment('DTP*435*D8*20041340~', '~', '*', ':')
+        self.errh.add_seg(self.node, seg_data, 6, 11, None)
+        self.assertFalse(self.node.is_valid(seg_data, self.errh))
+        self.assertEqual(len(self.nodes), 4)
+        self.assertTrue(self.nodes[-1] is self.errh.cur_st_node.children[0])
+
+    def test_close_st_loop(self):
+        self.src.get_cur_line = lambda: 12
+        self.errh.close_st_loop(None, pyx12.segment.Segment(
+            'SE*2*11280001~', '~', '*', ':'), self.src)
+        self.assertEqual([node.id for node in self.nodes], ['ISA', 'GS', 'ST', 'ST'])
+        self.assertTrue(self.nodes[-1].is_closed())
+
+
+class ErrorCounts(unittest.TestCase):
+    """
+    The kept error counts match a recount of the tree
+    """
+
+    def _recount(self, node):
+        if node.id == 'ELE':
+            return len(node.errors)
+        if node.id == 'SEG':
+            ele_ct = len([ele for ele in node.elements if self._recount(ele) > 0])
+            return len(node.errors) + (1 if ele_ct > 0 else 0)
+        if node.id == 'ST':
+            seg_ct = len([seg for seg in node.children if self._recount(seg) > 0])
+            self.assertEqual(node.child_err_count(), seg_ct)
+            return len(node.errors) + (1 if seg_ct > 0 else 0)
+        ct = sum([self._recount(ele) for ele in node.elements])
+        ct += sum([self._recount(child) for child in node.children])
+        return ct + len(node.errors)
+
+    def _check_tree(self, datakey):
+        param = pyx12.params.params()
+        errh = pyx12.error_handler.err_handler()
+        src = pyx12.x12file.X12Reader(StringIO(datafiles[datakey]['source']))
+        proc = pyx12.x12n_document._SegmentProcessor(
+            param, None, 'x12.control.00401.xml', errh)
+        for seg in src:
+            proc.process(seg, src)
+        total = 0
+        for isa_node in errh.children:
+            isa_ct = self._recount(isa_node)
+            self.assertEqual(isa_node.get_error_count(), isa_ct)
+            total += isa_ct
+            for gs_node in isa_node.children:
+                self.assertEqual(gs_node.get_error_count(), self._recount(gs_node))
+                for (i, st_node) in enumerate(gs_node.children):
+                    self.assertEqual(st_node.get_error_count(), self._recount(st_node))
+                    if i + 1 < len(gs_node.children):
+                        self.assertTrue(st_node.get_next_sibling() is gs_node.children[i + 1])
+                    else:
+                        self.assertEqual(st_node.get_next_sibling(), None)
+        self.assertTrue(total > 0)
+        self.assertEqual(errh.get_error_count(), total)
+
+    def test_multiple_trn(self):
+        self._check_tree('multiple_trn')
+
+    def test_trailer_errors(self):
+        self._check_tree('trailer_errors')
+
+    def test_ele(self):
+        self._check_tree('ele')
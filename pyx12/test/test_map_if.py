@@ -116,6 +116,22 @@ class SegmentIsValid(unittest.TestCase):
         self.assertFalse(result)
         self.assertEqual(self.errh.err_cde, '3', self.errh.err_str)
 
+    def test_dtp_plan(self):
+        node = self.node.getnodebypath('DTP[435]')
+        plan = node._validation_plan
+        self.assertEqual(len(plan), node.get_child_count())
+        self.assertEqual([step[1] for step in plan], ['01', '02', '03'])
+        self.assertTrue(plan[1][3])
+        self.assertEqual(plan[2][5], 'DTP')
+
+    def test_dtp_invalid_date(self):
+        self.errh.err_cde = None
+        seg_data = pyx12.segment.Segment(
+            'DTP*435*D8*20041301~', '~', '*', ':')
+        node = self.node.getnodebypath('DTP[435]')
+        self.assertFalse(node.is_valid(seg_data, self.errh))
+        self.assertEqual(self.errh.err_cde, '8', self.errh.err_str)
+
 
 class ElementIsValid(unittest.TestCase):
     def setUp(self):
@@ -399,6 +415,32 @@ class GetNodeByPath(unittest.TestCase):
         self.assertEqual(node.get_path(), path)
         self.assertEqual(node.base_name, 'segment')
 
+    def test_valid_codes_set(self):
+        path = '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/2310B/NM1'
+        node = self.map.getnodebypath(path).get_child_node_by_ordinal(1)
+        self.assertEqual(node.valid_codes_set, frozenset(node.valid_codes))
+        self.assertTrue(node.valid_codes[0] in node.valid_codes_set)
+
+    def test_path_index(self):
+        path = '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/2310B/NM1'
+        node = self.map.get_node_by_path_index(path)
+        self.assertNotEqual(node, None)
+        self.assertEqual(node.get_path(), path)
+        self.assertTrue(self.map.getnodebypath(path) is node)
+        self.assertTrue(self.map.getnodebypath2(pyx12.path.X12Path(path)) is node)
+        self.assertTrue(self.map.getnodebypath2(path + '03') is node.get_child_node_by_ordinal(3))
+        self.assertEqual(self.map.get_node_by_path_index('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300/NOPE'), None)
+
+    def test_child_nodes_ordered(self):
+        node = self.map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300')
+        positions = [child.pos for child in node.child_nodes]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(len(node), len(node.child_nodes))
+        self.assertEqual(node.get_first_node(), node.child_nodes[0])
+        self.assertEqual(node.get_first_seg().id, 'CLM')
+        self.assertTrue(node.get_first_seg().is_first_seg_in_loop())
+        self.assertEqual(list(node.childIterator()), list(node.child_nodes))
+
     def test_get_TST(self):
         path = '/TST'
         map = pyx12.map_if.load_map_file('comp_test.xml', self.param)
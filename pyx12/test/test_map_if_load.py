@@ -1,5 +1,11 @@
+import logging
+import os
+import shutil
+import tempfile
 import unittest
+import xml.etree.cElementTree as et
 
+from pyx12.errors import EngineError
 import pyx12.error_handler
 import pyx12.map_if
 import pyx12.params
@@ -15,3 +21,99 @@ class LoadAllMapsNoErrors(unittest.TestCase):
     def test_load_837p(self):
         param = pyx12.params.params()
         map = pyx12.map_if.load_map_file('837.5010.X222.A1.xml', param)
+
+    def test_load_830_841(self):
+        param = pyx12.params.params()
+        pyx12.map_if.load_map_file('830.4010.PS.xml', param)
+        pyx12.map_if.load_map_file('841.4010.XXXC.xml', param)
+
+
+class ElementDataElementResolved(unittest.TestCase):
+
+    map_str = '''<transaction>
+  <segment xid="TST">
+    <name>TEST</name>
+    <usage>R</usage>
+    <pos>020</pos>
+    <max_use>1</max_use>
+    <element xid="TST01">
+      <data_ele>%s</data_ele>
+      <name>Test Element</name>
+      <usage>%s</usage>
+      <seq>01</seq>
+    </element>
+  </segment>
+</transaction>'''
+
+    def test_attributes_resolved(self):
+        param = pyx12.params.params()
+        imap = pyx12.map_if.map_if(et.fromstring(self.map_str % ('98', 'R')), param)
+        node = imap.getnodebypath('/TST').get_child_node_by_ordinal(1)
+        data_ele = imap.data_elements.get_by_elem_num('98')
+        self.assertEqual(node.data_type, data_ele['data_type'])
+        self.assertEqual(node.min_len, data_ele['min_len'])
+        self.assertEqual(node.max_len, data_ele['max_len'])
+        self.assertEqual(node.get_data_type(), data_ele['data_type'])
+
+    def test_undefined_fails_load(self):
+        param = pyx12.params.params()
+        self.assertRaises(EngineError, pyx12.map_if.map_if,
+                          et.fromstring(self.map_str % ('99999', 'R')), param)
+
+    def test_undefined_not_used(self):
+        param = pyx12.params.params()
+        imap = pyx12.map_if.map_if(et.fromstring(self.map_str % ('99999', 'N')), param)
+        node = imap.getnodebypath('/TST').get_child_node_by_ordinal(1)
+        self.assertEqual(node.data_type, None)
+
+
+class CompiledMapCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_path = tempfile.mkdtemp()
+        self.param = pyx12.params.params()
+        self.param.set('map_cache_path', self.cache_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_path)
+
+    def test_cache_written_and_read(self):
+        map1 = pyx12.map_if.load_map_file('270.4010.X092.A1.xml', self.param)
+        files = os.listdir(self.cache_path)
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith('270.4010.X092.A1.xml.'))
+        map2 = pyx12.map_if.load_map_file('270.4010.X092.A1.xml', self.param)
+        self.assertFalse(map1 is map2)
+        self.assertTrue(map2.param is self.param)
+        self.assertEqual(map1.icvn, map2.icvn)
+        path = '/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2100A/NM1'
+        self.assertEqual(map1.getnodebypath(path).get_path(),
+                         map2.getnodebypath(path).get_path())
+        self.assertEqual(os.listdir(self.cache_path), files)
+
+    def test_existing_cache_file(self):
+        # As on Windows, where a rename does not replace the target
+        def rename(src, dst):
+            if os.path.exists(dst):
+                raise OSError('%s exists' % (dst))
+            os.rename(src, dst)
+        imap = pyx12.map_if.load_map_file('270.4010.X092.A1.xml', self.param)
+        cache_file = os.path.join(self.cache_path, os.listdir(self.cache_path)[0])
+        warnings = []
+        logger = logging.getLogger('pyx12')
+        replace_file = pyx12.map_if._replace_file
+        pyx12.map_if._replace_file = rename
+        logger.warning = lambda msg, *args: warnings.append(msg)
+        try:
+            pyx12.map_if._write_map_cache(cache_file, imap)
+        finally:
+            pyx12.map_if._replace_file = replace_file
+            del logger.warning
+        self.assertEqual(warnings, [])
+        self.assertEqual(os.listdir(self.cache_path), [os.path.basename(cache_file)])
+
+    def test_key_depends_on_params(self):
+        pyx12.map_if.load_map_file('270.4010.X092.A1.xml', self.param)
+        self.param.set('exclude_external_codes', 'states')
+        pyx12.map_if.load_map_file('270.4010.X092.A1.xml', self.param)
+        self.assertEqual(len(os.listdir(self.cache_path)), 2)
@@ -0,0 +1,107 @@
+import threading
+import unittest
+
+import pyx12.codes
+import pyx12.dataele
+import pyx12.map_if
+import pyx12.map_registry
+import pyx12.params
+
+
+class Registry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = pyx12.map_registry.MapRegistry(max_maps=2)
+        self.param = pyx12.params.params()
+
+    def test_shared_map(self):
+        map1 = self.registry.load_map_file('x12.control.00401.xml', self.param)
+        map2 = self.registry.load_map_file('x12.control.00401.xml', self.param)
+        self.assertTrue(map1 is map2)
+
+    def test_shared_codes(self):
+        map1 = self.registry.load_map_file('x12.control.00401.xml', self.param)
+        map2 = self.registry.load_map_file('270.4010.X092.A1.xml', self.param)
+        self.assertFalse(map1 is map2)
+        self.assertTrue(map1.ext_codes is map2.ext_codes)
+        self.assertTrue(map1.data_elements is map2.data_elements)
+
+    def test_params_in_key(self):
+        map1 = self.registry.load_map_file('x12.control.00401.xml', self.param)
+        param2 = pyx12.params.params()
+        param2.set('charset', 'B')
+        map2 = self.registry.load_map_file('x12.control.00401.xml', param2)
+        self.assertFalse(map1 is map2)
+        self.assertTrue(map2.param is param2)
+
+    def test_lru(self):
+        map1 = self.registry.load_map_file('x12.control.00401.xml', self.param)
+        self.registry.load_map_file('x12.control.00501.xml', self.param)
+        self.registry.load_map_file('x12.control.00401.xml', self.param)
+        self.registry.load_map_file('270.4010.X092.A1.xml', self.param)
+        self.assertEqual(len(self.registry.maps), 2)
+        self.assertTrue(map1 is self.registry.load_map_file('x12.control.00401.xml', self.param))
+
+    def test_clear(self):
+        map1 = self.registry.load_map_file('x12.control.00401.xml', self.param)
+        self.registry.clear()
+        self.assertEqual(len(self.registry.maps), 0)
+        self.assertFalse(map1 is self.registry.load_map_file('x12.control.00401.xml', self.param))
+
+    def test_clear_shared_stores(self):
+        self.registry.load_map_file('x12.control.00401.xml', self.param)
+        pyx12.dataele.get_data_elements()
+        self.registry.clear()
+        self.assertEqual(len(pyx12.codes._stores), 0)
+        self.assertEqual(len(pyx12.dataele._dataele), 0)
+
+    def test_load_outside_lock(self):
+        # A slow map load must not hold up callers wanting a different map
+        started = threading.Event()
+        release = threading.Event()
+        load_map_file = pyx12.map_if.load_map_file
+
+        def slow_load(map_file, *args):
+            if map_file == 'x12.control.00401.xml':
+                started.set()
+                release.wait(10)
+            return load_map_file(map_file, *args)
+        pyx12.map_registry.map_if.load_map_file = slow_load
+        try:
+            t = threading.Thread(target=self.registry.load_map_file,
+                args=('x12.control.00401.xml', self.param))
+            t.start()
+            self.assertTrue(started.wait(10))
+            done = threading.Event()
+
+            def load_other():
+                self.registry.load_map_file('x12.control.00501.xml', self.param)
+                done.set()
+            t2 = threading.Thread(target=load_other)
+            t2.start()
+            self.assertTrue(done.wait(10))
+            release.set()
+            t.join()
+            t2.join()
+        finally:
+            release.set()
+            pyx12.map_registry.map_if.load_map_file = load_map_file
+        self.assertEqual(len(self.registry.maps), 2)
+
+    def test_threads(self):
+        maps = []
+
+        def load():
+            maps.append(self.registry.load_map_file('x12.control.00401.xml', self.param))
+        threads = [threading.Thread(target=load) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(maps), 4)
+        for imap in maps:
+            self.assertTrue(imap is maps[0])
+
+    def test_map_index(self):
+        idx1 = pyx12.map_registry.get_map_index()
+        self.assertTrue(idx1 is pyx12.map_registry.get_map_index())
@@ -830,6 +830,41 @@ class LoopPathPopPush834(unittest.TestCase):
         self.assertEqual(get_id_list(push), [])
 
 
+class WalkCandidates(unittest.TestCase):
+    def setUp(self):
+        param = pyx12.params.params()
+        self.map = pyx12.map_if.load_map_file('837.4010.X098.A1.xml', param)
+
+    def test_candidates_in_order(self):
+        node = self.map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000A/2000B/2300')
+        (positions, children) = node.get_walk_candidates('NM1')
+        self.assertEqual(list(positions), sorted(positions))
+        all_children = list(node.childIterator())
+        self.assertEqual(list(children), [c for c in all_children if c in children])
+        for child in all_children:
+            if child.is_segment():
+                expected = child.id == 'NM1' or child.usage == 'R'
+            else:
+                expected = 'NM1' in child.first_seg_ids or child.may_be_missing
+            self.assertEqual(child in children, expected, child.get_path())
+        self.assertTrue([c for c in children if c.is_loop() and c.id == '2310A'])
+
+    def test_unknown_segment_id(self):
+        node = self.map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER')
+        (positions, children) = node.get_walk_candidates('ZZZ')
+        self.assertEqual((positions, children), node.walk_default)
+        for child in children:
+            self.assertTrue(child.usage == 'R' if child.is_segment() else child.may_be_missing)
+
+    def test_first_seg_ids_nested(self):
+        node = self.map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL')
+        self.assertTrue(node.get_first_node().is_loop())
+        self.assertEqual(node.first_seg_ids, frozenset(['HL']))
+
+    def tearDown(self):
+        del self.map
+
+
 class Bug837i(unittest.TestCase):
     def setUp(self):
         self.walker = walk_tree()
@@ -1,6 +1,8 @@
 import unittest
 import sys
 import os.path
+import logging
+import pickle
 
 import pyx12.params
 #from pyx12.errors import EngineError
@@ -39,6 +41,23 @@ class SetParamOverride(unittest.TestCase):
             'exclude_external_codes'), 'states,diagnosis')
 
 
+class Pickle(unittest.TestCase):
+    def setUp(self):
+        self.param = pyx12.params.params()
+        self.hdlr = logging.StreamHandler()
+        logging.getLogger('pyx12').addHandler(self.hdlr)
+
+    def tearDown(self):
+        logging.getLogger('pyx12').removeHandler(self.hdlr)
+
+    def test_round_trip(self):
+        self.param.set('charset', 'B')
+        param = pickle.loads(pickle.dumps(self.param))
+        self.assertEqual(param.get('charset'), 'B')
+        self.assertEqual(param.get('map_path'), self.param.get('map_path'))
+        self.assertTrue(param.logger is self.param.logger)
+
+
 class ReadConfigFile(unittest.TestCase):
     def setUp(self):
         test_path = os.path.abspath(os.path.dirname(sys.argv[0]))
@@ -3,6 +3,7 @@ try:
     from StringIO import StringIO
 except:
     from io import StringIO
+from io import BytesIO
 
 import pyx12.error_handler
 from pyx12.errors import *
@@ -120,6 +121,43 @@ class RawDelimiters(X12fileTestCase):
         self.assertEqual(ct, 7)
 
 
+class BinaryMode(X12fileTestCase):
+
+    def setUp(self):
+        self.str1 = 'ISA*00*          *00*          *ZZ*ZZ000          *ZZ*ZZ001          *030828*1128*U*00401*000010121*0*T*:~\r\n'
+        self.str1 += 'GS*HC*ZZ000*ZZ001*20030828*1128*17*X*004010X098~\r\n'
+        self.str1 += 'ST*837*11280001~\r\n'
+        self.str1 += 'TST*AA:1:1*BB:5~\r\n'
+        self.str1 += 'SE*3*11280001~\r\n'
+        self.str1 += 'GE*1*17~\r\n'
+        self.str1 += 'IEA*1*000010121~\r\n'
+
+    def test_same_segments_as_text(self):
+        text_segs = list(pyx12.rawx12file.RawX12File(self._makeFd(self.str1)))
+        src = pyx12.rawx12file.RawX12File(BytesIO(self.str1.encode('ascii')))
+        # Python 2 bytes are str and take the text path
+        self.assertEqual(src.binary, bytes is not str)
+        self.assertEqual(list(src), text_segs)
+        self.assertEqual(text_segs[3], 'TST*AA:1:1*BB:5')
+        self.assertEqual(src.get_term(), ('~', '*', ':', '\n', None))
+        self.assertEqual(src.icvn, '00401')
+
+    def test_segments_span_reads(self):
+        body = ''.join(['NM1*IL*1*SMITH*JOHN%05i~\n' % i for i in range(2000)])
+        str1 = self.str1.replace('SE*3', body + 'SE*2003')
+        src = pyx12.rawx12file.RawX12File(BytesIO(str1.encode('ascii')))
+        segs = list(src)
+        self.assertEqual(len(segs), 2007)
+        self.assertEqual(segs[4], 'NM1*IL*1*SMITH*JOHN00000')
+        self.assertEqual(segs[2003], 'NM1*IL*1*SMITH*JOHN01999')
+        self.assertEqual(segs[-1], 'IEA*1*000010121')
+
+    def test_bad_isa(self):
+        fd = BytesIO(b' ISA~')
+        self.assertRaises(
+            pyx12.errors.X12Error, pyx12.rawx12file.RawX12File, fd)
+
+
 class X12InterchangeControlVersion(X12fileTestCase):
 
     def test_4010(self):
@@ -175,6 +175,34 @@ class GetValue(unittest.TestCase):
             'TST04-2'), self.seg.get('TST04-2').format())
 
 
+class LazyElements(unittest.TestCase):
+
+    def setUp(self):
+        self.seg_str = 'TST*AA*1*Y*BB:5::*ZZ**'
+        self.seg = pyx12.segment.Segment(self.seg_str, '~', '*', ':')
+
+    def test_raw_values_match_parsed(self):
+        seg2 = pyx12.segment.Segment(self.seg_str, '~', '*', ':')
+        seg2.elements
+        for ref_des in ('01', '04', '04-1', '04-2', '04-3', '04-9', '06', '07', '09'):
+            self.assertEqual(self.seg.get_value(ref_des), seg2.get_value(ref_des))
+        self.assertEqual(self.seg.format(), seg2.format())
+        self.assertEqual(self.seg.format('+', '&', '!'), 'TST&AA&1&Y&BB!5&ZZ+')
+        self.assertEqual(self.seg, seg2)
+
+    def test_get_value_does_not_parse(self):
+        self.assertEqual(self.seg.get_value('TST04'), 'BB:5')
+        self.assertFalse(isinstance(self.seg._elems[3], pyx12.segment.Composite))
+
+    def test_set_subele(self):
+        self.seg.set('TST04-2', '6')
+        self.assertEqual(self.seg.format(), 'TST*AA*1*Y*BB:6*ZZ~')
+        self.assertEqual(len(self.seg), 7)
+
+    def test_bad_subele_term(self):
+        self.assertRaises(EngineError, pyx12.segment.Segment, 'TST*AA', '~', '*', None)
+
+
 class RefDes(unittest.TestCase):
 
     def setUp(self):
@@ -210,6 +238,29 @@ class RefDes(unittest.TestCase):
         self.assertEqual(self.seg.get_value('TST15-2'), None)
         self.assertEqual(self.seg.get_value('15-2'), None)
 
+    def test_value_at(self):
+        self.assertEqual(self.seg.get_value_at(0), 'AA')
+        self.assertEqual(self.seg.get_value_at(3), 'BB:5')
+        self.assertEqual(self.seg.get_value_at(3, 1), '5')
+        self.assertEqual(self.seg.get_value_at(3, 2), None)
+        self.assertEqual(self.seg.get_value_at(14), None)
+
+    def test_get_at(self):
+        self.assertTrue(self.seg.get_at(3) is self.seg.get('04'))
+        self.assertEqual(self.seg.get_at(3).format(), 'BB:5')
+        self.assertEqual(self.seg.get_at(14), None)
+
+    def test_has_value_at(self):
+        for i in range(15):
+            self.assertEqual(self.seg.has_value_at(i),
+                             self.seg.get_value_at(i) not in (None, ''))
+
+    def test_parse_refdes_cached(self):
+        self.assertEqual(pyx12.segment.parse_refdes('TST04-2'), ('TST', 3, 1))
+        self.assertTrue('TST04-2' in pyx12.segment._refdes_cache)
+        self.assertEqual(pyx12.segment.parse_refdes('04'), (None, 3, None))
+        self.assertRaises(EngineError, self.seg.get_value, 'XXX04')
+
 
 class IsEmpty(unittest.TestCase):
 
@@ -378,3 +429,27 @@ class IsaTerminators(unittest.TestCase):
         seg_isa = pyx12.segment.Segment(initial, '~', '*', ':')
         seg_isa.set('ISA16', '\\')
         self.assertMultiLineEqual(seg_isa.format(subele_term='\\'), result)
+
+
+class SharedDelimiters(unittest.TestCase):
+
+    def test_shared(self):
+        seg1 = pyx12.segment.Segment('NM1*IL*1*SMITH', '~', '*', ':')
+        seg2 = pyx12.segment.Segment('N3*123 MAIN ST', '~', '*', ':')
+        self.assertTrue(seg1.delimiters is seg2.delimiters)
+        self.assertFalse(hasattr(seg1, '__dict__'))
+
+    def test_change_term(self):
+        seg1 = pyx12.segment.Segment('NM1*IL*1*SMITH', '~', '*', ':')
+        seg2 = pyx12.segment.Segment('N3*123 MAIN ST', '~', '*', ':')
+        seg1.set_subele_term('>')
+        self.assertEqual(seg1.subele_term, '>')
+        self.assertEqual(seg1.subele_term_orig, ':')
+        self.assertEqual(seg2.subele_term, ':')
+
+    def test_pickle(self):
+        import pickle
+        seg1 = pyx12.segment.Segment('NM1*IL*1*SMITH', '~', '*', ':')
+        seg2 = pickle.loads(pickle.dumps(seg1))
+        self.assertEqual(seg1, seg2)
+        self.assertTrue(seg1.delimiters is seg2.delimiters)
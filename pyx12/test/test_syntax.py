@@ -286,3 +286,43 @@ class IsValidSyntaxE(unittest.TestCase):
         syntax = ['E', 8, 9, 10]
         (result, err_str) = pyx12.map_if.is_syntax_valid(seg, syntax)
         self.assertTrue(result, err_str)
+
+
+class CompiledSyntaxRule(unittest.TestCase):
+    """
+    The compiled rule must agree with is_syntax_valid
+    """
+
+    def setUp(self):
+        self.segs = []
+        for seg1 in (
+            ['NM1', '41', '1', 'Smith', 'Sam'],
+            ['NM1', '41', '1', 'Smith', 'Sam', '', '', '', '', '', ''],
+            ['NM1', '41', '1', 'Smith', 'Sam', '', '', '', '46', '', ''],
+            ['NM1', '41', '1', 'Smith', 'Sam', '', '', '', '', 'YY', 'ZZZZ'],
+            ['NM1', '41', '1', 'Smith', 'Sam', '', '', '', '46', 'YY', 'ZZZZ'],
+            ['NM1', '41', '1', 'Smith', 'Sam', '', '', '', ':', 'YY:1', ''],
+        ):
+            self.segs.append(pyx12.segment.Segment('*'.join(seg1), '~', '*', ':'))
+
+    def test_matches_is_syntax_valid(self):
+        for code in ('P', 'R', 'E', 'C', 'L'):
+            for syntax in ([code, 8, 9], [code, 8, 9, 10], [code, 10, 8, 9]):
+                rule = pyx12.syntax.SyntaxRule(syntax)
+                for seg in self.segs:
+                    (result, err_str) = pyx12.syntax.is_syntax_valid(seg, syntax)
+                    self.assertEqual(rule.is_valid(seg), result, '%s %s' % (syntax, seg))
+                    if not result:
+                        self.assertEqual(rule.get_err_str(seg), err_str)
+
+    def test_bad_syntax(self):
+        rule = pyx12.syntax.SyntaxRule(['R', 3])
+        self.assertFalse(rule.is_valid(self.segs[0]))
+        rule = pyx12.syntax.SyntaxRule(['X', 8, 9])
+        self.assertFalse(rule.is_valid(self.segs[0]))
+        self.assertEqual(rule.get_err_str(self.segs[0]), 'Syntax Type X0809 Not Found')
+
+    def test_err_cde(self):
+        self.assertEqual(pyx12.syntax.SyntaxRule(['E', 8, 9]).get_err_cde(), '10')
+        self.assertEqual(pyx12.syntax.SyntaxRule(['P', 8, 9]).get_err_cde(), '2')
+        self.assertEqual(pyx12.syntax.SyntaxRule(['P', 8, 9]).get_ref_des(), 8)
@@ -1,6 +1,7 @@
 import unittest
 
-from pyx12.validation import IsValidDataType
+import pyx12.validation
+from pyx12.validation import IsValidDataType, is_valid_date
 
 
 class BasicNumeric(unittest.TestCase):
@@ -257,3 +258,10 @@ class Extended5010String(unittest.TestCase):
     def testInvalid(self):
         self.assertFalse(
             IsValidDataType('%s' % (chr(0x1D)), 'AN', 'E', '00501'))
+
+
+class DateCache(unittest.TestCase):
+    def testCachedDate(self):
+        self.assertFalse(is_valid_date('D8', '20041301'))
+        self.assertTrue(('D8', '20041301') in pyx12.validation._date_cache)
+        self.assertFalse(is_valid_date('D8', '20041301'))
@@ -3,9 +3,16 @@ try:
     from StringIO import StringIO
 except:
     from io import StringIO
+from io import BytesIO
+
+import os.path
+import shutil
+import tempfile
 
 import pyx12.error_handler
+import pyx12.errors
 #from pyx12.errors import *
+import pyx12.rawx12file
 import pyx12.x12file
 
 
@@ -534,6 +541,89 @@ class X12WriterTest(X12fileTestCase):
         self.assertMultiLineEqual(output, newval)
 
 
+class X12WriterBufferedTest(X12fileTestCase):
+
+    segs = [
+        'ISA*00*          *00*          *ZZ*ZZ000          *ZZ*ZZ001          *030828*1128*U*00401*000010121*0*T*:',
+        'GS*HC*ZZ000*ZZ001*20030828*1128*17*X*004010X098',
+        'ST*837*11280001',
+        'HL*1**20*1',
+        'HL*2*1*22*1',
+        'HL*3*2*23*1',
+        'HL*4*1*22*1',
+        'SE*6*11280001',
+        'GE*1*17',
+        'IEA*1*000010121'
+    ]
+
+    def _segments(self):
+        return [pyx12.segment.Segment(seg_str, '~', '*', ':') for seg_str in self.segs]
+
+    def _expected(self):
+        return ''.join([seg_str + '~\n' for seg_str in self.segs])
+
+    def test_buffered(self):
+        fd_out = self._makeFd()
+        wr = pyx12.x12file.X12Writer(fd_out, '~', '*', ':', '\n', buffer_size=200)
+        for seg_data in self._segments()[:3]:
+            wr.Write(seg_data)
+        self.assertEqual(fd_out.getvalue(), '')
+        for seg_data in self._segments()[3:]:
+            wr.Write(seg_data)
+        self.assertTrue(len(fd_out.getvalue()) >= 200)
+        wr.Close()
+        self.assertMultiLineEqual(self._expected(), fd_out.getvalue())
+
+    def test_write_many(self):
+        fd_out = self._makeFd()
+        wr = pyx12.x12file.X12Writer(fd_out, '~', '*', ':', '\n')
+        wr.write_many(iter(self._segments()))
+        self.assertMultiLineEqual(self._expected(), fd_out.getvalue())
+        self.assertEqual(wr.buffer_size, None)
+
+    def test_write_many_missing_trailers(self):
+        fd_out = self._makeFd()
+        wr = pyx12.x12file.X12Writer(fd_out, '~', '*', ':', '\n', buffer_size=10000)
+        wr.write_many(self._segments()[:7])
+        self.assertEqual(fd_out.getvalue(), '')
+        wr.Close()
+        self.assertMultiLineEqual(self._expected(), fd_out.getvalue())
+
+    def test_binary(self):
+        fd_out = BytesIO()
+        wr = pyx12.x12file.X12Writer(fd_out, '~', '*', ':', '\n', buffer_size=100, binary=True)
+        wr.write_many(self._segments())
+        wr.Close()
+        self.assertEqual(self._expected().encode('ascii'), fd_out.getvalue())
+
+    def test_binary_file(self):
+        (fd, filename) = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            wr = pyx12.x12file.X12Writer(filename, '~', '*', ':', '\n', binary=True)
+            for seg_data in self._segments():
+                wr.Write(seg_data)
+            wr.Close()
+            wr.fd_out.close()
+            with open(filename, 'rb') as fd_in:
+                self.assertEqual(self._expected().encode('ascii'), fd_in.read())
+        finally:
+            os.remove(filename)
+
+    def test_text_file(self):
+        (fd, filename) = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            wr = pyx12.x12file.X12Writer(filename, '~', '*', ':', '\n', buffer_size=100)
+            wr.write_many(self._segments())
+            wr.Close()
+            wr.fd_out.close()
+            with open(filename, 'rb') as fd_in:
+                self.assertEqual(self._expected().encode('ascii'), fd_in.read())
+        finally:
+            os.remove(filename)
+
+
 class LX_Checks(X12fileTestCase):
     """
     837 2400/LX counting
@@ -612,3 +702,86 @@ class InterchangeVersion(X12fileTestCase):
         if len(errors) > 0:
             err_cde = errors[0][1]
         self.assertEqual(err_cde, None)
+
+
+class NamedFile(unittest.TestCase):
+
+    def setUp(self):
+        self.str1 = 'ISA*00*          *00*          *ZZ*ZZ000          *ZZ*ZZ001          *030828*1128*U*00401*000010121*0*T*:~\n'
+        self.str1 += 'GS*HC*ZZ000*ZZ001*20030828*1128*17*X*004010X098~\n'
+        self.str1 += 'ST*837*11280001~\n'
+        self.str1 += 'TST*AA:1:1*BB:5~\n'
+        self.str1 += 'SE*3*11280001~\n'
+        self.str1 += 'GE*1*17~\n'
+        self.str1 += 'IEA*1*000010121~\n'
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.txt')
+        with open(self.filename, 'wb') as fd:
+            fd.write(self.str1.encode('ascii'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read(self, src):
+        segs = [seg.format() for seg in src]
+        self.assertEqual(src.pop_errors(), [])
+        return segs
+
+    def test_mmap(self):
+        src = pyx12.x12file.X12Reader(self.filename)
+        self.assertTrue(isinstance(src.raw, pyx12.rawx12file.RawX12MmapFile))
+        self.assertEqual(src.icvn, '00401')
+        self.assertEqual(src.get_term(), ('~', '*', ':', '\n', None))
+        segs = self._read(src)
+        self.assertEqual(len(segs), 7)
+        self.assertEqual(segs[3], 'TST*AA:1:1*BB:5~')
+        del src
+
+    def test_streamed_same_as_mmap(self):
+        src = pyx12.x12file.X12Reader(self.filename, use_mmap=False)
+        self.assertFalse(isinstance(src.raw, pyx12.rawx12file.RawX12MmapFile))
+        segs1 = self._read(src)
+        segs2 = self._read(pyx12.x12file.X12Reader(self.filename))
+        self.assertEqual(segs1, segs2)
+        self.assertEqual(''.join([s + '\n' for s in segs2]), self.str1)
+
+    def test_close(self):
+        src = pyx12.x12file.X12Reader(self.filename)
+        fd_in = src.fd_in
+        self.assertEqual(len(self._read(src)), 7)
+        src.close()
+        self.assertTrue(fd_in.closed)
+        self.assertEqual(src.raw.buffer, None)
+        src.close()
+
+    def test_context_manager(self):
+        with pyx12.x12file.X12Reader(self.filename, use_mmap=False) as src:
+            segs = self._read(src)
+        self.assertTrue(src.fd_in.closed)
+        self.assertEqual(len(segs), 7)
+
+    def test_close_leaves_caller_file_open(self):
+        with open(self.filename, 'rb') as fd_in:
+            with pyx12.x12file.X12Reader(fd_in) as src:
+                self._read(src)
+            self.assertFalse(fd_in.closed)
+
+    def test_bad_isa_closes_file(self):
+        with open(self.filename, 'wb') as fd:
+            fd.write(b'XSA*00~')
+        opened = []
+        real_open = open
+
+        def record_open(*args, **kwargs):
+            fd = real_open(*args, **kwargs)
+            opened.append(fd)
+            return fd
+        pyx12.x12file.open = record_open
+        try:
+            pyx12.x12file.X12Reader(self.filename)
+        except pyx12.errors.X12Error:
+            self.assertTrue(opened[0].closed)
+        else:
+            self.fail('X12Error not raised')
+        finally:
+            del pyx12.x12file.open
@@ -1,12 +1,20 @@
+import os.path
+import shutil
+import tempfile
 import unittest
 try:
     from StringIO import StringIO
 except:
     from io import StringIO
 
+import pyx12.error_997
+import pyx12.error_999
 import pyx12.error_handler
+import pyx12.error_html
+import pyx12.error_visitor
 import pyx12.x12n_document
 import pyx12.params
+import pyx12.x12file
 from pyx12.test.x12testdata import datafiles
 
 
@@ -155,3 +163,265 @@ class Test5010(X12DocumentTestCase):
 
     def test_834_eol_in_element(self):
         self._test_999('834_eol_in_element')
+
+
+class ParallelStLoops(X12DocumentTestCase):
+    """
+    Validating the ST loops in worker processes gives the same results
+    """
+
+    def setUp(self):
+        self.param = pyx12.params.params()
+        self.batch_segments = pyx12.x12n_document.PARALLEL_BATCH_SEGMENTS
+        pyx12.x12n_document.PARALLEL_BATCH_SEGMENTS = 1
+        self.strftime = pyx12.error_html.time.strftime
+        pyx12.error_html.time.strftime = lambda fmt: ''
+
+    def tearDown(self):
+        pyx12.x12n_document.PARALLEL_BATCH_SEGMENTS = self.batch_segments
+        pyx12.error_html.time.strftime = self.strftime
+
+    def _run(self, datakey, jobs):
+        fd_source = self._makeFd(datafiles[datakey]['source'])
+        fd_html = StringIO()
+        result = pyx12.x12n_document.x12n_document(
+            self.param, fd_source, None, fd_html, None, jobs=jobs)
+        return (result, fd_html.getvalue())
+
+    def _test_same(self, datakey):
+        self.assertEqual(self._run(datakey, 1), self._run(datakey, 2))
+
+    def test_mult_isa(self):
+        self._test_same('mult_isa')
+
+    def test_multiple_trn(self):
+        self._test_same('multiple_trn')
+
+    def test_trailer_errors(self):
+        self._test_same('trailer_errors')
+
+    def test_837miss(self):
+        self._test_same('837miss')
+
+
+class HtmlErrors(X12DocumentTestCase):
+
+    def _html(self, datakey):
+        fd_source = self._makeFd(datafiles[datakey]['source'])
+        fd_html = StringIO()
+        pyx12.x12n_document.x12n_document(self.param, fd_source, None, fd_html, None)
+        return fd_html.getvalue()
+
+    def test_later_interchanges(self):
+        html = self._html('mult_isa')
+        self.assertEqual(html.count('Mandatory loop "Table 1 - Header"'), 4)
+
+    def test_se_errors(self):
+        html = self._html('trailer_errors')
+        self.assertTrue('SE count of 60 for SE02=300207436 is wrong' in html)
+
+    def test_bad_st02(self):
+        # The ST02 errors are not written again with the SE segment
+        html = self._html('ele')
+        self.assertEqual(html.count('(ST02) is too long'), 1)
+        self.assertEqual(html.count('(ST02) has unnecessary trailing spaces'), 1)
+        self.assertTrue('65:&nbsp;SE*63*300145997~' in html)
+        self.assertEqual(html.count('(ISA10) contains an invalid time'), 1)
+        self.assertTrue('66:&nbsp;GE*1*1~' in html)
+
+
+class SourceClosed(X12DocumentTestCase):
+
+    def setUp(self):
+        self.param = pyx12.params.params()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.txt')
+        with open(self.filename, 'wb') as fd:
+            fd.write(datafiles['simple1']['source'].encode('ascii'))
+        self.readers = []
+        self.close = pyx12.x12file.X12Reader.close
+        readers = self.readers
+        close = self.close
+
+        def record_close(src):
+            readers.append(src)
+            close(src)
+        pyx12.x12file.X12Reader.close = record_close
+
+    def tearDown(self):
+        pyx12.x12file.X12Reader.close = self.close
+        shutil.rmtree(self.tmpdir)
+
+    def test_closed(self):
+        pyx12.x12n_document.x12n_document(self.param, self.filename, None, None, None)
+        self.assertTrue(self.readers[0].fd_in.closed)
+
+    def test_closed_on_error(self):
+        class FailingHtml(pyx12.error_html.error_html):
+            def gen_seg(self, seg_data, src, err_node_list=None):
+                raise ValueError('gen_seg failed')
+
+        def html_writer(errh, term):
+            return FailingHtml(errh, StringIO(), term)
+        try:
+            pyx12.x12n_document.x12n_document(
+                self.param, self.filename, None, None, None, html_writer=html_writer)
+        except ValueError:
+            # The traceback still holds the reader, so it was closed explicitly
+            self.assertEqual(len(self.readers), 1)
+            self.assertTrue(self.readers[0].fd_in.closed)
+        else:
+            self.fail('ValueError not raised')
+
+
+class StreamingAck(X12DocumentTestCase):
+    """
+    Writing the 997/999 as the ST loops close gives the same response
+    """
+
+    def setUp(self):
+        self.param = pyx12.params.params()
+        self.strftime = pyx12.error_997.time.strftime
+        pyx12.error_997.time.strftime = lambda fmt: ''
+        self.randint = pyx12.error_999.random.randint
+        pyx12.error_999.random.randint = lambda a, b: a
+
+    def tearDown(self):
+        pyx12.error_997.time.strftime = self.strftime
+        pyx12.error_999.random.randint = self.randint
+
+    def _run(self, datakey, stream_ack):
+        fd_source = self._makeFd(datafiles[datakey]['source'])
+        fd_997 = StringIO()
+        result = pyx12.x12n_document.x12n_document(
+            self.param, fd_source, fd_997, None, None, stream_ack=stream_ack)
+        return (result, fd_997.getvalue())
+
+    def _test_same(self, datakey):
+        batch = self._run(datakey, False)
+        self.assertNotEqual(batch[1], '')
+        self.assertEqual(batch, self._run(datakey, True))
+
+    def test_trailer_errors(self):
+        self._test_same('trailer_errors')
+
+    def test_837miss(self):
+        self._test_same('837miss')
+
+    def test_999(self):
+        self._test_same('834_lui_id_5010')
+
+    def test_mult_isa(self):
+        self._test_same('mult_isa')
+
+    def test_multiple_trn(self):
+        # The envelope is built from the last GS loop
+        self._test_same('multiple_trn')
+
+    def test_spool_file(self):
+        # A body larger than the spool size is moved to a temporary file
+        spool_size = pyx12.error_visitor.SPOOL_MAX_SIZE
+        pyx12.error_visitor.SPOOL_MAX_SIZE = 10
+        try:
+            self._test_same('multiple_trn')
+            self._test_same('834_lui_id_5010')
+        finally:
+            pyx12.error_visitor.SPOOL_MAX_SIZE = spool_size
+
+    def test_spooled_body(self):
+        # Only the envelope waits for the end of the source
+        errh = pyx12.error_handler.err_handler()
+        fd_997 = StringIO()
+        visitor = pyx12.error_997.error_997_visitor(fd_997)
+        errh.set_ack_visitor(visitor)
+        src = pyx12.x12file.X12Reader(self._makeFd(datafiles['multiple_trn']['source']))
+        proc = pyx12.x12n_document._SegmentProcessor(
+            self.param, None, 'x12.control.00401.xml', errh)
+        for seg in src:
+            proc.process(seg, src)
+        self.assertEqual(fd_997.getvalue(), '')
+        self.assertTrue(visitor.spool.tell() > 0)
+        errh.finish_ack()
+        self.assertTrue(visitor.spool is None)
+        self.assertTrue(fd_997.getvalue().startswith('ISA'))
+
+    def test_released_st_loop(self):
+        errh = pyx12.error_handler.err_handler()
+        fd_997 = StringIO()
+        errh.set_ack_visitor(pyx12.error_997.error_997_visitor(fd_997))
+        src = pyx12.x12file.X12Reader(self._makeFd(datafiles['multiple_trn']['source']))
+        proc = pyx12.x12n_document._SegmentProcessor(
+            self.param, None, 'x12.control.00401.xml', errh)
+        for seg in src:
+            proc.process(seg, src)
+        errh.finish_ack()
+        st_nodes = [st_node for isa_node in errh.children
+                    for gs_node in isa_node.children
+                    for st_node in gs_node.children]
+        self.assertEqual(len(st_nodes), 5)
+        for st_node in st_nodes:
+            self.assertEqual(st_node.children, [])
+        self.assertTrue(errh.get_error_count() > 0)
+        self.assertTrue(fd_997.getvalue().rstrip().endswith('~'))
+        self.assertTrue('AK9*R*' in fd_997.getvalue())
+
+
+class HtmlPages(X12DocumentTestCase):
+    """
+    The paginated HTML writer
+    """
+
+    def setUp(self):
+        self.param = pyx12.params.params()
+        self.tmpdir = tempfile.mkdtemp()
+        self.index = os.path.join(self.tmpdir, 'out.html')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, datakey, **kwargs):
+        def html_writer(errh, term):
+            return pyx12.error_html.error_html_pages(errh, self.index, term, **kwargs)
+        fd_source = self._makeFd(datafiles[datakey]['source'])
+        pyx12.x12n_document.x12n_document(
+            self.param, fd_source, None, None, None, html_writer=html_writer)
+        with open(self.index) as fd:
+            index = fd.read()
+        pages = []
+        page_num = 1
+        while os.path.isfile(os.path.join(self.tmpdir, 'out.%i.html' % page_num)):
+            with open(os.path.join(self.tmpdir, 'out.%i.html' % page_num)) as fd:
+                pages.append(fd.read())
+            page_num += 1
+        return (index, pages)
+
+    def _lines(self, html_str, prefix):
+        return [line for line in html_str.splitlines() if line.startswith(prefix)]
+
+    def test_page_size(self):
+        fd_html = StringIO()
+        pyx12.x12n_document.x12n_document(self.param,
+            self._makeFd(datafiles['multiple_trn']['source']), None, fd_html, None)
+        (index, pages) = self._run('multiple_trn', page_size=10)
+        seg_lines = self._lines(fd_html.getvalue(), '<span class="seg">')
+        self.assertEqual(len(pages), (len(seg_lines) + 9) // 10)
+        for page in pages[:-1]:
+            self.assertEqual(len(self._lines(page, '<span class="seg">')), 10)
+        self.assertEqual(self._lines(''.join(pages), '<span'),
+                         self._lines(fd_html.getvalue(), '<span'))
+        for page_num in range(1, len(pages) + 1):
+            self.assertTrue('href="out.%i.html"' % page_num in index)
+
+    def test_per_st_loop(self):
+        (index, pages) = self._run('multiple_trn', per_st_loop=True)
+        self.assertEqual(len(pages), 6)
+        for page in pages[1:]:
+            self.assertTrue('&nbsp;ST*' in self._lines(page, '<span class="seg">')[0])
+
+    def test_errors_only(self):
+        (index, pages) = self._run('multiple_trn', errors_only=True)
+        self.assertEqual(len(pages), 1)
+        seg_lines = self._lines(pages[0], '<span class="seg">')
+        self.assertTrue(len(seg_lines) > 0)
+        self.assertTrue('Total segments with errors: %i' % len(seg_lines) in index)
+        self.assertFalse('&nbsp;ISA*' in pages[0])
@@ -1,7 +1,7 @@
 import unittest
 
-from pyx12.nodeCounter import NodeCounter
-#from pyx12.path import X12Path
+from pyx12.nodeCounter import NodeCounter, get_path_id
+from pyx12.path import X12Path
 
 
 class Default(unittest.TestCase):
@@ -48,3 +48,32 @@ class Default(unittest.TestCase):
         self.assertEqual(1, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/2110'))
         counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/2110')
         self.assertEqual(2, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/2110'))
+
+
+class PathIds(unittest.TestCase):
+    def test_path_forms_share_count(self):
+        counter = NodeCounter()
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/REF[EV]')
+        counter.increment(X12Path('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/REF[EV]'))
+        path_id = get_path_id('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/REF[EV]')
+        counter.increment(path_id)
+        self.assertEqual(3, counter.get_count(path_id))
+
+    def test_reset_keeps_siblings(self):
+        counter = NodeCounter()
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000')
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/LX')
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100')
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/CLP')
+        counter.increment('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000B')
+        counter.reset_to_node('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000')
+        self.assertEqual(1, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000'))
+        self.assertEqual(0, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/LX'))
+        self.assertEqual(0, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000/2100/CLP'))
+        self.assertEqual(1, counter.get_count('/ISA_LOOP/GS_LOOP/ST_LOOP/DETAIL/2000B'))
+
+    def test_state_round_trip(self):
+        counter = NodeCounter({'/ISA_LOOP': 1, X12Path('/ISA_LOOP/ISA'): 2})
+        state = counter.getState()
+        self.assertEqual(2, state[X12Path('/ISA_LOOP/ISA')])
+        self.assertEqual(1, NodeCounter(state).get_count('/ISA_LOOP'))
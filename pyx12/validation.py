@@ -23,6 +23,17 @@ except AttributeError:
     # Python 2.x
     REGEX_MODE = re.S
 
+# Characters allowed in ID and AN values, by character set
+_CHARSET_B = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!\"&'()*+,-./:;?= \t\n\r\f\v")
+_CHARSET_E = _CHARSET_B | frozenset("abcdefghijklmnopqrstuvwxyz%~@[]_{}\\|<>#$")
+_CHARSET_E5 = _CHARSET_E | frozenset("^`")
+_DIGITS = frozenset("0123456789")
+
+# Date and time validity, by (data_type, value)
+_date_cache = {}
+MAX_DATE_CACHE = 4096
+
+
 def IsValidDataType(str_val, data_type, charset='B', icvn='00401'):
     """
     Is str_val a valid X12 data value
@@ -40,36 +51,87 @@ def IsValidDataType(str_val, data_type, charset='B', icvn='00401'):
         return True
     if not isinstance(str_val, str):
         return False
+    return _get_kernel(data_type, charset, icvn)(str_val)
+
+
+def _get_id_charset(charset, icvn):
+    """
+    @return: Characters allowed in an ID or AN value, or None if the
+        character set is unknown
+    @rtype: frozenset
+    """
+    if charset == 'E':  # extended charset
+        if icvn == '00501':
+            return _CHARSET_E5
+        return _CHARSET_E
+    elif charset == 'B':  # basic charset
+        return _CHARSET_B
+    return None
+
+
+_kernels = {}
+
 
+def _get_kernel(data_type, charset, icvn):
+    """
+    Get the single value validation function for a data type
+
+    @rtype: function
+    """
+    key = (data_type, charset, icvn)
     try:
-        if data_type[0] == 'N':
-            if not match_re('N', str_val):
-                raise IsValidError  # not a number
-        elif data_type == 'R':
-            if not match_re('R', str_val):
-                raise IsValidError  # not a number
-        elif data_type in ('ID', 'AN'):
-            if not_match_re('ID', str_val, charset, icvn):
-                raise IsValidError
-        elif data_type == 'RD8':
-            if '-' in str_val:
-                (start, end) = str_val.split('-')
-                return IsValidDataType(start, 'D8', charset) and IsValidDataType(end, 'D8', charset)
-            else:
-                return False
-        elif data_type in ('DT', 'D8', 'D6'):
-            if not is_valid_date(data_type, str_val):
-                raise IsValidError
-        elif data_type == 'TM':
-            if not is_valid_time(str_val):
-                raise IsValidError
-        elif data_type == 'B':
-            pass
+        return _kernels[key]
+    except KeyError:
+        pass
+    if data_type[0] == 'N':
+        kernel = _is_valid_n
+    elif data_type in ('ID', 'AN'):
+        chars = _get_id_charset(charset, icvn)
+        if chars is None:
+            # Unknown character set, fails as not_match_re does
+            kernel = lambda val: not not_match_re('ID', val, charset, icvn)
         else:
-            raise IsValidError('Unknown data type %s' % data_type)
-    except IsValidError:
+            kernel = chars.issuperset
+    elif data_type in ('DT', 'D8', 'D6'):
+        kernel = lambda val: is_valid_date(data_type, val)
+    else:
+        kernel = _simple_kernels.get(data_type, _is_unknown_type)
+    _kernels[key] = kernel
+    return kernel
+
+
+def _is_valid_n(val):
+    if val[:1] == '-':
+        val = val[1:]
+    return val != '' and _DIGITS.issuperset(val)
+
+
+def _is_valid_r(val):
+    if val[:1] == '-':
+        val = val[1:]
+    (whole, point, fraction) = val.partition('.')
+    if not _DIGITS.issuperset(whole):
         return False
-    return True
+    return point == '' or (fraction != '' and _DIGITS.issuperset(fraction))
+
+
+def _is_valid_rd8(val):
+    if '-' in val:
+        (start, end) = val.split('-')
+        return is_valid_date('D8', start) and is_valid_date('D8', end)
+    return False
+
+
+def _is_unknown_type(val):
+    return False
+
+
+_simple_kernels = {
+    'R': _is_valid_r,
+    'RD8': _is_valid_rd8,
+    'TM': lambda val: is_valid_time(val),
+    'B': lambda val: True,
+}
 
 rec_N = re.compile("^-?[0-9]+", REGEX_MODE)
 rec_R = re.compile("^-?[0-9]*(\.[0-9]+)?", REGEX_MODE)
@@ -145,12 +207,26 @@ def is_valid_date(data_type, val):
     @return: True if valid, False if not
     @rtype: boolean
     """
+    try:
+        return _date_cache[(data_type, val)]
+    except KeyError:
+        pass
+    except TypeError:
+        return _is_valid_date(data_type, val)
+    res = _is_valid_date(data_type, val)
+    if len(_date_cache) >= MAX_DATE_CACHE:
+        _date_cache.clear()
+    _date_cache[(data_type, val)] = res
+    return res
+
+
+def _is_valid_date(data_type, val):
     try:
         if data_type == 'D8' and len(val) != 8:
             raise IsValidError
         if data_type == 'D6' and len(val) != 6:
             raise IsValidError
-        if not_match_re('DT', val):
+        if not _DIGITS.issuperset(val):
             raise IsValidError
         if len(val) in (6, 8, 12):  # valid lengths for date
             try:
@@ -197,7 +273,21 @@ def is_valid_time(val):
     @type val: string
     """
     try:
-        if not_match_re('TM', val):
+        return _date_cache[('TM', val)]
+    except KeyError:
+        pass
+    except TypeError:
+        return _is_valid_time(val)
+    res = _is_valid_time(val)
+    if len(_date_cache) >= MAX_DATE_CACHE:
+        _date_cache.clear()
+    _date_cache[('TM', val)] = res
+    return res
+
+
+def _is_valid_time(val):
+    try:
+        if not _DIGITS.issuperset(val):
             raise IsValidError
 
         if val[0:2] > '23' or val[2:4] > '59':  # check hour, minute segment
@@ -26,8 +26,8 @@ Interface to read and alter segments
 import pyx12
 from . import error_handler
 from . import errors
-from . import map_index
 from . import map_if
+from . import map_registry
 from . import x12file
 from . import path
 from .map_walker import walk_tree, pop_to_parent_loop  # get_pop_loops, get_push_loops
@@ -770,8 +770,8 @@ class X12ContextReader(object):
 
         #Get Map of Control Segments
         self.map_file = 'x12.control.00501.xml' if self.src.icvn == '00501' else 'x12.control.00401.xml'
-        self.control_map = map_if.load_map_file(self.map_file, param, self.map_path)
-        self.map_index_if = map_index.map_index(self.map_path)
+        self.control_map = map_registry.load_map_file(self.map_file, param, self.map_path)
+        self.map_index_if = map_registry.get_map_index(self.map_path)
         self.x12_map_node = self.control_map.getnodebypath('/ISA_LOOP/ISA')
         self.walker = walk_tree()
 
@@ -820,7 +820,7 @@ class X12ContextReader(object):
                         if self.map_file is None:
                             raise pyx12.errors.EngineError("Map not found.  icvn=%s, fic=%s, vriic=%s" %
                                                            (icvn, fic, vriic))
-                        cur_map = map_if.load_map_file(self.map_file, self.param, self.map_path)
+                        cur_map = map_registry.load_map_file(self.map_file, self.param, self.map_path)
                         if cur_map.id == '837':
                             self.src.check_837_lx = True
                         else:
@@ -843,7 +843,7 @@ class X12ContextReader(object):
                                 err_str = "Map not found.  icvn=%s, fic=%s, vriic=%s, tspc=%s" % \
                                     (icvn, fic, vriic, tspc)
                                 raise pyx12.errors.EngineError(err_str)
-                            cur_map = map_if.load_map_file(self.map_file, self.param, self.map_path)
+                            cur_map = map_registry.load_map_file(self.map_file, self.param, self.map_path)
                             if cur_map.id == '837':
                                 self.src.check_837_lx = True
                             else:
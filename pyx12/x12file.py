@@ -18,17 +18,22 @@ Interface to an X12 data stream.
    837 HL tree
 """
 
-import codecs
+import io
+import os
+import stat
 import sys
 import logging
 
 # Intrapackage imports
 import pyx12.errors
 import pyx12.segment
-from pyx12.rawx12file import RawX12File
+from pyx12.rawx12file import RawX12File, RawX12MmapFile
 
 logger = logging.getLogger('pyx12.x12file')
 
+# Size in characters of the output buffer used by X12Writer.write_many
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
 
 class X12Base(object):
     """
@@ -125,15 +130,16 @@ class X12Base(object):
         #    del self.loops[-1]
         elif seg_id == 'HL':
             self.hl_count += 1
-            hl_count = seg_data.get_value('HL01')
+            hl_count = seg_data.get_value_at(0)  # HL01
             if self.hl_count != self._int(hl_count):
                 #raise pyx12.errors.X12Error, \
                 #   'My HL count %i does not match your HL count %s' \
                 #    % (self.hl_count, seg[1])
                 err_str = 'My HL count %i does not match your HL count %s' % (self.hl_count, hl_count)
                 self._seg_error('HL1', err_str)
-            if seg_data.get_value('HL02') != '':
-                hl_parent = self._int(seg_data.get_value('HL02'))
+            hl_parent_id = seg_data.get_value_at(1)  # HL02
+            if hl_parent_id != '':
+                hl_parent = self._int(hl_parent_id)
                 if hl_parent not in self.hl_stack:
                     err_str = 'HL parent (%i) is not a valid parent' % (hl_parent)
                     self._seg_error('HL2', err_str)
@@ -149,7 +155,7 @@ class X12Base(object):
             self.lx_count = 0
         elif self.check_837_lx and seg_id == 'LX':
             self.lx_count += 1
-            if seg_data.get_value('LX01') != '%i' % (self.lx_count):
+            if seg_data.get_value_at(0) != '%i' % (self.lx_count):  # LX01
                 err_str = 'Your 2400/LX01 Service Line Number %s does not match my count of %i' % \
                     (seg_data.get_value('LX01'), self.lx_count)
                 self._seg_error('LX', err_str)
@@ -293,16 +299,23 @@ class X12Reader(X12Base):
     errors can be retrieved using the pop_errors function
     """
 
-    def __init__(self, src_file_obj):
+    def __init__(self, src_file_obj, use_mmap=True):
         """
         Initialize the file X12 file reader
 
+        A named regular file is memory mapped.  Stdin, pipes and file objects
+        are streamed.
+
         @param src_file_obj: absolute path of source file or an open,
             readable file object
         @type src_file_obj: string or open file object
+        @param use_mmap: Memory map named regular files
+        @type use_mmap: boolean
         """
         self.fd_in = None
+        self.raw = None
         self.need_to_close = False
+        X12Base.__init__(self)
         try:
             res = src_file_obj.closed
             self.fd_in = src_file_obj
@@ -310,12 +323,15 @@ class X12Reader(X12Base):
             if src_file_obj == '-':
                 self.fd_in = sys.stdin
             else:
-                self.fd_in = open(src_file_obj, 'U')
+                self.fd_in = open(src_file_obj, 'rb')
                 self.need_to_close = True
-        X12Base.__init__(self)
         try:
-            self.raw = RawX12File(self.fd_in)
-        except pyx12.errors.X12Error:
+            if self.need_to_close and use_mmap:
+                self.raw = self._get_mmap_reader(self.fd_in)
+            if self.raw is None:
+                self.raw = RawX12File(self.fd_in)
+        except Exception:
+            self.close()
             raise
         (seg_term, ele_term, subele_term, eol, repetition_term) = self.raw.get_term()
         self.seg_term = seg_term
@@ -326,11 +342,48 @@ class X12Reader(X12Base):
 
     def __del__(self):
         try:
-            if self.need_to_close:
-                self.fd_in.close()
+            self.close()
         except Exception:
             pass
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the memory mapping and close the source file if it was
+        opened by the reader
+        """
+        try:
+            if isinstance(self.raw, RawX12MmapFile):
+                self.raw.close()
+        finally:
+            if self.need_to_close:
+                self.need_to_close = False
+                self.fd_in.close()
+
+    def _get_mmap_reader(self, fd):
+        """
+        Map a regular, non-empty file into memory
+
+        @return: the mapped reader, or None if the file must be streamed
+        @rtype: L{rawx12file.RawX12MmapFile}
+        """
+        try:
+            st = os.fstat(fd.fileno())
+        except (AttributeError, OSError):
+            return None
+        if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+            return None
+        try:
+            return RawX12MmapFile(fd)
+        except (ValueError, EnvironmentError):
+            logger.debug('Could not memory map the source file, streaming it')
+            return None
+
     def _parse_segment(self, seg_data):
         """
         Catch segment issues
@@ -434,25 +487,43 @@ class X12Writer(X12Base):
     X12 file and stream writer
     """
 
-    def __init__(self, src_file_obj, seg_term='~', ele_term='*', subele_term='\\', eol='\n', repetition_term='^'):
+    def __init__(self, src_file_obj, seg_term='~', ele_term='*', subele_term='\\', eol='\n', repetition_term='^',
+                 buffer_size=None, binary=False):
         """
         Initialize the file X12 file writer
 
         @param src_file_obj: absolute path of source file or an open,
             readable file object
         @type src_file_obj: string or open file object
+        @param buffer_size: If given, the formatted segments are held until
+            about this many characters are ready, and written together.
+            L{Close} or L{Flush} writes any held segments.
+        @type buffer_size: int
+        @param binary: Write ASCII encoded bytes.  A file object must then
+            be opened in binary mode
+        @type binary: boolean
         """
         self.fd_out = None
+        self.decode_out = False
         try:
             res = src_file_obj.write
             # isinstance(f, file)
             self.fd_out = src_file_obj
         except AttributeError:
             if src_file_obj == '-':
-                self.fd_out = sys.stdout
+                self.fd_out = getattr(sys.stdout, 'buffer', sys.stdout) \
+                    if binary else sys.stdout
+            elif binary:
+                self.fd_out = io.open(src_file_obj, mode='wb')
             else:
-                self.fd_out = codecs.open(
-                    src_file_obj, mode='w', encoding='ascii')
+                self.fd_out = io.open(src_file_obj, mode='w', encoding='ascii',
+                                      newline='')
+                # A Python 2 text file only takes unicode
+                self.decode_out = bytes is str
+        self.buffer_size = buffer_size
+        self.binary = binary
+        self.buffer = []
+        self.buffer_len = 0
         #assert self.fd_out.encoding in ('ascii', 'US-ASCII'), 'Outfile file must have ASCII encoding, is %s' % (self.fd_out.encoding)
         X12Base.__init__(self)
         #terms = set([seg_term, ele_term, subele_term, repetition_term])
@@ -467,8 +538,19 @@ class X12Writer(X12Base):
         End any open loops.  Should be called at the end of writing.
         """
         self._popToLoop('ISA')
+        self.Flush()
         X12Base.Close(self)
 
+    def Flush(self):
+        """
+        Write any held segments
+        """
+        if self.buffer:
+            out = ''.join(self.buffer)
+            self.buffer = []
+            self.buffer_len = 0
+            self._write_out(out)
+
     def Write(self, seg_data):
         """
         Write the segment to the stream given current separators
@@ -496,6 +578,25 @@ class X12Writer(X12Base):
         else:
             self._write_segment(seg_data)
 
+    def write_many(self, segments):
+        """
+        Write a sequence of segments, as L{Write} would.  The output is
+        written in large blocks, even if the writer is not buffered.
+
+        @param segments: Segment data instances
+        @type segments: iterable of L{segment<segment.Segment>}
+        """
+        buffer_size = self.buffer_size
+        if buffer_size is None:
+            self.buffer_size = DEFAULT_BUFFER_SIZE
+        try:
+            for seg_data in segments:
+                self.Write(seg_data)
+        finally:
+            if buffer_size is None:
+                self.Flush()
+                self.buffer_size = None
+
     def _close_loop(self, loop_type, loop_id):
         if loop_type == 'ISA':
             self._close_iea(loop_id)
@@ -559,8 +660,7 @@ class X12Writer(X12Base):
         @type seg_data: L{segment<segment.Segment>}
         """
         out = seg_data.format(self.seg_term, self.ele_term, self.subele_term) + self.eol
-        # self.fd_out.write(out.decode('ascii'))
-        self.fd_out.write(out)
+        self._write(out)
 
     def _write_isa_segment(self, seg_data):
         """
@@ -578,7 +678,32 @@ class X12Writer(X12Base):
         seg_data.set('ISA16', self.subele_term)
         out = seg_data.format(
             self.seg_term, self.ele_term, self.subele_term) + self.eol
-        # self.fd_out.write(out.decode('ascii'))
+        self._write(out)
+
+    def _write(self, out):
+        """
+        Write or hold a formatted segment
+
+        @param out: formatted segment
+        @type out: string
+        """
+        if self.buffer_size is None:
+            self._write_out(out)
+        else:
+            self.buffer.append(out)
+            self.buffer_len += len(out)
+            if self.buffer_len >= self.buffer_size:
+                self.Flush()
+
+    def _write_out(self, out):
+        """
+        @param out: formatted segments
+        @type out: string
+        """
+        if self.binary:
+            out = out.encode('ascii')
+        elif self.decode_out:
+            out = out.decode('ascii')
         self.fd_out.write(out)
 
     def _get_trailer_segment(self, seg_id, count, id):
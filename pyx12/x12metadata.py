@@ -10,8 +10,8 @@ if os.path.isdir(libpath):
 # Intrapackage imports
 import pyx12.error_handler
 import pyx12.errors
-import pyx12.map_index
 import pyx12.map_if
+import pyx12.map_registry
 import pyx12.params
 import pyx12.x12file
 from pyx12.map_walker import walk_tree
@@ -30,8 +30,8 @@ def get_x12file_metadata(param, src_file, map_path=None):
     #Get Map of Control Segments
     map_file = 'x12.control.00501.xml' if src.icvn == '00501' else 'x12.control.00401.xml'
     logger.debug('X12 control file: %s' % (map_file))
-    control_map = pyx12.map_if.load_map_file(map_file, param, map_path)
-    map_index_if = pyx12.map_index.map_index(map_path)
+    control_map = pyx12.map_registry.load_map_file(map_file, param, map_path)
+    map_index_if = pyx12.map_registry.get_map_index(map_path)
     node = control_map.getnodebypath('/ISA_LOOP/ISA')
     walker = walk_tree()
     icvn = fic = vriic = tspc = None
@@ -74,7 +74,7 @@ def get_x12file_metadata(param, src_file, map_path=None):
                 if map_file is None:
                     err_str = "Map not found.  icvn={}, fic={}, vriic={}".format(icvn, fic, vriic)
                     raise pyx12.errors.EngineError(err_str)
-                cur_map = pyx12.map_if.load_map_file(map_file, param, map_path)
+                cur_map = pyx12.map_registry.load_map_file(map_file, param, map_path)
                 src.check_837_lx = True if cur_map.id == '837' else False
                 logger.debug('Map file: %s' % (map_file))
             node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
@@ -93,7 +93,7 @@ def get_x12file_metadata(param, src_file, map_path=None):
                         err_str = "Map not found.  icvn={}, fic={}, vriic={}, tspc={}".format(
                                     icvn, fic, vriic, tspc)
                         raise pyx12.errors.EngineError(err_str)
-                    cur_map = pyx12.map_if.load_map_file(map_file, param, map_path)
+                    cur_map = pyx12.map_registry.load_map_file(map_file, param, map_path)
                     src.check_837_lx = True if cur_map.id == '837' else False
                     logger.debug('Map file: %s' % (map_file))
                     node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/BHT')
@@ -14,6 +14,7 @@ Create XML, HTML, and 997/999 documents based on the data file.
 """
 
 import logging
+from io import StringIO
 
 # Intrapackage imports
 import pyx12.error_handler
@@ -21,8 +22,8 @@ import pyx12.error_997
 import pyx12.error_999
 import pyx12.error_html
 import pyx12.errors
-import pyx12.map_index
 import pyx12.map_if
+import pyx12.map_registry
 import pyx12.x12file
 from pyx12.map_walker import walk_tree
 import pyx12.x12xml_simple
@@ -46,90 +47,258 @@ def _reset_counter_to_gs_counts(walker):
     walker.counter.increment('/ISA_LOOP/GS_LOOP/GS')
 
 
-def x12n_document(param, src_file, fd_997, fd_html,
-                  fd_xmldoc=None, xslt_files=None, map_path=None,
-                  callback=None):
+# Minimum number of segments in a batch of ST loops sent to a worker
+PARALLEL_BATCH_SEGMENTS = 2000
+
+ST_LOOP_PATH = '/ISA_LOOP/GS_LOOP/ST_LOOP'
+
+
+class _ReaderState(object):
     """
-    Primary X12 validation function
-    @param param: pyx12.param instance
-    @param src_file: Source document
-    @type src_file: string
-    @param fd_997: 997/999 output document
-    @type fd_997: file descriptor
-    @param fd_html: HTML output document
-    @type fd_html: file descriptor
-    @param fd_xmldoc: XML output document
-    @type fd_xmldoc: file descriptor
-    @rtype: boolean
+    The X12Reader state used when processing a segment.  Captured as the
+    segment is read, so the segment can be processed later or in another
+    process.
     """
-    logger = logging.getLogger('pyx12')
-    errh = pyx12.error_handler.err_handler()
+    __slots__ = ('cur_line', 'seg_count', 'ls_id', 'isa_id', 'gs_id',
+                 'st_id', 'st_count', 'errors')
 
-    # Get X12 DATA file
-    try:
-        src = pyx12.x12file.X12Reader(src_file)
-    except pyx12.errors.X12Error:
-        logger.error('"%s" does not look like an X12 data file' % (src_file))
-        return False
+    def __init__(self, src, errors=None):
+        """
+        @param src: X12file source
+        @type src: L{X12file<x12file.X12Reader>}
+        @param errors: reader errors to keep.  If None, pops the errors of src
+        """
+        self.cur_line = src.get_cur_line()
+        self.seg_count = src.get_seg_count()
+        self.ls_id = src.get_ls_id()
+        self.isa_id = src.get_isa_id()
+        self.gs_id = src.get_gs_id()
+        self.st_id = src.get_st_id()
+        self.st_count = src.st_count
+        self.errors = src.pop_errors() if errors is None else errors
+
+
+class _ReplaySource(object):
+    """
+    Stands in for the X12Reader when processing previously read segments
+    """
+    def __init__(self, term):
+        """
+        @param term: the original terminators, from X12Reader.get_term
+        @type term: tuple(string, string, string, string)
+        """
+        self.term = term
+        self.err_list = []
+        self.check_837_lx = False
+        self.cur_line = 0
+        self.st_count = 0
+        self.state = None
+
+    def set_state(self, state):
+        """
+        Make the reader state of the next segment current
+        @type state: L{_ReaderState}
+        """
+        self.state = state
+        self.cur_line = state.cur_line
+        self.st_count = state.st_count
+        self.err_list.extend(state.errors)
+
+    def pop_errors(self):
+        tmp = self.err_list
+        self.err_list = []
+        return tmp
+
+    def get_isa_id(self):
+        return self.state.isa_id
+
+    def get_gs_id(self):
+        return self.state.gs_id
+
+    def get_st_id(self):
+        return self.state.st_id
+
+    def get_ls_id(self):
+        return self.state.ls_id
+
+    def get_seg_count(self):
+        return self.state.seg_count
+
+    def get_cur_line(self):
+        return self.cur_line
+
+    def get_term(self):
+        return self.term
+
+
+def _get_ack_visitor(fd_997, fic, vriic, term):
+    """
+    @return: The 997 or 999 visitor for a functional group, or None if no
+        acknowledgment is generated
+    @rtype: L{error_visitor.error_visitor}
+    """
+    if fic == 'FA' or not vriic:
+        return None
+    if vriic[:6] == '004010':
+        return pyx12.error_997.error_997_visitor(fd_997, term)
+    if vriic[:6] == '005010':
+        return pyx12.error_999.error_999_visitor(fd_997, term)
+    return None
+
+
+class _SegmentProcessor(object):
+    """
+    Walks and validates the segments of a source document, one at a time,
+    feeding the error handler, HTML and XML output.
+
+    With more than one job, complete ST loops are collected into batches and
+    validated by L{_validate_st_loops} in a process pool.  The results are
+    merged back in file order before the next segment outside an ST loop is
+    processed.
+    """
+    def __init__(self, param, map_path, control_map_file, errh, html=None,
+                 xmldoc=None, callback=None, jobs=1, fd_ack=None):
+        """
+        @param param: pyx12.param instance
+        @param map_path: Override directory containing map xml files
+        @type map_path: string
+        @param control_map_file: map file of the ISA and GS control segments
+        @type control_map_file: string
+        @param errh: Error handler
+        @type errh: L{error_handler.err_handler}
+        @param html: HTML error writer
+        @type html: L{error_html.error_html}
+        @param xmldoc: XML writer
+        @type xmldoc: L{x12xml_simple.x12xml_simple}
+        @param jobs: Number of processes validating ST loops.  Only used
+            without xmldoc and callback
+        @type jobs: int
+        @param fd_ack: If given, the 997/999 is written here as the loops are
+            closed.  The acknowledgment type is set by the first GS segment
+        @type fd_ack: file descriptor
+        """
+        self.logger = logging.getLogger('pyx12')
+        self.param = param
+        self.map_path = map_path
+        self.control_map_file = control_map_file
+        self.control_map = pyx12.map_registry.load_map_file(control_map_file, param, map_path)
+        self.map_index_if = pyx12.map_registry.get_map_index(map_path)
+        self.errh = errh
+        self.html = html
+        self.xmldoc = xmldoc
+        self.callback = callback
+        self.fd_ack = fd_ack
+        self.node = self.control_map.getnodebypath('/ISA_LOOP/ISA')
+        self.walker = walk_tree()
+        self.icvn = self.fic = self.vriic = self.tspc = None
+        self.map_file = control_map_file
+        self.cur_map = None  # we do not initially know the X12 transaction type
+        self.valid = True
+        self.jobs = jobs if xmldoc is None and callback is None \
+            and (html is None or html.batch_output) else 1
+        if self.jobs > 1:
+            try:
+                import concurrent.futures
+            except ImportError:
+                # Python 2 without the futures backport
+                self.logger.warning('concurrent.futures is not available, validating serially')
+                self.jobs = 1
+        self.executor = None
+        self.parallel = False  # Are ST loops of the current GS loop batched
+        self.isa_record = None
+        self.gs_record = None
+        self.chunk = None  # The open ST loop
+        self.batch = []
+        self.batch_start = None
+        self.pending = []
+
+    def process(self, seg, src):
+        """
+        Process the next segment
+        @param seg: Segment object
+        @type seg: L{segment<segment.Segment>}
+        @param src: X12file source
+        @type src: L{X12file<x12file.X12Reader>}
+        """
+        if self.parallel:
+            seg_id = seg.get_seg_id()
+            if self.chunk is not None:
+                if seg_id not in ('ISA', 'IEA', 'GS', 'GE', 'ST'):
+                    self.chunk.append((seg, _ReaderState(src)))
+                    if seg_id == 'SE':
+                        self._close_chunk()
+                    return
+                # Unterminated ST loop
+                self._stop_parallel(src)
+            elif seg_id == 'ST' and self.node.id in ('GS', 'SE'):
+                self.chunk = [(seg, _ReaderState(src))]
+                return
+            else:
+                self._merge_pending()
+                if seg_id not in ('ISA', 'IEA', 'GS', 'GE'):
+                    # Segment outside of a ST loop
+                    self.parallel = False
+        self._process(seg, src)
+        if self.jobs > 1:
+            seg_id = seg.get_seg_id()
+            if seg_id == 'ISA':
+                self.isa_record = (seg, _ReaderState(src, []))
+                self.parallel = False
+            elif seg_id == 'GS':
+                self.gs_record = (seg, _ReaderState(src, []))
+                # The 4010 837P may switch maps at the BHT segment
+                self.parallel = self.cur_map is not None \
+                    and self.vriic not in ('004010X094', '004010X094A1')
 
-    #Get Map of Control Segments
-    map_file = 'x12.control.00501.xml' if src.icvn == '00501' else 'x12.control.00401.xml'
-    logger.debug('X12 control file: %s' % (map_file))
-    control_map = pyx12.map_if.load_map_file(map_file, param, map_path)
-    map_index_if = pyx12.map_index.map_index(map_path)
-    node = control_map.getnodebypath('/ISA_LOOP/ISA')
-    walker = walk_tree()
-    icvn = fic = vriic = tspc = None
-    cur_map = None  # we do not initially know the X12 transaction type
-    #XXX Generate TA1 if needed.
-
-    if fd_html:
-        html = pyx12.error_html.error_html(errh, fd_html, src.get_term())
-        html.header()
-        err_iter = pyx12.error_handler.err_iter(errh)
-    if fd_xmldoc:
-        xmldoc = pyx12.x12xml_simple.x12xml_simple(fd_xmldoc, param.get('simple_dtd'))
-
-    #basedir = os.path.dirname(src_file)
-    #erx = errh_xml.err_handler(basedir=basedir)
-
-    valid = True
-    for seg in src:
+    def finish(self, src):
+        """
+        Process any outstanding ST loops, at the end of the source
+        """
+        if self.chunk is not None:
+            self._stop_parallel(src)
+        self._merge_pending()
+
+    def shutdown(self):
+        """
+        Stop the worker processes
+        """
+        if self.executor is not None:
+            for future in self.pending:
+                future.cancel()
+            self.pending = []
+            self.executor.shutdown()
+            self.executor = None
+
+    def _process(self, seg, src):
+        """
+        Walk and validate a segment
+        """
+        errh = self.errh
         #find node
-        orig_node = node
-
-        if False:
-            print('--------------------------------------------')
-            print(seg)
-            print('--------------------------------------------')
-            # reset to control map for ISA and GS loops
-            print('------- counters before --------')
-            print(walker.counter._dict)
+        orig_node = self.node
+        node = self.node
         if seg.get_seg_id() == 'ISA':
-            node = control_map.getnodebypath('/ISA_LOOP/ISA')
-            walker.forceWalkCounterToLoopStart('/ISA_LOOP', '/ISA_LOOP/ISA')
+            node = self.control_map.getnodebypath('/ISA_LOOP/ISA')
+            self.walker.forceWalkCounterToLoopStart('/ISA_LOOP', '/ISA_LOOP/ISA')
         elif seg.get_seg_id() == 'GS':
-            node = control_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
-            walker.forceWalkCounterToLoopStart('/ISA_LOOP/GS_LOOP', '/ISA_LOOP/GS_LOOP/GS')
+            node = self.control_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
+            self.walker.forceWalkCounterToLoopStart('/ISA_LOOP/GS_LOOP', '/ISA_LOOP/GS_LOOP/GS')
         else:
             # from the current node, find the map node matching the segment
             # keep track of the loops traversed
             try:
-                (node, pop_loops, push_loops) = walker.walk(node, seg, errh,
+                (node, pop_loops, push_loops) = self.walker.walk(node, seg, errh,
                     src.get_seg_count(), src.get_cur_line(), src.get_ls_id())
             except pyx12.errors.EngineError:
-                logger.error('Source file line %i' % (src.get_cur_line()))
+                self.logger.error('Source file line %i' % (src.get_cur_line()))
                 raise
 
-        if False:
-            print('------- counters after --------')
-            print(walker.counter._dict)
         if node is None:
             node = orig_node
         else:
             if seg.get_seg_id() == 'ISA':
                 errh.add_isa_loop(seg, src)
-                icvn = seg.get_value('ISA12')
+                self.icvn = seg.get_value('ISA12')
                 errh.handle_errors(src.pop_errors())
             elif seg.get_seg_id() == 'IEA':
                 errh.handle_errors(src.pop_errors())
@@ -137,44 +306,44 @@ def x12n_document(param, src_file, fd_997, fd_html,
                 # Generate 997
                 #XXX Generate TA1 if needed.
             elif seg.get_seg_id() == 'GS':
-                fic = seg.get_value('GS01')
-                vriic = seg.get_value('GS08')
-                map_file_new = map_index_if.get_filename(icvn, vriic, fic)
-                if map_file != map_file_new:
-                    map_file = map_file_new
-                    if map_file is None:
-                        err_str = "Map not found.  icvn={}, fic={}, vriic={}".format(icvn, fic, vriic)
+                self.fic = seg.get_value('GS01')
+                self.vriic = seg.get_value('GS08')
+                map_file_new = self.map_index_if.get_filename(self.icvn, self.vriic, self.fic)
+                if self.map_file != map_file_new:
+                    self.map_file = map_file_new
+                    if self.map_file is None:
+                        err_str = "Map not found.  icvn={}, fic={}, vriic={}".format(
+                            self.icvn, self.fic, self.vriic)
                         raise pyx12.errors.EngineError(err_str)
-                    cur_map = pyx12.map_if.load_map_file(map_file, param, map_path)
-                    src.check_837_lx = True if cur_map.id == '837' else False
-                    logger.debug('Map file: %s' % (map_file))
-                    #apply_loop_count(orig_node, cur_map)
-                    #reset_isa_counts(cur_map)
-                    #_reset_counter_to_isa_counts(walker)  # new counter
-                #reset_gs_counts(cur_map)
-                #_reset_counter_to_gs_counts(walker)  # new counter
-                node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
+                    self.cur_map = pyx12.map_registry.load_map_file(self.map_file, self.param, self.map_path)
+                    src.check_837_lx = True if self.cur_map.id == '837' else False
+                    self.logger.debug('Map file: %s' % (self.map_file))
+                node = self.cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/GS')
+                if self.fd_ack is not None:
+                    visitor = _get_ack_visitor(self.fd_ack, self.fic, self.vriic, src.get_term())
+                    if visitor is not None:
+                        errh.set_ack_visitor(visitor)
+                    self.fd_ack = None
                 errh.add_gs_loop(seg, src)
                 errh.handle_errors(src.pop_errors())
             elif seg.get_seg_id() == 'BHT':
                 # special case for 4010 837P
-                if vriic in ('004010X094', '004010X094A1'):
-                    tspc = seg.get_value('BHT02')
-                    logger.debug('icvn=%s, fic=%s, vriic=%s, tspc=%s' %
-                                 (icvn, fic, vriic, tspc))
-                    map_file_new = map_index_if.get_filename(icvn, vriic, fic, tspc)
-                    logger.debug('New map file: %s' % (map_file_new))
-                    if map_file != map_file_new:
-                        map_file = map_file_new
-                        if map_file is None:
+                if self.vriic in ('004010X094', '004010X094A1'):
+                    self.tspc = seg.get_value('BHT02')
+                    self.logger.debug('icvn=%s, fic=%s, vriic=%s, tspc=%s' %
+                                      (self.icvn, self.fic, self.vriic, self.tspc))
+                    map_file_new = self.map_index_if.get_filename(self.icvn, self.vriic, self.fic, self.tspc)
+                    self.logger.debug('New map file: %s' % (map_file_new))
+                    if self.map_file != map_file_new:
+                        self.map_file = map_file_new
+                        if self.map_file is None:
                             err_str = "Map not found.  icvn={}, fic={}, vriic={}, tspc={}".format(
-                                        icvn, fic, vriic, tspc)
+                                self.icvn, self.fic, self.vriic, self.tspc)
                             raise pyx12.errors.EngineError(err_str)
-                        cur_map = pyx12.map_if.load_map_file(map_file, param, map_path)
-                        src.check_837_lx = True if cur_map.id == '837' else False
-                        logger.debug('Map file: %s' % (map_file))
-                        #apply_loop_count(node, cur_map)
-                        node = cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/BHT')
+                        self.cur_map = pyx12.map_registry.load_map_file(self.map_file, self.param, self.map_path)
+                        src.check_837_lx = True if self.cur_map.id == '837' else False
+                        self.logger.debug('Map file: %s' % (self.map_file))
+                        node = self.cur_map.getnodebypath('/ISA_LOOP/GS_LOOP/ST_LOOP/HEADER/BHT')
                 errh.add_seg(node, seg, src.get_seg_count(), src.get_cur_line(), src.get_ls_id())
                 errh.handle_errors(src.pop_errors())
             elif seg.get_seg_id() == 'GE':
@@ -190,76 +359,237 @@ def x12n_document(param, src_file, fd_997, fd_html,
                 errh.add_seg(node, seg, src.get_seg_count(), src.get_cur_line(), src.get_ls_id())
                 errh.handle_errors(src.pop_errors())
 
-            #errh.set_cur_line(src.get_cur_line())
-            valid &= node.is_valid(seg, errh)
-            #erx.handleErrors(src.pop_errors())
-            #erx.handleErrors(errh.get_errors())
-            #errh.reset()
-        if callback:
+            self.valid &= node.is_valid(seg, errh)
+        self.node = node
+        if self.callback:
             try:
-                callback(seg, src, node, valid)
+                self.callback(seg, src, node, self.valid)
             except:
-                logger.error('callback failed')
+                self.logger.error('callback failed')
                 pass
-        if fd_html:
+        if self.html is not None:
             if node is not None and node.is_first_seg_in_loop():
-                html.loop(node.get_parent())
-            err_node_list = []
-            while True:
-                try:
-                    next(err_iter)
-                    err_node = err_iter.get_cur_node()
-                    err_node_list.append(err_node)
-                except pyx12.errors.IterOutOfBounds:
-                    break
-            html.gen_seg(seg, src, err_node_list)
+                self.html.loop(node.get_parent())
+            self.html.gen_seg(seg, src)
 
-        if fd_xmldoc:
-            xmldoc.seg(node, seg)
+        if self.xmldoc is not None:
+            self.xmldoc.seg(node, seg)
 
-        if False:
-            print('\n\n')
-        #erx.Write(src.cur_line)
+    def _replay(self, records, src):
+        """
+        Process previously read segments
+        """
+        replay_src = _ReplaySource(src.get_term())
+        replay_src.check_837_lx = src.check_837_lx
+        for (seg, state) in records:
+            replay_src.set_state(state)
+            self._process(seg, replay_src)
+        # Errors not yet handled stay with the source
+        src.err_list[0:0] = replay_src.pop_errors()
 
-    #erx.handleErrors(src.pop_errors())
-    src.cleanup()  # Catch any skipped loop trailers
-    errh.handle_errors(src.pop_errors())
-    #erx.handleErrors(src.pop_errors())
-    #erx.handleErrors(errh.get_errors())
+    def _close_chunk(self):
+        """
+        Add the closed ST loop to the batch.  Move the walker past the ST loop
+        as walking it here would.
+        """
+        if not self.batch:
+            self.batch_start = (self.node.get_path(), self.walker.getCountState())
+        self.batch.append(self.chunk)
+        self.chunk = None
+        self.walker.forceWalkCounterToLoopStart(ST_LOOP_PATH, ST_LOOP_PATH + '/ST')
+        self.walker.counter.increment(ST_LOOP_PATH + '/SE')
+        self.node = self.cur_map.getnodebypath(ST_LOOP_PATH + '/SE')
+        if sum([len(chunk) for chunk in self.batch]) >= PARALLEL_BATCH_SEGMENTS:
+            self._submit_batch()
 
-    if fd_html:
-        html.footer()
-        del html
+    def _submit_batch(self):
+        """
+        Send the batch of ST loops to a worker
+        """
+        if not self.batch:
+            return
+        if self.executor is None:
+            # Only needed for jobs > 1; not in the Python 2 standard library
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+        (start_path, counts) = self.batch_start
+        records = []
+        for chunk in self.batch:
+            records.extend(chunk)
+        term = None
+        if self.html is not None:
+            term = (self.html.seg_term, self.html.ele_term, self.html.subele_term)
+        args = (self.param, self.map_path, self.control_map_file, self.map_file,
+                self.icvn, self.fic, self.vriic, self.isa_record, self.gs_record,
+                start_path, counts, records, term)
+        self.pending.append(self.executor.submit(_validate_st_loops, args))
+        self.batch = []
+        self.batch_start = None
 
-    if fd_xmldoc:
-        del xmldoc
+    def _merge_pending(self):
+        """
+        Wait for the outstanding batches, and merge their results in order
+        """
+        self._submit_batch()
+        for future in self.pending:
+            (st_nodes, html_str, valid) = future.result()
+            for st_node in st_nodes:
+                self.errh.merge_st_loop(st_node)
+            self.valid &= valid
+            if self.html is not None:
+                self.html.fd.write(html_str)
+        self.pending = []
 
-    #visit_debug = pyx12.error_debug.error_debug_visitor(sys.stdout)
-    #errh.accept(visit_debug)
+    def _stop_parallel(self, src):
+        """
+        Process the open ST loop here, and the rest of the GS loop
+        """
+        self._merge_pending()
+        chunk = self.chunk
+        self.chunk = None
+        self.parallel = False
+        self._replay(chunk, src)
+
+
+def _validate_st_loops(args):
+    """
+    Walk and validate a batch of complete ST loops of one GS loop
+
+    @return: the ST loop error nodes, the HTML of the segments, and whether
+        the segments are valid
+    @rtype: tuple(list[L{error_handler.err_st}], string, boolean)
+    """
+    (param, map_path, control_map_file, map_file, icvn, fic, vriic,
+     isa_record, gs_record, start_path, counts, records, term) = args
+    errh = pyx12.error_handler.err_handler()
+    src = _ReplaySource(term)
+    # Rebuild the enclosing ISA and GS loops the ST loops are added to
+    src.set_state(isa_record[1])
+    errh.add_isa_loop(isa_record[0], src)
+    src.set_state(gs_record[1])
+    errh.add_gs_loop(gs_record[0], src)
+    fd_html = None
+    html = None
+    if term is not None:
+        fd_html = StringIO()
+        html = pyx12.error_html.error_html(errh, fd_html, term)
+    proc = _SegmentProcessor(param, map_path, control_map_file, errh, html)
+    proc.icvn = icvn
+    proc.fic = fic
+    proc.vriic = vriic
+    proc.map_file = map_file
+    proc.cur_map = pyx12.map_registry.load_map_file(map_file, param, map_path)
+    proc.node = proc.cur_map.getnodebypath(start_path)
+    proc.walker.setCountState(counts)
+    for (seg, state) in records:
+        src.set_state(state)
+        proc._process(seg, src)
+    st_nodes = errh.cur_gs_node.children
+    for st_node in st_nodes:
+        st_node.parent = None
+        st_node.container = None
+    html_str = fd_html.getvalue() if fd_html is not None else ''
+    return (st_nodes, html_str, proc.valid)
+
+
+def x12n_document(param, src_file, fd_997, fd_html,
+                  fd_xmldoc=None, xslt_files=None, map_path=None,
+                  callback=None, jobs=1, stream_ack=False, html_writer=None):
+    """
+    Primary X12 validation function
+    @param param: pyx12.param instance
+    @param src_file: Source document
+    @type src_file: string
+    @param fd_997: 997/999 output document
+    @type fd_997: file descriptor
+    @param fd_html: HTML output document
+    @type fd_html: file descriptor
+    @param fd_xmldoc: XML output document
+    @type fd_xmldoc: file descriptor
+    @param jobs: Number of processes used to validate the ST loops.  The ST
+        loops are validated in this process if fd_xmldoc or callback is given
+    @type jobs: int
+    @param stream_ack: Write the 997/999 as each ST loop is closed, and
+        release the segment errors of the acknowledged ST loops
+    @type stream_ack: boolean
+    @param html_writer: Called with the error handler and the source
+        terminators to create the HTML error writer, used instead of fd_html
+    @type html_writer: callable
+    @rtype: boolean
+    """
+    logger = logging.getLogger('pyx12')
+    errh = pyx12.error_handler.err_handler()
+
+    # Get X12 DATA file
+    try:
+        src = pyx12.x12file.X12Reader(src_file)
+    except pyx12.errors.X12Error:
+        logger.error('"%s" does not look like an X12 data file' % (src_file))
+        return False
 
-    #If this transaction is not a 997/999, generate one.
-    if fd_997 and fic != 'FA':
-        if vriic and vriic[:6] == '004010':
-            try:
-                visit_997 = pyx12.error_997.error_997_visitor(fd_997, src.get_term())
-                errh.accept(visit_997)
-                del visit_997
-            except Exception:
-                logger.exception('Failed to create 997 response')
-        if vriic and vriic[:6] == '005010':
-            try:
-                visit_999 = pyx12.error_999.error_999_visitor(fd_997, src.get_term())
-                errh.accept(visit_999)
-                del visit_999
-            except Exception:
-                logger.exception('Failed to create 999 response')
-    del node
-    del src
-    del control_map
     try:
-        del cur_map
-    except UnboundLocalError:
-        pass
+        #Get Map of Control Segments
+        map_file = 'x12.control.00501.xml' if src.icvn == '00501' else 'x12.control.00401.xml'
+        logger.debug('X12 control file: %s' % (map_file))
+        #XXX Generate TA1 if needed.
+
+        html = None
+        if html_writer is not None:
+            html = html_writer(errh, src.get_term())
+            html.header()
+        elif fd_html:
+            html = pyx12.error_html.error_html(errh, fd_html, src.get_term())
+            html.header()
+        xmldoc = None
+        if fd_xmldoc:
+            xmldoc = pyx12.x12xml_simple.x12xml_simple(fd_xmldoc, param.get('simple_dtd'))
+
+        proc = _SegmentProcessor(param, map_path, map_file, errh, html, xmldoc,
+                                 callback, jobs, fd_997 if stream_ack else None)
+        try:
+            for seg in src:
+                proc.process(seg, src)
+            proc.finish(src)
+        finally:
+            proc.shutdown()
+
+        src.cleanup()  # Catch any skipped loop trailers
+        errh.handle_errors(src.pop_errors())
+        if stream_ack:
+            errh.finish_ack()
+        fic = proc.fic
+        vriic = proc.vriic
+        valid = proc.valid
+
+        if html is not None:
+            html.footer()
+            del html
+
+        if fd_xmldoc:
+            del xmldoc
+
+        #visit_debug = pyx12.error_debug.error_debug_visitor(sys.stdout)
+        #errh.accept(visit_debug)
+
+        #If this transaction is not a 997/999, generate one.
+        if fd_997 and fic != 'FA' and not stream_ack:
+            if vriic and vriic[:6] == '004010':
+                try:
+                    visit_997 = pyx12.error_997.error_997_visitor(fd_997, src.get_term())
+                    errh.accept(visit_997)
+                    del visit_997
+                except Exception:
+                    logger.exception('Failed to create 997 response')
+            if vriic and vriic[:6] == '005010':
+                try:
+                    visit_999 = pyx12.error_999.error_999_visitor(fd_997, src.get_term())
+                    errh.accept(visit_999)
+                    del visit_999
+                except Exception:
+                    logger.exception('Failed to create 999 response')
+        del proc
+    finally:
+        src.close()
     try:
         if not valid or errh.get_error_count() > 0:
             return False
@@ -31,9 +31,7 @@ def convert(filename, fd_out):
     logger = logging.getLogger('pyx12')
     wr = pyx12.x12file.X12Writer(fd_out, '~', '*', ':', '\n', '^')
     doc = et.parse(filename)
-    for node in doc.iter():
-        if node.tag == 'seg':
-            wr.Write(get_segment(node))
+    wr.write_many(get_segment(node) for node in doc.iter() if node.tag == 'seg')
     return True
 
 